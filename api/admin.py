@@ -1,8 +1,14 @@
 # api/admin.py
 
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import HttpResponseRedirect
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 from .models import (
     UserProfile,
@@ -11,9 +17,71 @@ from .models import (
     ProductType,
     InventoryItem,
     ProductRequest,
-    USER_ROLE_CHOICES
+    ProductRequestStatusLog,
+    PickupSlot,
+    Donation,
+    DonorTotal,
+    AuditEvent,
+    LowStockAlert,
+    Task,
+    USER_ROLE_CHOICES,
+    VersionConflict,
 )
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for very large tables. On PostgreSQL an unfiltered changelist
+    uses the planner's row estimate (pg_class.reltuples) instead of a
+    COUNT(*) that reads the whole table; filtered lists, tables below
+    `estimate_threshold` rows and other databases are counted exactly.
+    """
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = self.estimated_count()
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return super().count
+
+    def estimated_count(self):
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [self.object_list.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 (or 0) until the table has been analyzed.
+        return row[0] if row and row[0] > 0 else None
+
+
+class VersionConflictAdminMixin:
+    """
+    Turns a VersionConflict from a save (the row changed meanwhile, or
+    fulfilling a request needs more stock than its center has) into an
+    error message on the same page instead of a 500. The exception leaves
+    the admin's transaction, so nothing from that save is kept or logged.
+    """
+
+    def _refusing_conflicts(self, view, request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except VersionConflict as e:
+            self.message_user(request, f"Not saved: {e}", messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+    def changeform_view(self, request, *args, **kwargs):
+        return self._refusing_conflicts(super().changeform_view, request, *args, **kwargs)
+
+    def changelist_view(self, request, *args, **kwargs):
+        return self._refusing_conflicts(super().changelist_view, request, *args, **kwargs)
+
+
 # --- Customize User Admin to include UserProfile inline ---
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
@@ -28,6 +96,7 @@ class CustomUserAdmin(BaseUserAdmin):
     inlines = (UserProfileInline,)
     list_display = BaseUserAdmin.list_display + ('get_profile_role', 'is_org_admin_display', 'is_center_admin_display')
     list_filter = BaseUserAdmin.list_filter + ('profile__role',)
+    list_select_related = ('profile', 'profile__managed_organization', 'profile__managed_distribution_center')
 
     def get_formsets_with_inlines(self, request, obj=None):
         for inline in self.get_inline_instances(request, obj):
@@ -63,37 +132,43 @@ admin.site.register(User, CustomUserAdmin)
 # --- Register other models (Keep existing) ---
 @admin.register(Organization)
 class OrganizationAdmin(admin.ModelAdmin):
-    list_display = ('name', 'location', 'admin_profile', 'is_verified', 'created_at')
+    list_display = ('name', 'location', 'admin_profile', 'is_verified', 'open_request_count', 'created_at')
     list_filter = ('is_verified', 'location')
     search_fields = ('name', 'location', 'contact_person', 'admin_profile__user__username')
+    list_select_related = ('admin_profile__user',)
     raw_id_fields = ('admin_profile',)
 
 @admin.register(DistributionCenter)
 class DistributionCenterAdmin(admin.ModelAdmin):
-    list_display = ('name', 'location', 'admin_profile', 'contact_phone', 'operating_hours', 'created_at')
+    list_display = ('name', 'location', 'admin_profile', 'contact_phone', 'operating_hours', 'pending_request_count', 'created_at')
     search_fields = ('name', 'location', 'admin_profile__user__username')
+    list_select_related = ('admin_profile__user',)
     raw_id_fields = ('admin_profile',)
 
 @admin.register(ProductType)
 class ProductTypeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description')
+    list_display = ('name', 'description', 'open_demand_quantity')
     search_fields = ('name',)
 
 @admin.register(InventoryItem)
-class InventoryItemAdmin(admin.ModelAdmin):
-    list_display = ('distribution_center', 'product_type', 'quantity', 'last_updated')
+class InventoryItemAdmin(VersionConflictAdminMixin, admin.ModelAdmin):
+    list_display = ('distribution_center', 'product_type', 'quantity', 'reorder_threshold', 'last_updated')
     list_filter = ('distribution_center', 'product_type')
     search_fields = ('distribution_center__name', 'product_type__name')
-    list_editable = ('quantity',)
+    list_editable = ('quantity', 'reorder_threshold')
+    list_select_related = ('distribution_center', 'product_type')
     raw_id_fields = ('distribution_center', 'product_type')
 
 @admin.register(ProductRequest)
-class ProductRequestAdmin(admin.ModelAdmin):
-    list_display = ('id', 'get_requester', 'product_type', 'quantity', 'status', 'assigned_distribution_center', 'created_at')
-    list_filter = ('status', 'created_at', 'assigned_distribution_center', 'product_type')
-    search_fields = ('requesting_organization__name', 'requester_user__username', 'requester_phone_number', 'product_type__name', 'assigned_distribution_center__name')
-    readonly_fields = ('created_at', 'updated_at')
-    raw_id_fields = ('requesting_organization', 'requester_user', 'assigned_distribution_center', 'product_type')
+class ProductRequestAdmin(VersionConflictAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'get_requester', 'product_type', 'quantity', 'status', 'assigned_distribution_center', 'suspected_duplicate', 'created_at')
+    list_filter = ('status', 'suspected_duplicate', 'created_at', 'assigned_distribution_center', 'product_type')
+    search_fields = ('=pickup_code', 'requesting_organization__name', 'requester_user__username', 'requester_phone_number', 'product_type__name', 'assigned_distribution_center__name')
+    readonly_fields = ('created_at', 'updated_at', 'pickup_code')
+    raw_id_fields = ('requesting_organization', 'requester_user', 'assigned_distribution_center', 'product_type', 'pickup_slot')
+    list_select_related = ('requesting_organization', 'requester_user__profile', 'product_type', 'assigned_distribution_center')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Skips a second COUNT(*) over the whole table when filtering
 
     @admin.display(description='Requester')
     def get_requester(self, obj):
@@ -108,4 +183,101 @@ class ProductRequestAdmin(admin.ModelAdmin):
                  return f"User (No Profile): {obj.requester_user.username}"
         elif obj.requester_phone_number:
             return f"SMS: {obj.requester_phone_number}"
-        return "Unknown"
\ No newline at end of file
+        return "Unknown"
+
+@admin.register(ProductRequestStatusLog)
+class ProductRequestStatusLogAdmin(admin.ModelAdmin):
+    list_display = ('product_request_id', 'from_status', 'to_status', 'changed_by', 'changed_at')
+    list_filter = ('to_status', 'changed_at')
+    list_select_related = ('changed_by',)
+    raw_id_fields = ('product_request', 'changed_by')
+
+    def has_add_permission(self, request):
+        return False  # Written by the app
+
+    def has_change_permission(self, request, obj=None):
+        return False  # Append-only history
+
+    def has_delete_permission(self, request, obj=None):
+        return False  # Retention goes through `manage.py archive_audit_events`
+
+@admin.register(PickupSlot)
+class PickupSlotAdmin(admin.ModelAdmin):
+    list_display = ('distribution_center', 'starts_at', 'ends_at', 'booked', 'capacity')
+    list_filter = ('distribution_center',)
+    date_hierarchy = 'starts_at'
+    list_select_related = ('distribution_center',)
+    readonly_fields = ('booked',)  # Kept by bookings; edit capacity instead
+
+@admin.register(Donation)
+class DonationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'donor', 'product_type', 'quantity', 'distribution_center', 'status', 'pledged_at', 'received_at')
+    list_filter = ('status', 'pledged_at', 'distribution_center', 'product_type')
+    search_fields = ('donor__username', 'note')
+    list_select_related = ('donor', 'product_type', 'distribution_center')
+    raw_id_fields = ('donor', 'product_type', 'distribution_center', 'received_by')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_readonly_fields(self, request, obj=None):
+        # Status, quantities and places move inventory and donor totals; change them
+        # through /api/donations/transition/ instead.
+        if obj is None:
+            return ()
+        return ('donor', 'product_type', 'distribution_center', 'quantity', 'status', 'pledged_at', 'received_at', 'received_by')
+
+    def has_add_permission(self, request):
+        return False  # Pledges go through /api/donations/, which keeps donor totals current
+
+@admin.register(DonorTotal)
+class DonorTotalAdmin(admin.ModelAdmin):
+    list_display = ('donor', 'product_type', 'pledge_count', 'pledged_quantity', 'received_quantity', 'last_pledged_at')
+    list_select_related = ('donor', 'product_type')
+    search_fields = ('donor__username',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False  # Maintained by api/donations.py
+
+@admin.register(AuditEvent)
+class AuditEventAdmin(admin.ModelAdmin):
+    list_display = ('occurred_at', 'entity_type', 'entity_id', 'action', 'actor')
+    list_filter = ('entity_type', 'action')
+    search_fields = ('entity_id',)
+    list_select_related = ('actor',)
+    raw_id_fields = ('actor',)
+
+    def has_add_permission(self, request):
+        return False  # Written by the app
+
+    def has_change_permission(self, request, obj=None):
+        return False  # Append-only history
+
+    def has_delete_permission(self, request, obj=None):
+        return False  # Retention goes through `manage.py archive_audit_events`
+
+@admin.register(LowStockAlert)
+class LowStockAlertAdmin(admin.ModelAdmin):
+    list_display = ('inventory_item_id', 'distribution_center', 'quantity', 'reorder_threshold', 'raised_at', 'resolved_at')
+    list_filter = (('resolved_at', admin.EmptyFieldListFilter), 'distribution_center')
+    list_select_related = ('distribution_center',)
+    raw_id_fields = ('inventory_item', 'distribution_center')
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'priority', 'run_at', 'attempts', 'max_attempts', 'locked_by', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'key')
+    readonly_fields = ('attempts', 'locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at')
+    actions = ['retry_now']
+
+    @admin.action(description='Run selected failed tasks again now')
+    def retry_now(self, request, queryset):
+        # Skip tasks whose key is already queued again (periodic jobs queue their next run).
+        active_keys = Task.objects.filter(status__in=['Queued', 'Running']).exclude(key='').values('key')
+        retried = queryset.filter(status='Failed').filter(Q(key='') | ~Q(key__in=active_keys)).update(
+            status='Queued', attempts=0, run_at=timezone.now(), finished_at=None,
+        )
+        self.message_user(request, f"{retried} tasks queued again.")
@@ -0,0 +1,75 @@
+# api/alerts.py
+"""
+Incremental low-stock alerting.
+
+An item's alert state is only re-evaluated when its quantity or reorder
+threshold changes -- from InventoryItem.save(), or from
+refresh_low_stock_alerts() after queryset updates -- never by scanning the
+inventory table. Open LowStockAlert rows are the materialized low-stock set;
+the partial unique constraint keeps at most one open alert per item, so
+repeated drops below the threshold don't duplicate it.
+"""
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import InventoryItem, LowStockAlert
+
+
+def _was_low(quantity, threshold):
+    return quantity is not None and bool(threshold) and quantity <= threshold
+
+
+def sync_low_stock_alert(item, previous_quantity=None, previous_threshold=None):
+    """Open or resolve the alert for one item whose quantity/threshold just changed."""
+    was_low = _was_low(previous_quantity, previous_threshold)
+    is_low = item.is_low_stock()
+    if is_low and not was_low:
+        LowStockAlert.objects.bulk_create([
+            LowStockAlert(
+                inventory_item=item,
+                distribution_center_id=item.distribution_center_id,
+                quantity=item.quantity,
+                reorder_threshold=item.reorder_threshold,
+            )
+        ], ignore_conflicts=True)
+    elif was_low and not is_low:
+        LowStockAlert.objects.filter(inventory_item=item, resolved_at__isnull=True).update(resolved_at=timezone.now())
+
+
+def refresh_low_stock_alerts(item_ids):
+    """
+    Re-evaluate alerts for items changed by queryset .update() or bulk_update(),
+    which bypass save(). Two SELECTs plus at most one INSERT and one UPDATE.
+    """
+    item_ids = list(item_ids)
+    if not item_ids:
+        return
+    low_items = {
+        row['id']: row
+        for row in InventoryItem.objects.filter(
+            pk__in=item_ids, reorder_threshold__gt=0, quantity__lte=F('reorder_threshold')
+        ).values('id', 'distribution_center_id', 'quantity', 'reorder_threshold')
+    }
+    open_ids = set(
+        LowStockAlert.objects.filter(inventory_item_id__in=item_ids, resolved_at__isnull=True)
+        .values_list('inventory_item_id', flat=True)
+    )
+
+    to_open = [row for pk, row in low_items.items() if pk not in open_ids]
+    if to_open:
+        LowStockAlert.objects.bulk_create([
+            LowStockAlert(
+                inventory_item_id=row['id'],
+                distribution_center_id=row['distribution_center_id'],
+                quantity=row['quantity'],
+                reorder_threshold=row['reorder_threshold'],
+            )
+            for row in to_open
+        ], ignore_conflicts=True)
+
+    to_resolve = open_ids - low_items.keys()
+    if to_resolve:
+        LowStockAlert.objects.filter(
+            inventory_item_id__in=to_resolve, resolved_at__isnull=True
+        ).update(resolved_at=timezone.now())
@@ -0,0 +1,334 @@
+# api/allocation.py
+"""
+Fair-share allocation of scarce stock to pending product requests.
+
+For every product type, the stock still available at each center (quantity
+on hand minus what is already promised to assigned Pending / Ready requests)
+is shared among the unassigned Pending requests for it:
+
+* 'max_min'      weighted max-min fairness (water-filling): every request gets
+                 min(quantity, weight * level), with one level per product
+                 type chosen so its stock is used up. Small requests are
+                 served in full before large ones get more.
+* 'proportional' every request gets the same weighted share of what it asked
+                 for, min(quantity, weight * quantity * level).
+
+Requests from individuals (web users and SMS numbers) and from organizations
+are weighted by ALLOCATION_WEIGHTS, so individuals can be favoured.
+
+Each request is then served by a single center: requests and center stock
+are laid end to end per product type and matched by their offsets. A request
+that would straddle two centers goes to the one holding more of it, trimmed;
+the stock this frees is shared out again in further passes, and finally
+topped up among the requests already served at that center.
+
+All of it runs on NumPy arrays over every product type at once. The result
+is an AllocationPlan, which apply_plan() writes in one transaction.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import AuditEvent, InventoryItem, ProductRequest, VersionConflict
+
+ALLOCATION_MODES = ('max_min', 'proportional')
+# Statuses whose assigned quantity is already promised out of a center's stock.
+COMMITTED_STATUSES = ('Pending', 'Ready')
+MAX_PASSES = 4
+UPDATE_BATCH_SIZE = 1000
+
+
+def fair_shares(quantities, weights, groups, supply):
+    """
+    Integer weighted max-min allocation, solved for all groups at once.
+
+    `quantities`, `weights` and `groups` (0..G-1) have one entry per request,
+    `supply` one per group. Returns the units per request. A group's units go
+    to min(supply, demand); units lost to rounding go to the requests with the
+    largest fractional shares, earliest in the input first on ties.
+    """
+    n, group_count = len(quantities), len(supply)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    q = quantities.astype(float)
+    w = weights.astype(float)
+    supply = supply.astype(float)
+
+    # A request is served in full once the level reaches q / w; walk each
+    # group in that order to find which requests the supply covers in full.
+    order = np.lexsort((q / w, groups))
+    g, qs, ws = groups[order], q[order], w[order]
+    first = np.searchsorted(g, g)
+    cum_q, cum_w = np.cumsum(qs), np.cumsum(ws)
+    q_through = cum_q - (cum_q[first] - qs[first])
+    w_through = cum_w - (cum_w[first] - ws[first])
+    w_total = np.bincount(g, ws, minlength=group_count)[g]
+    # Units handed out if the level stopped exactly where this request is full.
+    used = q_through + (qs / ws) * (w_total - w_through)
+    full = used <= supply[g]
+
+    full_q = np.bincount(g[full], qs[full], minlength=group_count)
+    open_w = np.bincount(g[~full], ws[~full], minlength=group_count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        level = np.where(open_w > 0, (supply - full_q) / open_w, 0.0)
+    share = np.minimum(np.where(full, qs, ws * level[g]), qs)
+
+    units = np.floor(share)
+    target = np.minimum(supply, np.bincount(g, qs, minlength=group_count))
+    leftover = np.round(target - np.bincount(g, units, minlength=group_count)).astype(np.int64)
+    # Rank each group's requests by fractional share (ties: input order) and
+    # give one unit to the first `leftover` of them.
+    ranked = np.lexsort((order, units - share, g))
+    ranked_groups = g[ranked]
+    rank = np.arange(n) - np.searchsorted(ranked_groups, ranked_groups)
+    bonus = ranked[rank < leftover[ranked_groups]]
+    units[bonus] += 1
+    units = np.minimum(units, qs)
+
+    result = np.empty(n, dtype=np.int64)
+    result[order] = units
+    return result
+
+
+def match_centers(units, groups, center_groups, stock):
+    """
+    Pick one center per request. Returns (center index or -1, units served).
+
+    Per group, center stock and the requests' units are laid out on the same
+    line in order; a request is served by the center holding most of its
+    units, and trimmed to what it has there.
+    """
+    group_count = int(max(groups.max(initial=-1), center_groups.max(initial=-1))) + 1
+    center_order = np.argsort(center_groups, kind='stable')
+    center_end = np.cumsum(stock[center_order])
+    group_start = np.concatenate(([0], np.cumsum(np.bincount(center_groups, stock, minlength=group_count))))[:-1]
+
+    request_order = np.argsort(groups, kind='stable')
+    u, g = units[request_order], groups[request_order]
+    cum = np.cumsum(u)
+    first = np.searchsorted(g, g)
+    start = group_start[g] + (cum - u) - (cum[first] - u[first])
+
+    centers = np.full(len(units), -1, dtype=np.int64)
+    served = np.zeros(len(units), dtype=np.int64)
+    wanted = u > 0
+    u, start = u[wanted], start[wanted]
+    slot = np.searchsorted(center_end, start, side='right')
+    in_first = np.minimum(u, center_end[slot] - start)
+    # A request straddling two centers goes to the one holding more of it.
+    next_slot = np.minimum(slot + 1, len(center_end) - 1)
+    in_next = np.where(in_first < u, np.minimum(u - in_first, center_end[next_slot] - center_end[slot]), 0)
+    use_next = in_next > in_first
+    centers[request_order[wanted]] = center_order[np.where(use_next, next_slot, slot)]
+    served[request_order[wanted]] = np.where(use_next, in_next, in_first)
+    return centers, served
+
+
+def allocate(quantities, weights, groups, center_groups, stock, mode='max_min'):
+    """
+    Allocate `stock` (one entry per center x group) to requests. Returns
+    (center index or -1, units) per request; units never exceed a center's stock.
+    """
+    if mode not in ALLOCATION_MODES:
+        raise ValueError(f"Unknown allocation mode '{mode}'.")
+    group_count = int(max(groups.max(initial=-1), center_groups.max(initial=-1))) + 1
+    centers = np.full(len(quantities), -1, dtype=np.int64)
+    units = np.zeros(len(quantities), dtype=np.int64)
+    remaining = stock.astype(np.int64).copy()
+    # Proportional shares are water-filling with the weights scaled by quantity.
+    share_weights = weights * quantities if mode == 'proportional' else weights
+
+    for _ in range(MAX_PASSES):
+        # Each pass shares what is left among the requests still unserved.
+        pending = np.flatnonzero(centers < 0)
+        supply = np.bincount(center_groups, remaining, minlength=group_count)
+        if len(pending) == 0 or not supply.any():
+            break
+        shares = fair_shares(quantities[pending], share_weights[pending], groups[pending], supply)
+        if not shares.any():
+            break
+        matched, served = match_centers(shares, groups[pending], center_groups, remaining)
+        assigned = served > 0
+        centers[pending[assigned]] = matched[assigned]
+        units[pending[assigned]] = served[assigned]
+        np.subtract.at(remaining, matched[assigned], served[assigned])
+
+    # Stock stranded at a center by trimming is shared, the same way, among
+    # the requests already served there that still want more.
+    topping_up = np.flatnonzero((centers >= 0) & (units < quantities))
+    if len(topping_up) and remaining.any():
+        extra = fair_shares(
+            quantities[topping_up] - units[topping_up], share_weights[topping_up], centers[topping_up], remaining
+        )
+        units[topping_up] += extra
+    return centers, units
+
+
+class AllocationPlan:
+    """
+    Proposed assignments: parallel arrays of request id, center id and units,
+    plus each request's (organization id, user id) for its live event scopes.
+    """
+
+    def __init__(self, mode, request_ids, center_ids, quantities, requesters, summary):
+        self.mode = mode
+        self.request_ids = request_ids
+        self.center_ids = center_ids
+        self.quantities = quantities
+        self.requesters = requesters
+        self.summary = summary
+
+    def __len__(self):
+        return len(self.request_ids)
+
+    def assignments(self):
+        return [
+            {'product_request': int(request_id), 'distribution_center': int(center_id), 'quantity': int(quantity)}
+            for request_id, center_id, quantity in zip(self.request_ids, self.center_ids, self.quantities)
+        ]
+
+
+def _available_stock(product_type_ids):
+    items = InventoryItem.objects.filter(quantity__gt=0)
+    committed = ProductRequest.objects.filter(status__in=COMMITTED_STATUSES, assigned_distribution_center__isnull=False)
+    if product_type_ids is not None:
+        items = items.filter(product_type__in=product_type_ids)
+        committed = committed.filter(product_type__in=product_type_ids)
+
+    available = {
+        (center_id, product_id): quantity
+        for center_id, product_id, quantity in items.values_list('distribution_center_id', 'product_type_id', 'quantity')
+    }
+    promised = (
+        committed.order_by()
+        .values('assigned_distribution_center_id', 'product_type_id')
+        .annotate(total=Sum(Coalesce('allocated_quantity', 'quantity')))
+        .values_list('assigned_distribution_center_id', 'product_type_id', 'total')
+    )
+    for center_id, product_id, total in promised:
+        key = (center_id, product_id)
+        if key in available:
+            available[key] = max(available[key] - total, 0)
+    return available
+
+
+def build_plan(product_type_ids=None, mode=None):
+    """Allocation plan for the unassigned Pending requests (optionally of some product types)."""
+    mode = mode or settings.ALLOCATION_MODE
+    requests = ProductRequest.objects.filter(
+        status='Pending', assigned_distribution_center__isnull=True, quantity__gt=0
+    )
+    if product_type_ids is not None:
+        requests = requests.filter(product_type__in=product_type_ids)
+    rows = list(requests.order_by('id').values_list(
+        'id', 'product_type_id', 'quantity', 'requesting_organization_id', 'requester_user_id'
+    ))
+    available = {key: quantity for key, quantity in _available_stock(product_type_ids).items() if quantity > 0}
+
+    if rows:
+        request_ids, request_products, quantities, organization_ids, user_ids = zip(*rows)
+        request_ids, request_products, quantities = np.array(request_ids), np.array(request_products), np.array(quantities)
+        requesters = np.empty(len(rows), dtype=object)
+        requesters[:] = list(zip(organization_ids, user_ids))
+        is_organization = np.array([org_id is not None for org_id in organization_ids], dtype=bool)
+    else:
+        request_ids = request_products = quantities = np.zeros(0, dtype=np.int64)
+        requesters = np.empty(0, dtype=object)
+        is_organization = np.zeros(0, dtype=bool)
+    if available:
+        (center_ids, center_products), stock = zip(*available.keys()), list(available.values())
+        center_ids, center_products, stock = np.array(center_ids), np.array(center_products), np.array(stock)
+    else:
+        center_ids = center_products = stock = np.zeros(0, dtype=np.int64)
+
+    products, groups = np.unique(np.concatenate((request_products, center_products)), return_inverse=True)
+    groups = groups.astype(np.int64)
+    request_groups, center_groups = groups[:len(request_ids)], groups[len(request_ids):]
+    weights = np.where(
+        is_organization, settings.ALLOCATION_WEIGHTS['organization'], settings.ALLOCATION_WEIGHTS['individual']
+    ).astype(float)
+
+    centers, units = allocate(quantities, weights, request_groups, center_groups, stock, mode)
+    served = units > 0
+
+    group_count = len(products)
+    demand = np.bincount(request_groups, quantities, minlength=group_count)
+    supply = np.bincount(center_groups, stock, minlength=group_count)
+    allocated = np.bincount(request_groups, units, minlength=group_count)
+    request_counts = np.bincount(request_groups, minlength=group_count)
+    served_counts = np.bincount(request_groups[served], minlength=group_count)
+    full_counts = np.bincount(request_groups[served & (units == quantities)], minlength=group_count)
+    summary = [
+        {
+            'product_type': int(products[i]),
+            'demand': int(demand[i]),
+            'available': int(supply[i]),
+            'allocated': int(allocated[i]),
+            'requests': int(request_counts[i]),
+            'requests_served': int(served_counts[i]),
+            'requests_served_in_full': int(full_counts[i]),
+        }
+        for i in range(group_count)
+    ]
+    return AllocationPlan(
+        mode, request_ids[served], center_ids[centers[served]], units[served], requesters[served], summary
+    )
+
+
+def apply_plan(plan, changed_by=None):
+    """
+    Assign every request in `plan` to its center, with its allocated quantity,
+    in one transaction. Raises VersionConflict (and changes nothing) if any of
+    them was assigned, changed status or was deleted since the plan was built.
+    """
+    from .audit import record_event
+    from .counters import CounterDeltas
+    from .events import publish_on_commit, request_scopes
+
+    by_assignment = defaultdict(list)
+    for request_id, center_id, quantity in zip(plan.request_ids.tolist(), plan.center_ids.tolist(), plan.quantities.tolist()):
+        by_assignment[(center_id, quantity)].append(request_id)
+
+    now = timezone.now()
+    with transaction.atomic():
+        # One UPDATE per (center, quantity) pair and batch of ids, each only
+        # matching rows still unassigned and Pending.
+        for (center_id, quantity), ids in by_assignment.items():
+            for i in range(0, len(ids), UPDATE_BATCH_SIZE):
+                batch = ids[i:i + UPDATE_BATCH_SIZE]
+                updated = ProductRequest.objects.filter(
+                    pk__in=batch, status='Pending', assigned_distribution_center__isnull=True
+                ).update(
+                    assigned_distribution_center_id=center_id, allocated_quantity=quantity,
+                    updated_at=now, version=F('version') + 1,
+                )
+                if updated != len(batch):
+                    raise VersionConflict("Some requests changed while the allocation was being applied.")
+
+        # Only the center changes, so only its pending count moves.
+        counts = CounterDeltas()
+        for center_id in plan.center_ids.tolist():
+            counts.add(('Pending', None, center_id, None, 0))
+        counts.apply()
+
+        # .update() sends no post_save, so record the audit and live events here.
+        for request_id, center_id, quantity, (org_id, user_id) in zip(
+            plan.request_ids.tolist(), plan.center_ids.tolist(), plan.quantities.tolist(), plan.requesters
+        ):
+            record_event(
+                ProductRequest, request_id, AuditEvent.ACTION_UPDATE,
+                {'assigned_distribution_center_id': [None, center_id], 'allocated_quantity': [None, quantity]},
+                actor=changed_by, occurred_at=now,
+            )
+            publish_on_commit(
+                'product_request', request_id, 'update', request_scopes(org_id, user_id, center_id),
+                {'assigned_distribution_center': center_id, 'allocated_quantity': quantity, 'updated_at': now.isoformat()},
+            )
+    return len(plan)
+
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Connect the audit log, request counter, duplicate index, live event and user details cache signal receivers,
+        # and register the background tasks.
+        from . import audit, counters, duplicates, events, tasks, user_details  # noqa: F401
@@ -0,0 +1,109 @@
+# api/audit.py
+"""
+Audit event capture for requests, inventory, organizations and centers.
+
+Model signals queue AuditEvent rows on the current database connection and
+write them with one bulk_create once the surrounding transaction commits, so
+a request that touches many rows pays for a single INSERT and rolled-back
+changes are never logged. Outside a transaction the event is written
+immediately, as Django runs on_commit callbacks straight away there.
+"""
+
+from contextvars import ContextVar
+
+from django.db import connections, router, transaction
+from django.db.models.signals import post_save, post_delete
+
+from .models import (
+    AuditEvent,
+    Organization,
+    DistributionCenter,
+    InventoryItem,
+    ProductRequest,
+)
+
+AUDITED_MODELS = (Organization, DistributionCenter, InventoryItem, ProductRequest)
+
+# Set by AuditContextMiddleware so events can be attributed to the user
+# making the request. Read lazily: DRF only authenticates inside the view.
+current_request = ContextVar('current_request', default=None)
+
+
+def get_current_actor():
+    request = current_request.get()
+    user = getattr(request, 'user', None) if request is not None else None
+    if user is not None and user.is_authenticated:
+        return user
+    return None
+
+
+class _EventBatch:
+    """Events queued in one transaction; called by Django after it commits."""
+
+    def __init__(self, using):
+        self.using = using
+        self.events = []
+
+    def __call__(self):
+        AuditEvent.objects.using(self.using).bulk_create(self.events, batch_size=500)
+
+
+def record_event(model, entity_id, action, changes=None, actor=None, occurred_at=None):
+    """Queue an AuditEvent to be written when the current transaction commits."""
+    event = AuditEvent(
+        entity_type=model._meta.model_name,
+        entity_id=entity_id,
+        action=action,
+        changes=changes or {},
+        actor=actor if actor is not None else get_current_actor(),
+    )
+    if occurred_at is not None:
+        event.occurred_at = occurred_at
+
+    using = router.db_for_write(AuditEvent)
+    connection = connections[using]
+    batch = getattr(connection, '_audit_batch', None)
+    # Reuse the open batch only while its on_commit callback is still
+    # registered; a rollback discards the callback along with its events.
+    if connection.in_atomic_block and batch is not None and any(
+        callback is batch for _, callback, _ in connection.run_on_commit
+    ):
+        batch.events.append(event)
+        return
+
+    batch = _EventBatch(using)
+    batch.events.append(event)
+    connection._audit_batch = batch
+    transaction.on_commit(batch, using=using)
+
+
+def _current_values(instance):
+    return {field: getattr(instance, field) for field in instance.audit_fields}
+
+
+def audit_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    values = _current_values(instance)
+    if created:
+        record_event(sender, instance.pk, AuditEvent.ACTION_CREATE, values)
+    else:
+        snapshot = getattr(instance, '_audit_snapshot', {})
+        changes = {
+            field: [snapshot[field], value]
+            for field, value in values.items()
+            if field in snapshot and snapshot[field] != value
+        }
+        action = AuditEvent.ACTION_STATUS_CHANGE if 'status' in changes else AuditEvent.ACTION_UPDATE
+        record_event(sender, instance.pk, action, changes)
+    instance._audit_snapshot = values
+
+
+def audit_deleted(sender, instance, **kwargs):
+    record_event(sender, instance.pk, AuditEvent.ACTION_DELETE, _current_values(instance))
+
+
+for _model in AUDITED_MODELS:
+    post_save.connect(audit_saved, sender=_model, dispatch_uid=f'audit_saved_{_model._meta.model_name}')
+    post_delete.connect(audit_deleted, sender=_model, dispatch_uid=f'audit_deleted_{_model._meta.model_name}')
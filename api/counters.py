@@ -0,0 +1,162 @@
+# api/counters.py
+"""
+Denormalized request counters for the dashboards.
+
+* Organization.open_request_count      Pending and Ready requests it made
+* DistributionCenter.pending_request_count  Pending requests assigned to it
+* ProductType.open_demand_quantity     units asked for by Pending and Ready requests
+
+A request's contribution follows from its (status, organization, center,
+product type, quantity). Every write path works out the difference between
+the old and new contributions and applies it with
+`UPDATE ... SET n = n + CASE id WHEN ... END` in the same transaction:
+ProductRequest.save(), ProductRequest.bulk_transition(), allocation,
+pickup redemption and the delete receivers below (deletes, including
+cascades, run inside Django's delete transaction). Each works from the
+row as locked or version-checked by its own UPDATE, never from a possibly
+stale copy, so concurrent writers can't count the same change twice.
+
+The `recount` management command compares the counters with the requests
+and repairs any drift, one locked chunk at a time.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.db.models.signals import post_delete, pre_delete
+
+from .models import DistributionCenter, Organization, ProductRequest, ProductType
+
+OPEN_STATUSES = ('Pending', 'Ready')
+# Rows per CASE ... UPDATE, keeping the statement's parameter count modest.
+UPDATE_BATCH_SIZE = 500
+
+# model -> (counter field, ProductRequest foreign key, request filter, aggregate)
+COUNTERS = {
+    Organization: ('open_request_count', 'requesting_organization', Q(status__in=OPEN_STATUSES), Count('pk')),
+    DistributionCenter: ('pending_request_count', 'assigned_distribution_center', Q(status='Pending'), Count('pk')),
+    ProductType: ('open_demand_quantity', 'product_type', Q(status__in=OPEN_STATUSES), Sum('quantity')),
+}
+STATE_FIELDS = (
+    'status', 'requesting_organization_id', 'assigned_distribution_center_id', 'product_type_id', 'quantity',
+)
+
+
+def in_batches(mapping, size=UPDATE_BATCH_SIZE):
+    items = list(mapping.items())
+    for i in range(0, len(items), size):
+        yield dict(items[i:i + size])
+
+
+def increment(field, deltas):
+    """F(field) + CASE pk WHEN ... THEN delta END, for an UPDATE over deltas' keys."""
+    return F(field) + Case(
+        *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+        default=Value(0), output_field=IntegerField(),
+    )
+
+
+class CounterDeltas:
+    """Pending counter changes: model -> Counter(pk -> delta). False when there are none."""
+
+    def __init__(self):
+        self.deltas = defaultdict(Counter)
+
+    def add(self, state, sign=1):
+        """Count (sign=1) or uncount (sign=-1) a request in `state`, a STATE_FIELDS tuple."""
+        if state is None:
+            return
+        status, organization_id, center_id, product_type_id, quantity = state
+        if status in OPEN_STATUSES:
+            if organization_id is not None:
+                self.deltas[Organization][organization_id] += sign
+            if product_type_id is not None:
+                self.deltas[ProductType][product_type_id] += sign * quantity
+        if status == 'Pending' and center_id is not None:
+            self.deltas[DistributionCenter][center_id] += sign
+
+    def __bool__(self):
+        return any(any(counts.values()) for counts in self.deltas.values())
+
+    def apply(self):
+        """Write the changes: one UPDATE per model (and batch of rows), in a fixed model order."""
+        for model in COUNTERS:
+            field = COUNTERS[model][0]
+            changed = {pk: delta for pk, delta in sorted(self.deltas.get(model, {}).items()) if delta}
+            for batch in in_batches(changed):
+                model.objects.filter(pk__in=batch).update(**{field: increment(field, batch)})
+        self.deltas.clear()
+
+
+def request_state(instance, snapshot=None):
+    """The counted state of a request, as last loaded (`snapshot`) or as it is now."""
+    if snapshot is None:
+        return tuple(getattr(instance, field) for field in STATE_FIELDS)
+    return tuple(snapshot[field] if field in snapshot else getattr(instance, field) for field in STATE_FIELDS)
+
+
+def counter_deltas(before, after):
+    """CounterDeltas taking a request from state `before` (None: new) to `after` (None: deleted)."""
+    counts = CounterDeltas()
+    if before != after:
+        counts.add(before, -1)
+        counts.add(after)
+    return counts
+
+
+def request_deleting(sender, instance, **kwargs):
+    # Collector.delete() sends pre_delete inside its transaction. The instance
+    # may be stale (delete() doesn't check the version), so count what the
+    # locked row holds now.
+    instance._counted_state = (
+        ProductRequest.objects.select_for_update().filter(pk=instance.pk).values_list(*STATE_FIELDS).first()
+    )
+
+
+def request_deleted(sender, instance, **kwargs):
+    counter_deltas(getattr(instance, '_counted_state', None), None).apply()
+
+
+def actual_counts(model, pks):
+    """{pk: value} the counter of each of `pks` should hold, computed from the requests."""
+    field, foreign_key, condition, aggregate = COUNTERS[model]
+    rows = (
+        ProductRequest.objects
+        .filter(condition, **{f'{foreign_key}__in': pks})
+        .values(foreign_key)
+        .annotate(value=aggregate)
+        .order_by()
+        .values_list(foreign_key, 'value')
+    )
+    actual = dict.fromkeys(pks, 0)
+    actual.update((pk, value or 0) for pk, value in rows)
+    return actual
+
+
+def recount_chunk(model, pks, fix=True):
+    """
+    Compare the counters of `pks` with the requests and, with `fix`, correct
+    them. Returns {pk: (stored, actual)} for the rows that had drifted.
+
+    The counter rows are locked first, so a request write that has already
+    bumped one of them is committed (and counted) before the requests are
+    read, and one that hasn't waits until the corrected value is written.
+    """
+    field = COUNTERS[model][0]
+    with transaction.atomic():
+        stored = dict(model.objects.select_for_update().filter(pk__in=pks).order_by('pk').values_list('pk', field))
+        actual = actual_counts(model, list(stored))
+        drifted = {pk: (stored[pk], actual[pk]) for pk in stored if stored[pk] != actual[pk]}
+        if fix and drifted:
+            model.objects.filter(pk__in=drifted).update(**{
+                field: Case(
+                    *[When(pk=pk, then=Value(value)) for pk, (_, value) in drifted.items()],
+                    default=F(field), output_field=IntegerField(),
+                )
+            })
+    return drifted
+
+
+pre_delete.connect(request_deleting, sender=ProductRequest, dispatch_uid='counters_request_deleting')
+post_delete.connect(request_deleted, sender=ProductRequest, dispatch_uid='counters_request_deleted')
@@ -0,0 +1,296 @@
+# api/donations.py
+"""
+The donation ledger: batched pledge ingestion, receipt and donor totals.
+
+Pledges arrive in batches (ingest_pledges) and are written with one
+bulk_create. The donor, product type and center ids in a batch are checked
+with one query per table rather than one per pledge.
+
+A pledge marked Received credits the center's inventory in the same
+transaction (credit_inventory). This uses UPDATE ... SET quantity =
+quantity + CASE ... over all the items touched, so concurrent receipts
+and stock edits add up instead of overwriting each other.
+
+DonorTotal keeps each donor's running totals per product type and is bumped
+the same way, so donor_summary() reads a few rows however long the ledger
+grows. recount_donor_totals() rebuilds them from the ledger.
+"""
+
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Q, Sum, Value, When
+from django.utils import timezone
+from django.core.exceptions import ValidationError
+
+from .counters import in_batches, increment
+from .models import (
+    AuditEvent,
+    DONATION_STATUS_TRANSITIONS,
+    DistributionCenter,
+    Donation,
+    DonorTotal,
+    InventoryItem,
+    ProductType,
+    VersionConflict,
+)
+
+User = get_user_model()
+
+INGEST_BATCH_SIZE = 500
+
+
+def bump_donor_totals(pledged=(), received=(), cancelled=()):
+    """
+    Add (donor_id, product_type_id, quantity, pledged_at) rows to the running
+    totals: new pledges, receipts and cancellations. Creates missing
+    DonorTotal rows, then applies everything with one UPDATE per batch.
+    """
+    deltas = defaultdict(lambda: {'pledge_count': 0, 'pledged_quantity': 0, 'received_quantity': 0, 'last_pledged_at': None})
+    for donor_id, product_type_id, quantity, pledged_at in pledged:
+        delta = deltas[(donor_id, product_type_id)]
+        delta['pledge_count'] += 1
+        delta['pledged_quantity'] += quantity
+        delta['last_pledged_at'] = max(filter(None, (delta['last_pledged_at'], pledged_at)))
+    for donor_id, product_type_id, quantity, _ in received:
+        deltas[(donor_id, product_type_id)]['received_quantity'] += quantity
+    for donor_id, product_type_id, quantity, _ in cancelled:
+        delta = deltas[(donor_id, product_type_id)]
+        delta['pledge_count'] -= 1
+        delta['pledged_quantity'] -= quantity
+    if not deltas:
+        return
+
+    DonorTotal.objects.bulk_create(
+        [DonorTotal(donor_id=donor_id, product_type_id=product_type_id) for donor_id, product_type_id in deltas],
+        ignore_conflicts=True,
+    )
+    donor_ids = {donor_id for donor_id, _ in deltas}
+    ids = {
+        (donor_id, product_type_id): pk
+        for pk, donor_id, product_type_id in DonorTotal.objects.filter(donor_id__in=donor_ids)
+        .values_list('pk', 'donor_id', 'product_type_id')
+        if (donor_id, product_type_id) in deltas
+    }
+    for batch in in_batches({ids[key]: delta for key, delta in deltas.items()}):
+        updates = {
+            field: increment(field, {pk: delta[field] for pk, delta in batch.items() if delta[field]})
+            for field in ('pledge_count', 'pledged_quantity', 'received_quantity')
+            if any(delta[field] for delta in batch.values())
+        }
+        latest = {pk: delta['last_pledged_at'] for pk, delta in batch.items() if delta['last_pledged_at']}
+        if latest:
+            # Pledges can be back-dated on import, so keep whichever is later.
+            updates['last_pledged_at'] = Case(
+                *[
+                    When(Q(pk=pk) & (Q(last_pledged_at__isnull=True) | Q(last_pledged_at__lt=when)), then=Value(when))
+                    for pk, when in latest.items()
+                ],
+                default=F('last_pledged_at'),
+            )
+        DonorTotal.objects.filter(pk__in=batch).update(**updates)
+
+
+def credit_inventory(credits, changed_by=None):
+    """
+    Add stock: `credits` maps (center_id, product_type_id) -> units. Creates
+    missing inventory items, then credits them with one UPDATE per batch
+    of items, bumping their version, and re-checks their low-stock alerts.
+    """
+    from .alerts import refresh_low_stock_alerts
+    from .audit import record_event
+    from .events import ALL_SCOPE, publish_on_commit
+
+    credits = {key: units for key, units in credits.items() if units}
+    if not credits:
+        return
+    center_ids = {center_id for center_id, _ in credits}
+
+    def item_ids():
+        return {
+            (center_id, product_type_id): pk
+            for pk, center_id, product_type_id in InventoryItem.objects.filter(distribution_center_id__in=center_ids)
+            .values_list('pk', 'distribution_center_id', 'product_type_id')
+            if (center_id, product_type_id) in credits
+        }
+
+    items = item_ids()
+    if len(items) < len(credits):
+        InventoryItem.objects.bulk_create(
+            [
+                InventoryItem(distribution_center_id=center_id, product_type_id=product_type_id, quantity=0)
+                for center_id, product_type_id in credits.keys() - items.keys()
+            ],
+            ignore_conflicts=True,
+        )
+        items = item_ids()
+
+    now = timezone.now()
+    by_pk = {items[key]: units for key, units in credits.items()}
+    for batch in in_batches(by_pk):
+        InventoryItem.objects.filter(pk__in=batch).update(
+            quantity=increment('quantity', batch), version=F('version') + 1, last_updated=now,
+        )
+    refresh_low_stock_alerts(by_pk)
+
+    # .update() sends no post_save, so record the audit and live events here.
+    for pk, center_id, product_type_id, quantity, version in InventoryItem.objects.filter(pk__in=by_pk).values_list(
+        'pk', 'distribution_center_id', 'product_type_id', 'quantity', 'version'
+    ):
+        record_event(
+            InventoryItem, pk, AuditEvent.ACTION_UPDATE,
+            {'quantity': [quantity - by_pk[pk], quantity]}, actor=changed_by, occurred_at=now,
+        )
+        publish_on_commit(
+            'inventory_item', pk, 'update', [ALL_SCOPE, ('center', center_id)],
+            {
+                'distribution_center': center_id, 'product_type': product_type_id,
+                'quantity': quantity, 'version': version, 'last_updated': now.isoformat(),
+            },
+        )
+
+
+def ingest_pledges(pledges):
+    """
+    Record a batch of pledges, each a dict of donor_id, product_type_id,
+    distribution_center_id, quantity and optionally note and pledged_at.
+
+    Raises ValidationError naming unknown donors, product types or centers;
+    nothing is written then. Returns the created Donation rows.
+    """
+    donor_ids = {pledge['donor_id'] for pledge in pledges}
+    product_type_ids = {pledge['product_type_id'] for pledge in pledges}
+    center_ids = {pledge['distribution_center_id'] for pledge in pledges}
+    errors = {}
+    unknown = donor_ids - set(User.objects.filter(pk__in=donor_ids).values_list('pk', flat=True))
+    if unknown:
+        errors['donor'] = f"Unknown donors: {sorted(unknown)}"
+    unknown = product_type_ids - set(ProductType.objects.filter(pk__in=product_type_ids).values_list('pk', flat=True))
+    if unknown:
+        errors['product_type'] = f"Unknown product types: {sorted(unknown)}"
+    unknown = center_ids - set(DistributionCenter.objects.filter(pk__in=center_ids).values_list('pk', flat=True))
+    if unknown:
+        errors['distribution_center'] = f"Unknown distribution centers: {sorted(unknown)}"
+    if errors:
+        raise ValidationError(errors)
+
+    now = timezone.now()
+    donations = [
+        Donation(
+            donor_id=pledge['donor_id'],
+            product_type_id=pledge['product_type_id'],
+            distribution_center_id=pledge['distribution_center_id'],
+            quantity=pledge['quantity'],
+            note=pledge.get('note', ''),
+            pledged_at=pledge.get('pledged_at') or now,
+        )
+        for pledge in pledges
+    ]
+    with transaction.atomic():
+        Donation.objects.bulk_create(donations, batch_size=INGEST_BATCH_SIZE)
+        bump_donor_totals(pledged=[
+            (donation.donor_id, donation.product_type_id, donation.quantity, donation.pledged_at)
+            for donation in donations
+        ])
+    return donations
+
+
+def transition_donations(queryset, ids, to_status, changed_by=None):
+    """
+    Move every donation in `ids` to `to_status` (Received or Cancelled), all
+    or nothing, like ProductRequest.bulk_transition(). Receiving credits the
+    centers' inventory.
+
+    Raises ValidationError for unknown ids or disallowed transitions, and
+    VersionConflict if one changed status meanwhile. Returns the sorted ids.
+    """
+    ids = set(ids)
+    rows = {
+        row[0]: row[1:]
+        for row in queryset.filter(pk__in=ids).values_list(
+            'pk', 'status', 'donor_id', 'product_type_id', 'distribution_center_id', 'quantity', 'pledged_at'
+        )
+    }
+    missing = sorted(ids - rows.keys())
+    if missing:
+        raise ValidationError({'ids': f"Donations not found: {missing}"})
+    invalid = sorted(pk for pk, row in rows.items() if to_status not in DONATION_STATUS_TRANSITIONS.get(row[0], ()))
+    if invalid:
+        raise ValidationError({'ids': f"Cannot move donations {invalid} to '{to_status}' from their current status."})
+
+    now = timezone.now()
+    changes = {'status': to_status}
+    if to_status == 'Received':
+        changes.update(received_at=now, received_by=changed_by)
+    with transaction.atomic():
+        # Every transition starts from Pledged, so one conditional UPDATE covers them all.
+        if queryset.filter(pk__in=rows, status='Pledged').update(**changes) != len(rows):
+            raise VersionConflict("Some donations changed status while being updated.")
+
+        entries = [(donor_id, product_type_id, quantity, pledged_at) for _, donor_id, product_type_id, _, quantity, pledged_at in rows.values()]
+        if to_status == 'Received':
+            credits = defaultdict(int)
+            for _, _, product_type_id, center_id, quantity, _ in rows.values():
+                credits[(center_id, product_type_id)] += quantity
+            credit_inventory(credits, changed_by=changed_by)
+            bump_donor_totals(received=entries)
+        else:
+            bump_donor_totals(cancelled=entries)
+    return sorted(rows)
+
+
+def donor_summary(donor_id):
+    """A donor's totals overall and per product type, from DonorTotal."""
+    totals = list(
+        DonorTotal.objects.filter(donor_id=donor_id)
+        .order_by('product_type__name')
+        .values(
+            'product_type_id', 'product_type__name', 'pledge_count',
+            'pledged_quantity', 'received_quantity', 'last_pledged_at',
+        )
+    )
+    return {
+        'donor': donor_id,
+        'pledge_count': sum(row['pledge_count'] for row in totals),
+        'pledged_quantity': sum(row['pledged_quantity'] for row in totals),
+        'received_quantity': sum(row['received_quantity'] for row in totals),
+        'last_pledged_at': max((row['last_pledged_at'] for row in totals if row['last_pledged_at']), default=None),
+        'by_product_type': [
+            {
+                'product_type': row['product_type_id'],
+                'product_type_name': row['product_type__name'],
+                'pledge_count': row['pledge_count'],
+                'pledged_quantity': row['pledged_quantity'],
+                'received_quantity': row['received_quantity'],
+                'last_pledged_at': row['last_pledged_at'],
+            }
+            for row in totals
+        ],
+    }
+
+
+def recount_donor_totals(donor_ids=None):
+    """Rebuild DonorTotal from the ledger, for all donors or just `donor_ids`."""
+    ledger = Donation.objects.all()
+    if donor_ids is not None:
+        ledger = ledger.filter(donor_id__in=donor_ids)
+    active = ~Q(status='Cancelled')
+    rows = (
+        ledger.values('donor_id', 'product_type_id')
+        .annotate(
+            pledge_count=Count('pk', filter=active),
+            pledged_quantity=Sum('quantity', filter=active, default=0),
+            received_quantity=Sum('quantity', filter=Q(status='Received'), default=0),
+            last_pledged_at=Max('pledged_at'),
+        )
+        .order_by()
+    )
+    totals = [DonorTotal(**row) for row in rows]
+    with transaction.atomic():
+        stale = DonorTotal.objects.all()
+        if donor_ids is not None:
+            stale = stale.filter(donor_id__in=donor_ids)
+        stale.delete()
+        DonorTotal.objects.bulk_create(totals, batch_size=INGEST_BATCH_SIZE)
+    return len(totals)
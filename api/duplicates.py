@@ -0,0 +1,295 @@
+# api/duplicates.py
+"""
+Duplicate request detection for individual and SMS requesters.
+
+A request is a suspected duplicate when the same requester (user or phone
+number) asked for the same product type and quantity within the last
+DUPLICATE_REQUEST_WINDOW_HOURS. Instead of an aggregate query on every
+create, each worker keeps an in-memory RecentRequestIndex of recent request
+fingerprints, so a check is a fixed number of hash lookups.
+
+start_index_refresh() builds the index when a worker starts (backend/wsgi.py)
+and rebuilds it on a background thread every DUPLICATE_INDEX_REFRESH_SECONDS,
+which picks up requests created by other workers; creates, cancellations and
+deletes committed by this worker are applied as they happen, including those
+made during a rebuild. With DUPLICATE_INDEX_SHARED (on when REDIS_URL is
+set), each worker also counts its creates in the shared cache, so a retry
+that lands on another worker is caught at once, not at the next rebuild.
+
+DUPLICATE_REQUEST_POLICY decides what happens to a suspected duplicate:
+'flag' saves it with suspected_duplicate=True for staff to review, 'reject'
+refuses it with 409, 'off' disables the check.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.utils import timezone
+
+from .exceptions import DuplicateRequest
+from .models import ProductRequest
+
+logger = logging.getLogger(__name__)
+
+# Cancelled requests do not count: the requester may ask again.
+INACTIVE_STATUSES = ('Cancelled',)
+
+
+def request_fingerprint(requester_user_id, requester_phone_number, product_type_id, quantity):
+    """
+    Digest identifying what was asked for and by whom, or None for
+    organization requests. Stable across processes, unlike hash(), so
+    workers can share it through the cache.
+    """
+    if requester_user_id is not None:
+        requester = f'user:{requester_user_id}'
+    elif requester_phone_number:
+        requester = 'phone:' + ''.join(requester_phone_number.split())
+    else:
+        return None
+    return hashlib.blake2b(f'{requester}:{product_type_id}:{quantity}'.encode(), digest_size=12).hexdigest()
+
+
+def _window():
+    return timedelta(hours=settings.DUPLICATE_REQUEST_WINDOW_HOURS)
+
+
+def _bucket_seconds():
+    return settings.DUPLICATE_INDEX_BUCKET_MINUTES * 60
+
+
+class RecentRequestIndex:
+    """
+    Hash map of request fingerprints to the ids of the requests having them,
+    split into time buckets of DUPLICATE_INDEX_BUCKET_MINUTES by creation
+    time. A lookup checks the buckets covering the window; buckets that fall
+    out of it are dropped as new ones are added. The window is therefore
+    rounded up to whole buckets. Keeping ids makes adding or discarding the
+    same request twice harmless.
+    """
+
+    def __init__(self, window, bucket_width):
+        self.window = window
+        self.bucket_seconds = bucket_width.total_seconds()
+        self._buckets = {}  # bucket number -> {fingerprint: {request ids}}
+        self._lock = threading.Lock()
+
+    def _bucket(self, when):
+        return int(when.timestamp() // self.bucket_seconds)
+
+    def _live_buckets(self, now):
+        return range(self._bucket(now - self.window), self._bucket(now) + 1)
+
+    def add(self, fingerprint, created_at, pk):
+        bucket = self._bucket(created_at)
+        with self._lock:
+            self._buckets.setdefault(bucket, {}).setdefault(fingerprint, set()).add(pk)
+            oldest = self._bucket(timezone.now() - self.window)
+            for expired in [b for b in self._buckets if b < oldest]:
+                del self._buckets[expired]
+
+    def discard(self, fingerprint, created_at, pk):
+        with self._lock:
+            requests = self._buckets.get(self._bucket(created_at), {})
+            ids = requests.get(fingerprint)
+            if ids is not None:
+                ids.discard(pk)
+                if not ids:
+                    del requests[fingerprint]
+
+    def __contains__(self, fingerprint):
+        with self._lock:
+            return any(
+                self._buckets.get(bucket, {}).get(fingerprint)
+                for bucket in self._live_buckets(timezone.now())
+            )
+
+
+def build_index():
+    window = _window()
+    index = RecentRequestIndex(window, timedelta(seconds=_bucket_seconds()))
+    cutoff = timezone.now() - window
+    rows = (
+        ProductRequest.objects
+        # updated_at >= created_at, so this range is served by the updated_at index.
+        .filter(updated_at__gte=cutoff, created_at__gte=cutoff)
+        .filter(Q(requester_user__isnull=False) | Q(requester_phone_number__gt=''))
+        .exclude(status__in=INACTIVE_STATUSES)
+        .values_list('pk', 'requester_user_id', 'requester_phone_number', 'product_type_id', 'quantity', 'created_at')
+    )
+    for pk, user_id, phone_number, product_type_id, quantity, created_at in rows.iterator(chunk_size=2000):
+        index.add(request_fingerprint(user_id, phone_number, product_type_id, quantity), created_at, pk)
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()  # Guards _index and _replay
+_refresh_lock = threading.Lock()  # One rebuild at a time
+_replay = None  # Changes committed while a rebuild runs, applied to the new index
+
+
+def refresh_index():
+    """Rebuild this worker's index from the database and swap it in."""
+    global _index, _replay
+    with _refresh_lock:
+        with _index_lock:
+            _replay = []
+        try:
+            index = build_index()
+        except BaseException:
+            with _index_lock:
+                _replay = None
+            raise
+        with _index_lock:
+            # The query may have missed these; reapplying any it saw is harmless.
+            for action, fingerprint, created_at, pk in _replay:
+                getattr(index, action)(fingerprint, created_at, pk)
+            _index, _replay = index, None
+
+
+def _refresh_forever():
+    while True:
+        time.sleep(settings.DUPLICATE_INDEX_REFRESH_SECONDS)
+        close_old_connections()
+        try:
+            refresh_index()
+        except Exception:
+            logger.exception("Rebuilding the duplicate request index failed; keeping the previous one.")
+        finally:
+            close_old_connections()
+
+
+_refresh_thread = None
+
+
+def start_index_refresh():
+    """
+    Build the index now and keep rebuilding it on a daemon thread. Called
+    once per worker process at startup; later calls do nothing.
+    """
+    global _refresh_thread
+    if settings.DUPLICATE_REQUEST_POLICY == 'off' or _refresh_thread is not None:
+        return
+    try:
+        refresh_index()
+    except Exception:
+        # E.g. before the first migrate; the first check builds it instead.
+        logger.exception("Building the duplicate request index failed.")
+    _refresh_thread = threading.Thread(target=_refresh_forever, name='duplicate-index-refresh', daemon=True)
+    _refresh_thread.start()
+
+
+def get_index():
+    """This worker's index. Built on first use only where start_index_refresh() didn't run (shell, tests)."""
+    if _index is None:
+        with _index_lock:
+            needs_build = _index is None
+        if needs_build:
+            refresh_index()
+    return _index
+
+
+def _shared_keys(fingerprint, buckets):
+    return [f'duplicate-request:{fingerprint}:{bucket}' for bucket in buckets]
+
+
+def _in_shared_index(fingerprint):
+    now = timezone.now().timestamp()
+    buckets = range(int((now - _window().total_seconds()) // _bucket_seconds()), int(now // _bucket_seconds()) + 1)
+    return any(count > 0 for count in cache.get_many(_shared_keys(fingerprint, buckets)).values())
+
+
+def _update_shared_index(action, fingerprint, created_at):
+    [key] = _shared_keys(fingerprint, [int(created_at.timestamp() // _bucket_seconds())])
+    try:
+        if action == 'add':
+            cache.add(key, 0, _window().total_seconds() + _bucket_seconds())
+            cache.incr(key)
+        else:
+            cache.decr(key)
+    except ValueError:  # The key expired meanwhile
+        pass
+
+
+def check_duplicate_request(product_type, quantity, requester_user=None, requester_phone_number=None):
+    """
+    Apply DUPLICATE_REQUEST_POLICY to a request about to be created.
+    Returns True if it should be flagged; raises DuplicateRequest if it is to be rejected.
+    """
+    policy = settings.DUPLICATE_REQUEST_POLICY
+    if policy == 'off':
+        return False
+    fingerprint = request_fingerprint(
+        requester_user.pk if requester_user is not None else None,
+        requester_phone_number, product_type.pk, quantity,
+    )
+    if fingerprint is None:
+        return False
+    if fingerprint not in get_index() and not (settings.DUPLICATE_INDEX_SHARED and _in_shared_index(fingerprint)):
+        return False
+    if policy == 'reject':
+        raise DuplicateRequest()
+    return True
+
+
+def _apply(action, fingerprint, created_at, pk):
+    with _index_lock:
+        if _index is not None:
+            getattr(_index, action)(fingerprint, created_at, pk)
+        if _replay is not None:
+            _replay.append((action, fingerprint, created_at, pk))
+    if settings.DUPLICATE_INDEX_SHARED:
+        _update_shared_index(action, fingerprint, created_at)
+
+
+def update_index_on_commit(action, pk, requester_user_id, requester_phone_number, product_type_id, quantity, created_at):
+    """
+    'add' or 'discard' a request in the index once the current transaction
+    commits. For writes that bypass the model signals, such as .update().
+    """
+    fingerprint = request_fingerprint(requester_user_id, requester_phone_number, product_type_id, quantity)
+    if fingerprint is not None:
+        transaction.on_commit(lambda: _apply(action, fingerprint, created_at, pk))
+
+
+def _update_instance_on_commit(action, instance):
+    update_index_on_commit(
+        action, instance.pk, instance.requester_user_id, instance.requester_phone_number,
+        instance.product_type_id, instance.quantity, instance.created_at,
+    )
+
+
+def request_saving(sender, instance, raw=False, **kwargs):
+    # The audit receivers replace the snapshot on post_save, so note the transition now.
+    previous_status = getattr(instance, '_audit_snapshot', {}).get('status')
+    instance._deactivated = (
+        not raw and previous_status is not None
+        and previous_status not in INACTIVE_STATUSES and instance.status in INACTIVE_STATUSES
+    )
+
+
+def request_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created and instance.status not in INACTIVE_STATUSES:
+        _update_instance_on_commit('add', instance)
+    elif getattr(instance, '_deactivated', False):
+        _update_instance_on_commit('discard', instance)
+
+
+def request_deleted(sender, instance, **kwargs):
+    if instance.status not in INACTIVE_STATUSES:
+        _update_instance_on_commit('discard', instance)
+
+
+pre_save.connect(request_saving, sender=ProductRequest, dispatch_uid='duplicates_request_saving')
+post_save.connect(request_saved, sender=ProductRequest, dispatch_uid='duplicates_request_saved')
+post_delete.connect(request_deleted, sender=ProductRequest, dispatch_uid='duplicates_request_deleted')
@@ -0,0 +1,230 @@
+# api/events.py
+"""
+Live change events for product requests and inventory.
+
+Model signals publish a small event to a broker once the write commits; the
+SSE endpoint (api.streaming) subscribes each connected client with
+the set of scope keys its role may see, so an event is only delivered to
+subscribers that share one of its keys:
+
+* ('all',)            staff and superusers
+* ('user', <id>)      the requesting user
+* ('org', <id>)       admins of the requesting organization
+* ('center', <id>)    admins of the assigned / stocking distribution center
+
+The broker is chosen by the EVENT_BROKER setting. LocalBroker delivers
+within the current process only, which is enough for a single ASGI worker;
+with several workers, plug in a broker backed by a shared channel (Redis
+pub/sub, Postgres LISTEN/NOTIFY) that implements the same three methods.
+"""
+
+import asyncio
+import itertools
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils.module_loading import import_string
+
+from .models import InventoryItem, ProductRequest, UserProfile
+
+ALL_SCOPE = ('all',)
+
+
+class Subscription:
+    """One connected client: a bounded queue on the event loop serving it."""
+
+    def __init__(self, keys, loop, max_pending):
+        self.keys = frozenset(keys)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        # Set when events were dropped because the client fell behind; the
+        # stream tells the client to refetch instead of silently skipping.
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class BaseBroker:
+    """Interface for event brokers. Subclasses implement all three methods."""
+
+    def publish(self, event):
+        """Deliver `event` (a dict with a 'scopes' list) to matching subscribers. Thread-safe."""
+        raise NotImplementedError
+
+    def subscribe(self, keys):
+        """Register a subscriber for `keys` on the running event loop and return its Subscription."""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class LocalBroker(BaseBroker):
+    """
+    In-process broker. Subscribers are indexed by scope key, so publishing
+    costs O(matching subscribers) no matter how many idle clients are
+    connected. Publishers may run on any thread (sync views run in a thread
+    pool under ASGI); delivery is handed to each subscriber's event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_key = defaultdict(set)
+
+    def publish(self, event):
+        with self._lock:
+            targets = set()
+            for key in event['scopes']:
+                targets.update(self._by_key.get(tuple(key), ()))
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:  # Loop already closed; the stream is going away.
+                pass
+
+    def subscribe(self, keys):
+        subscription = Subscription(keys, asyncio.get_running_loop(), settings.EVENT_STREAM_MAX_PENDING)
+        with self._lock:
+            for key in subscription.keys:
+                self._by_key[key].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for key in subscription.keys:
+                subscribers = self._by_key.get(key)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._by_key[key]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(set().union(*self._by_key.values())) if self._by_key else 0
+
+
+_broker = None
+_broker_lock = threading.Lock()
+_event_ids = itertools.count(1)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.EVENT_BROKER)()
+    return _broker
+
+
+def subscription_keys(user):
+    """Scope keys `user` may receive, mirroring the role scoping of the list views."""
+    if user.is_staff or user.is_superuser:
+        return {ALL_SCOPE}
+
+    keys = {('user', user.pk)}
+    try:
+        profile = UserProfile.objects.select_related(
+            'managed_organization', 'managed_distribution_center'
+        ).get(user=user)
+    except UserProfile.DoesNotExist:
+        return keys
+
+    if profile.role == 'organization_admin':
+        organization = getattr(profile, 'managed_organization', None)
+        if organization is not None:
+            keys.add(('org', organization.pk))
+    elif profile.role == 'center_admin':
+        center = getattr(profile, 'managed_distribution_center', None)
+        if center is not None:
+            keys.add(('center', center.pk))
+    return keys
+
+
+def request_scopes(requesting_organization_id, requester_user_id, assigned_distribution_center_id):
+    scopes = [ALL_SCOPE]
+    if requester_user_id is not None:
+        scopes.append(('user', requester_user_id))
+    if requesting_organization_id is not None:
+        scopes.append(('org', requesting_organization_id))
+    if assigned_distribution_center_id is not None:
+        scopes.append(('center', assigned_distribution_center_id))
+    return scopes
+
+
+def publish_on_commit(entity_type, entity_id, action, scopes, data=None):
+    """Publish a change event once the current transaction commits (immediately in autocommit)."""
+    event = {
+        'type': entity_type,
+        'id': entity_id,
+        'action': action,
+        'data': data or {},
+        'scopes': scopes,
+    }
+
+    def publish():
+        event['event_id'] = next(_event_ids)
+        get_broker().publish(event)
+
+    transaction.on_commit(publish)
+
+
+def _request_event_data(instance):
+    return {
+        'status': instance.status,
+        'quantity': instance.quantity,
+        'version': instance.version,
+        'updated_at': instance.updated_at.isoformat() if instance.updated_at else None,
+    }
+
+
+def _inventory_event_data(instance):
+    return {
+        'distribution_center': instance.distribution_center_id,
+        'product_type': instance.product_type_id,
+        'quantity': instance.quantity,
+        'version': instance.version,
+        'last_updated': instance.last_updated.isoformat() if instance.last_updated else None,
+    }
+
+
+def request_changed(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    action = 'delete' if kwargs.get('signal') is post_delete else ('create' if created else 'update')
+    publish_on_commit(
+        'product_request', instance.pk, action,
+        request_scopes(
+            instance.requesting_organization_id,
+            instance.requester_user_id,
+            instance.assigned_distribution_center_id,
+        ),
+        _request_event_data(instance),
+    )
+
+
+def inventory_changed(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    action = 'delete' if kwargs.get('signal') is post_delete else ('create' if created else 'update')
+    publish_on_commit(
+        'inventory_item', instance.pk, action,
+        [ALL_SCOPE, ('center', instance.distribution_center_id)],
+        _inventory_event_data(instance),
+    )
+
+
+post_save.connect(request_changed, sender=ProductRequest, dispatch_uid='events_request_saved')
+post_delete.connect(request_changed, sender=ProductRequest, dispatch_uid='events_request_deleted')
+post_save.connect(inventory_changed, sender=InventoryItem, dispatch_uid='events_inventory_saved')
+post_delete.connect(inventory_changed, sender=InventoryItem, dispatch_uid='events_inventory_deleted')
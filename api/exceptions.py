@@ -0,0 +1,34 @@
+# api/exceptions.py
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource was modified by another request. Reload it and try again.'
+    default_code = 'precondition_failed'
+
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The request conflicts with a concurrent change. Try again.'
+    default_code = 'conflict'
+
+
+class SyncCursorExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'The sync cursor is too old. Fetch the full list again to get a new cursor.'
+    default_code = 'sync_cursor_expired'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+class DuplicateRequest(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'You already requested this product and quantity recently.'
+    default_code = 'duplicate_request'
@@ -0,0 +1,147 @@
+# api/forecasting.py
+"""
+Days-of-stock-remaining forecasts for every center x product series at once.
+
+Daily consumption for all series is built as one (series x day) NumPy matrix
+from two sources over the last FORECAST_WINDOW_DAYS:
+
+* units handed over by fulfilled ProductRequests (the allocated quantity,
+  else the requested one), bucketed by the day of their status log entry
+  into Fulfilled, and
+* day-to-day drops in InventorySnapshot levels, which also catch stock that
+  left without a request (walk-ins, SMS). Restocks show up as rises and are
+  ignored.
+
+The request series is smoothed with exponentially decaying day weights so
+recent demand counts more; the larger of the two estimates is used, which
+errs on the side of warning early.
+"""
+
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import InventorySnapshot, ProductRequestStatusLog
+
+
+def _lookup(series_keys_sorted, series_order, centers, products, max_product):
+    """Vectorized (center, product) -> series index; -1 where there is no such series."""
+    keys = centers.astype(np.int64) * (max_product + 1) + products
+    positions = np.searchsorted(series_keys_sorted, keys)
+    positions = np.minimum(positions, len(series_keys_sorted) - 1)
+    found = series_keys_sorted[positions] == keys
+    return np.where(found, series_order[positions], -1)
+
+
+def _request_consumption(scope_centers, start, lookup, shape):
+    # The log entry dates the hand-over; the request's updated_at moves with
+    # any later edit.
+    center = 'product_request__assigned_distribution_center_id'
+    product = 'product_request__product_type_id'
+    rows = list(
+        ProductRequestStatusLog.objects
+        .filter(
+            to_status='Fulfilled',
+            changed_at__gte=timezone.make_aware(datetime.combine(start, time.min)),
+            product_request__assigned_distribution_center__in=scope_centers,
+        )
+        .annotate(day=TruncDate('changed_at'))
+        .values(center, product, 'day')
+        .annotate(total=Sum(Coalesce('product_request__allocated_quantity', 'product_request__quantity')))
+        .order_by()
+        .values_list(center, product, 'day', 'total')
+    )
+    consumption = np.zeros(shape)
+    if not rows:
+        return consumption
+    centers, products, days, totals = zip(*rows)
+    series = lookup(np.array(centers), np.array(products))
+    offsets = np.array([(day - start).days for day in days])
+    keep = (series >= 0) & (offsets >= 0) & (offsets < shape[1])
+    np.add.at(consumption, (series[keep], offsets[keep]), np.array(totals, dtype=float)[keep])
+    return consumption
+
+
+def _snapshot_drop_rate(scope_centers, start, lookup, shape):
+    rows = list(
+        InventorySnapshot.objects
+        .filter(taken_on__gte=start, distribution_center__in=scope_centers)
+        .values_list('distribution_center_id', 'product_type_id', 'taken_on', 'quantity')
+    )
+    if not rows:
+        return np.zeros(shape[0])
+    levels = np.full(shape, np.nan)
+    centers, products, days, quantities = zip(*rows)
+    series = lookup(np.array(centers), np.array(products))
+    offsets = np.array([(day - start).days for day in days])
+    keep = (series >= 0) & (offsets >= 0) & (offsets < shape[1])
+    levels[series[keep], offsets[keep]] = np.array(quantities, dtype=float)[keep]
+
+    drops = -np.diff(levels, axis=1)          # NaN wherever a day is missing
+    valid = ~np.isnan(drops)
+    drops = np.where(valid & (drops > 0), drops, 0.0)
+    return drops.sum(axis=1) / np.maximum(valid.sum(axis=1), 1)
+
+
+def forecast_stock(inventory_queryset, window_days=None, smoothing=None, today=None):
+    """
+    Forecast every InventoryItem in `inventory_queryset`.
+
+    Returns a list of dicts sorted by days_remaining, soonest first; items
+    with no measurable consumption come last with days_remaining = None.
+    """
+    window_days = window_days or settings.FORECAST_WINDOW_DAYS
+    smoothing = smoothing if smoothing is not None else settings.FORECAST_SMOOTHING
+    today = today or timezone.localdate()
+    start = today - timedelta(days=window_days - 1)
+
+    items = list(inventory_queryset.order_by().values_list(
+        'id', 'distribution_center_id', 'product_type_id', 'quantity',
+        'distribution_center__name', 'product_type__name',
+    ))
+    if not items:
+        return []
+
+    item_ids, centers, products, quantities, center_names, product_names = zip(*items)
+    centers = np.array(centers, dtype=np.int64)
+    products = np.array(products, dtype=np.int64)
+    quantities = np.array(quantities, dtype=float)
+
+    max_product = int(products.max())
+    series_keys = centers * (max_product + 1) + products
+    series_order = np.argsort(series_keys)
+    series_keys_sorted = series_keys[series_order]
+
+    def lookup(row_centers, row_products):
+        return _lookup(series_keys_sorted, series_order, row_centers, row_products, max_product)
+
+    shape = (len(items), window_days)
+    scope_centers = inventory_queryset.order_by().values('distribution_center_id')
+
+    consumption = _request_consumption(scope_centers, start, lookup, shape)
+    # Day weights decay by (1 - smoothing) per day of age and sum to 1.
+    weights = (1 - smoothing) ** np.arange(window_days - 1, -1, -1, dtype=float)
+    weights /= weights.sum()
+    request_rate = consumption @ weights
+
+    daily_rate = np.maximum(request_rate, _snapshot_drop_rate(scope_centers, start, lookup, shape))
+    with np.errstate(divide='ignore'):
+        days_remaining = np.where(daily_rate > 0, quantities / daily_rate, np.inf)
+
+    forecast = []
+    for i in np.argsort(days_remaining, kind='stable'):
+        forecast.append({
+            'inventory_item': item_ids[i],
+            'distribution_center': int(centers[i]),
+            'distribution_center_name': center_names[i],
+            'product_type': int(products[i]),
+            'product_type_name': product_names[i],
+            'quantity': int(quantities[i]),
+            'daily_consumption': round(float(daily_rate[i]), 3),
+            'days_remaining': None if np.isinf(days_remaining[i]) else round(float(days_remaining[i]), 1),
+        })
+    return forecast
@@ -0,0 +1,51 @@
+# api/hashers.py
+"""
+Password hashers whose cost comes from settings, so it can be tuned per
+deployment (see `manage.py benchmark_hashers`) without code changes.
+
+Each keeps its parent's algorithm name, so stored hashes stay readable:
+a password hashed at another cost, or by another hasher listed in
+PASSWORD_HASHERS, still verifies and is re-hashed with the current one at
+the user's next login. A cost setting left unset keeps Django's default.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+)
+
+
+def _cost(name, default):
+    value = getattr(settings, name, None)
+    return default if value is None else value
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return _cost('PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return _cost('PASSWORD_SCRYPT_WORK_FACTOR', ScryptPasswordHasher.work_factor)
+
+    @property
+    def maxmem(self):
+        # OpenSSL's default cap (32 MiB) rejects work factors above 2**14.
+        return 2 * 128 * self.block_size * self.work_factor
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Needs the `argon2-cffi` package."""
+
+    @property
+    def time_cost(self):
+        return _cost('PASSWORD_ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return _cost('PASSWORD_ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
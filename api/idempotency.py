@@ -0,0 +1,83 @@
+# api/idempotency.py
+"""
+Idempotency-Key store for the create endpoints (see IdempotentCreateMixin).
+
+Entries live in the default cache under a digest of (owner, key), so the
+raw key is never stored and one client cannot replay another's response.
+The owner is the user, or for anonymous requests the view's discriminator
+(the username being registered, or else the client address):
+
+* idempotency:<digest>       the finished response, kept IDEMPOTENCY_KEY_TTL_SECONDS
+                             (IDEMPOTENCY_CREDENTIALS_TTL_SECONDS if it holds a token)
+* idempotency_lock:<digest>  held while the first request with the key runs
+
+Concurrent duplicates block on the lock and replay the first request's
+response once it is stored. Coordination goes through the cache, so use
+REDIS_URL when running several workers.
+"""
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+RESULT_KEY_FORMAT = 'idempotency:%s'
+LOCK_KEY_FORMAT = 'idempotency_lock:%s'
+POLL_INTERVAL_SECONDS = 0.05
+
+
+def key_digest(owner, idempotency_key):
+    return hashlib.sha256(f'{owner}:{idempotency_key}'.encode()).hexdigest()[:32]
+
+
+def request_fingerprint(request):
+    """Digest of the method, path and payload, to catch a key reused for a different request."""
+    data = request.data
+    if hasattr(data, 'lists'):  # QueryDict from form / multipart bodies
+        data = {key: values for key, values in data.lists()}
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_stored_response(digest):
+    return cache.get(RESULT_KEY_FORMAT % digest)
+
+
+def store_response(digest, fingerprint, response, timeout):
+    cache.set(RESULT_KEY_FORMAT % digest, {
+        'fingerprint': fingerprint,
+        'status': response.status_code,
+        'data': response.data,
+        'location': response.get('Location'),
+    }, timeout)
+
+
+def acquire(digest):
+    """Take the in-progress lock for `digest`. False if another request holds it."""
+    # add() only sets a missing key, atomically on every cache backend.
+    return cache.add(LOCK_KEY_FORMAT % digest, 1, settings.IDEMPOTENCY_LOCK_SECONDS)
+
+
+def release(digest):
+    cache.delete(LOCK_KEY_FORMAT % digest)
+
+
+def wait_for_response(digest):
+    """
+    Wait for the request holding the lock to finish.
+
+    Returns its stored response, or None once the lock is free without one
+    (the first request failed and the caller may run it). Raises TimeoutError
+    if the lock is still held after IDEMPOTENCY_LOCK_SECONDS.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        stored = get_stored_response(digest)
+        if stored is not None:
+            return stored
+        if cache.get(LOCK_KEY_FORMAT % digest) is None:
+            return get_stored_response(digest)
+        time.sleep(POLL_INTERVAL_SECONDS)
+    raise TimeoutError(digest)
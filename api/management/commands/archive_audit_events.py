@@ -0,0 +1,70 @@
+# api/management/commands/archive_audit_events.py
+
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import AuditEvent
+
+FIELDS = ('id', 'entity_type', 'entity_id', 'action', 'changes', 'actor_id', 'occurred_at')
+
+
+class Command(BaseCommand):
+    help = (
+        "Move audit events older than --days into gzip-compressed JSON Lines files "
+        "(one per month, audit-YYYY-MM.jsonl.gz) and delete them from the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=180, help="Keep events newer than this many days (default 180).")
+        parser.add_argument('--output-dir', default='audit_archive', help="Directory for the archive files.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows read and deleted per batch.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be archived without writing or deleting.")
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['chunk_size'] < 1:
+            raise CommandError("--days must be >= 0 and --chunk-size >= 1.")
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old_events = AuditEvent.objects.filter(occurred_at__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f"{old_events.count()} audit events older than {cutoff:%Y-%m-%d} would be archived.")
+            return
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+        archived = 0
+        last_id = 0
+        while True:
+            # Walk by primary key so each batch is an index range scan.
+            rows = list(
+                old_events.filter(id__gt=last_id).order_by('id').values(*FIELDS)[:options['chunk_size']]
+            )
+            if not rows:
+                break
+
+            rows_by_month = {}
+            for row in rows:
+                rows_by_month.setdefault(row['occurred_at'].strftime('%Y-%m'), []).append(row)
+
+            # Append is safe for gzip: concatenated members read back as one stream.
+            for month, month_rows in rows_by_month.items():
+                path = os.path.join(options['output_dir'], f'audit-{month}.jsonl.gz')
+                with gzip.open(path, 'at', encoding='utf-8') as archive:
+                    for row in month_rows:
+                        archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+
+            ids = [row['id'] for row in rows]
+            with transaction.atomic():
+                AuditEvent.objects.filter(id__in=ids).delete()
+            archived += len(ids)
+            last_id = ids[-1]
+            self.stdout.write(f"Archived {archived} events...")
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} audit events older than {cutoff:%Y-%m-%d} to {options['output_dir']}."))
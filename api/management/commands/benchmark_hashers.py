@@ -0,0 +1,82 @@
+# api/management/commands/benchmark_hashers.py
+
+import math
+import statistics
+import time
+
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher
+from django.core.management.base import BaseCommand, CommandError
+
+from api.hashers import TunedArgon2PasswordHasher, TunedPBKDF2PasswordHasher, TunedScryptPasswordHasher
+
+# Lowest costs ever suggested: Django's current default, or OWASP's Password
+# Storage Cheat Sheet minimum if higher (PBKDF2-HMAC-SHA256 600,000
+# iterations; scrypt N=2**17 with r=8, p=1; Argon2id t=2 at 19 MiB).
+OWASP_MINIMUMS = {'pbkdf2': 600_000, 'scrypt': 2 ** 17, 'argon2': 2}
+
+# name -> (hasher class, cost attribute, setting, Django's default, cost suggested for a time ratio)
+HASHERS = {
+    'pbkdf2': (
+        TunedPBKDF2PasswordHasher, 'iterations', 'PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations,
+        lambda cost, ratio: int(round(cost * ratio, -3)),
+    ),
+    'scrypt': (
+        TunedScryptPasswordHasher, 'work_factor', 'PASSWORD_SCRYPT_WORK_FACTOR', ScryptPasswordHasher.work_factor,
+        # Must stay a power of 2; memory grows with it too (128 * 8 * n bytes).
+        lambda cost, ratio: int(cost * 2 ** round(math.log2(ratio))),
+    ),
+    'argon2': (
+        TunedArgon2PasswordHasher, 'time_cost', 'PASSWORD_ARGON2_TIME_COST', Argon2PasswordHasher.time_cost,
+        lambda cost, ratio: round(cost * ratio),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Time one password hash with each hasher at its configured cost, and suggest the "
+        "cost that takes --target-ms on this machine, but never less than Django's default "
+        "or the OWASP minimum. Run it on the production hardware."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasher', action='append', choices=sorted(HASHERS), help="Only benchmark this hasher (repeatable; default all).")
+        parser.add_argument('--target-ms', type=float, default=250, help="Time one hash should take (default 250).")
+        parser.add_argument('--rounds', type=int, default=5, help="Hashes timed per hasher; the median is reported.")
+
+    def handle(self, *args, **options):
+        if options['target_ms'] <= 0 or options['rounds'] < 1:
+            raise CommandError("--target-ms must be > 0 and --rounds >= 1.")
+
+        for name in options['hasher'] or HASHERS:
+            hasher_class, attribute, setting, django_default, suggest = HASHERS[name]
+            hasher = hasher_class()
+            try:
+                hasher.encode('benchmark password', hasher.salt())  # warm up, and load the library
+            except ValueError as e:
+                self.stdout.write(f"{name}: skipped ({e})")
+                continue
+
+            timings = []
+            for _ in range(options['rounds']):
+                started = time.perf_counter()
+                hasher.encode('benchmark password', hasher.salt())
+                timings.append((time.perf_counter() - started) * 1000)
+            median = statistics.median(timings)
+            cost = getattr(hasher, attribute)
+            suggested = suggest(cost, options['target_ms'] / median)
+            minimum = max(django_default, OWASP_MINIMUMS[name])
+            if suggested >= minimum:
+                advice = f"for {options['target_ms']:g} ms set {setting}={suggested}"
+            else:
+                source = "Django's default" if minimum == django_default else "the OWASP minimum"
+                advice = (
+                    f"{options['target_ms']:g} ms would mean {attribute}={suggested}, below {source}; "
+                    f"set {setting}={minimum} and add CPU cores for more sign-ups/s"
+                )
+            if cost < minimum:
+                advice += f" (the current {attribute}={cost} is below the minimum of {minimum})"
+            self.stdout.write(
+                f"{name}: {attribute}={cost} takes {median:.1f} ms "
+                f"(about {1000 / median:.1f} sign-ups/s per CPU core); {advice}"
+            )
@@ -0,0 +1,52 @@
+# api/management/commands/recount.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.counters import COUNTERS, recount_chunk
+
+MODELS = {model._meta.model_name: model for model in COUNTERS}
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the request counters on organizations, distribution centers and product "
+        "types from the requests, in chunks, and repair any that drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', action='append', choices=sorted(MODELS),
+            help="Only recount this model (repeatable; default all).",
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Rows locked and recounted per transaction.")
+        parser.add_argument('--check', action='store_true', help="Only report drift, and exit with an error if there is any.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be >= 1.")
+
+        total_drifted = 0
+        for name in options['model'] or MODELS:
+            model = MODELS[name]
+            field = COUNTERS[model][0]
+            checked = drifted = 0
+            last_pk = 0
+            while True:
+                # Walk by primary key so each chunk is an index range scan.
+                pks = list(
+                    model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']]
+                )
+                if not pks:
+                    break
+                for pk, (stored, actual) in recount_chunk(model, pks, fix=not options['check']).items():
+                    self.stdout.write(f"{model._meta.object_name} {pk}: {field} was {stored}, should be {actual}")
+                    drifted += 1
+                checked += len(pks)
+                last_pk = pks[-1]
+            verb = 'drifted' if options['check'] else 'repaired'
+            self.stdout.write(f"{model._meta.object_name}: checked {checked}, {verb} {drifted}.")
+            total_drifted += drifted
+
+        if options['check'] and total_drifted:
+            raise CommandError(f"{total_drifted} counters have drifted; run `recount` without --check to repair them.")
+        self.stdout.write(self.style.SUCCESS("Counters are consistent." if not total_drifted else f"Repaired {total_drifted} counters."))
@@ -0,0 +1,75 @@
+# api/management/commands/run_workers.py
+
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.tasks import REGISTRY, run_worker_threads, schedule_periodic
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the background task queue (api/tasks.py): --processes worker processes with "
+        "--threads polling threads each. Stops cleanly on SIGINT/SIGTERM after the running tasks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.TASK_WORKER_PROCESSES, help="Worker processes (default TASK_WORKER_PROCESSES).")
+        parser.add_argument('--threads', type=int, default=settings.TASK_WORKER_THREADS, help="Threads per process (default TASK_WORKER_THREADS).")
+        parser.add_argument('--batch-size', type=int, default=settings.TASK_BATCH_SIZE, help="Tasks claimed per poll by each thread.")
+        parser.add_argument('--poll-interval', type=float, default=settings.TASK_POLL_SECONDS, help="Seconds to wait when nothing is due.")
+        parser.add_argument('--once', action='store_true', help="Exit once nothing is due instead of polling (for cron and tests).")
+        parser.add_argument('--no-periodic', action='store_true', help="Don't queue the periodic jobs on start-up.")
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1 or options['threads'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--processes, --threads and --batch-size must be >= 1.")
+
+        if not options['no_periodic']:
+            schedule_periodic()
+        periodic = sorted(name for name, func in REGISTRY.items() if func.every)
+        self.stdout.write(
+            f"Starting {options['processes']} x {options['threads']} task workers"
+            f" ({len(REGISTRY)} tasks registered; periodic: {', '.join(periodic) or 'none'})."
+        )
+
+        if options['processes'] == 1:
+            self.run_threads(options)
+        else:
+            self.run_processes(options)
+        self.stdout.write(self.style.SUCCESS("Task workers stopped."))
+
+    def run_threads(self, options):
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+        run_worker_threads(
+            options['threads'], stop, options['batch_size'], options['poll_interval'],
+            once=options['once'], log=self.stdout.write,
+        )
+
+    def run_processes(self, options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError("Worker processes need fork(); use --processes 1 with more --threads instead.")
+        # Children must open their own database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [
+            context.Process(target=self.run_threads, args=(options,), name=f"task-workers-{number}")
+            for number in range(options['processes'])
+        ]
+        for child in children:
+            child.start()
+
+        def forward(signum, frame):
+            for child in children:
+                if child.is_alive():
+                    child.terminate()  # SIGTERM: the child finishes its running tasks
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, forward)
+        for child in children:
+            child.join()
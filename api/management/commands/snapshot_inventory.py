@@ -0,0 +1,35 @@
+# api/management/commands/snapshot_inventory.py
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import InventoryItem, InventorySnapshot
+
+
+class Command(BaseCommand):
+    help = "Record today's stock level for every inventory item. Safe to re-run; the day's rows are overwritten."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per INSERT statement.")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        snapshots = [
+            InventorySnapshot(
+                distribution_center_id=center_id,
+                product_type_id=product_id,
+                taken_on=today,
+                quantity=quantity,
+            )
+            for center_id, product_id, quantity in InventoryItem.objects.values_list(
+                'distribution_center_id', 'product_type_id', 'quantity'
+            ).iterator(chunk_size=options['batch_size'])
+        ]
+        InventorySnapshot.objects.bulk_create(
+            snapshots,
+            batch_size=options['batch_size'],
+            update_conflicts=True,
+            unique_fields=['distribution_center', 'product_type', 'taken_on'],
+            update_fields=['quantity'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Recorded {len(snapshots)} inventory snapshots for {today}."))
@@ -0,0 +1,180 @@
+# api/middleware.py
+
+import gzip
+import re
+import time
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # Optional: pip install brotli
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional: pip install zstandard
+    zstandard = None
+
+from .audit import current_request
+from .routers import replica_reads_allowed, replica_configured
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE_NAME = 'primary_pin'
+
+
+class ReplicaPinningMiddleware:
+    """
+    Decides per request whether reads may be served by the replica.
+
+    Safe-method requests read from the replica. Unsafe requests use the
+    primary throughout, and set a short-lived cookie so the same client keeps
+    reading from the primary for REPLICA_PIN_SECONDS afterwards and always
+    sees its own writes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        is_write = request.method not in SAFE_METHODS
+        token = replica_reads_allowed.set(not is_write and not self._is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads_allowed.reset(token)
+
+        if is_write:
+            pin_seconds = settings.REPLICA_PIN_SECONDS
+            secure = settings.CSRF_COOKIE_SECURE
+            response.set_cookie(
+                PIN_COOKIE_NAME,
+                str(int(time.time()) + pin_seconds),
+                max_age=pin_seconds,
+                secure=secure,
+                httponly=True,
+                # The frontend is served from a different site than the API.
+                samesite='None' if secure else 'Lax',
+            )
+        return response
+
+    def _is_pinned(self, request):
+        try:
+            return int(request.COOKIES.get(PIN_COOKIE_NAME, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+class AuditContextMiddleware:
+    """Makes the current request available to api.audit so events record who made a change."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+
+# Only API JSON is compressed. HTML pages (admin, browsable API) carry CSRF
+# tokens next to reflected input, and compressing those deterministically
+# would expose them to BREACH-style length attacks.
+COMPRESSIBLE_CONTENT_TYPES = ('application/json',)
+ACCEPT_ENCODING_RE = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+def _compress_br(content):
+    return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+
+def _compress_zstd(content):
+    return zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compress(content)
+
+
+def _compress_gzip(content):
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def available_encoders():
+    """Encodings this process can produce, in order of preference."""
+    encoders = []
+    if brotli is not None:
+        encoders.append(('br', _compress_br))
+    if zstandard is not None:
+        encoders.append(('zstd', _compress_zstd))
+    encoders.append(('gzip', _compress_gzip))
+    return encoders
+
+
+def parse_accept_encoding(header):
+    """Return the set of codings the client accepts (q > 0)."""
+    accepted = set()
+    for part in header.split(','):
+        match = ACCEPT_ENCODING_RE.match(part)
+        if not match:
+            continue
+        coding, q = match.group(1).lower(), match.group(2)
+        try:
+            if q is not None and float(q) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding)
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    Content-negotiated compression for dynamic responses.
+
+    Like django.middleware.gzip.GZipMiddleware, but picks brotli or zstd when
+    the client accepts them and the optional packages are installed, and only
+    compresses JSON bodies of at least COMPRESSION_MIN_SIZE bytes. Static
+    files are left to WhiteNoise, which serves them pre-compressed. Streaming
+    responses (e.g. event streams) are passed through untouched.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.encoders = available_encoders()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if not response.get('Content-Type', '').startswith(COMPRESSIBLE_CONTENT_TYPES):
+            return response
+
+        # Caches must key on the encoding even if this response isn't compressed.
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+        for coding, compress in self.encoders:
+            if coding in accepted or '*' in accepted:
+                break
+        else:
+            return response
+
+        compressed = compress(response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = coding
+        # The body changed, so a strong ETag no longer matches it.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_auditevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_on', models.DateField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('distribution_center', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.distributioncenter')),
+                ('product_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.producttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['taken_on'], name='inventorysnapshot_taken_on')],
+                'constraints': [models.UniqueConstraint(fields=('distribution_center', 'product_type', 'taken_on'), name='unique_inventory_snapshot_per_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_inventorysnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='reorder_threshold',
+            field=models.PositiveIntegerField(default=0, help_text='Raise a low-stock alert when quantity is at or below this level (0 disables).'),
+        ),
+        migrations.CreateModel(
+            name='LowStockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(help_text='Quantity when the alert was raised')),
+                ('reorder_threshold', models.PositiveIntegerField()),
+                ('raised_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('distribution_center', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.distributioncenter')),
+                ('inventory_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='low_stock_alerts', to='api.inventoryitem')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('resolved_at__isnull', True)), fields=['distribution_center', 'raised_at'], name='lowstockalert_open_by_center')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('inventory_item',), name='one_open_low_stock_alert_per_item')],
+            },
+        ),
+    ]
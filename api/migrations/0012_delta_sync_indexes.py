@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_lowstockalert'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(fields=['last_updated'], name='inventoryitem_last_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(fields=['distribution_center', 'last_updated'], name='inventoryitem_center_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='productrequest',
+            index=models.Index(fields=['updated_at'], name='productrequest_updated_at'),
+        ),
+        migrations.AddIndex(
+            model_name='productrequest',
+            index=models.Index(fields=['requesting_organization', 'updated_at'], name='productrequest_org_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='productrequest',
+            index=models.Index(fields=['requester_user', 'updated_at'], name='productrequest_user_updated'),
+        ),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:21
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+CHUNK_SIZE = 5000
+
+EXACTLY_ONE_REQUESTER = models.CheckConstraint(condition=models.Q(models.Q(('requester_user__isnull', True), ('requesting_organization__isnull', False), models.Q(('requester_phone_number__isnull', True), ('requester_phone_number', ''), _connector='OR')), models.Q(('requester_user__isnull', False), ('requesting_organization__isnull', True), models.Q(('requester_phone_number__isnull', True), ('requester_phone_number', ''), _connector='OR')), models.Q(('requester_user__isnull', True), ('requesting_organization__isnull', True), ('requester_phone_number__isnull', False), models.Q(('requester_phone_number', ''), _negated=True)), _connector='OR'), name='productrequest_exactly_one_requester', violation_error_message='A request must have exactly one requester (Organization, User, or Phone Number).')
+
+VALID_STATUS = models.CheckConstraint(condition=models.Q(('status__in', ['Pending', 'Ready', 'Fulfilled', 'Cancelled'])), name='productrequest_valid_status')
+
+
+VALID_STATUSES = ['Pending', 'Ready', 'Fulfilled', 'Cancelled']
+
+
+def fix_existing_rows(apps, schema_editor):
+    """
+    Repair the rows the constraints would reject where the intent is clear.
+    Each row's old values are written to an AuditEvent (action 'update', no
+    actor, {field: [old, new]}) in the same transaction as the change:
+
+    * More than one requester: keep the first of organization, user, phone
+      number and clear the others. A dropped phone number is also appended
+      to pickup_details ("Contact phone: ...").
+    * A status that is a valid one but for case or surrounding spaces is
+      corrected (e.g. 'ready' -> 'Ready').
+
+    Any other unknown status, and rows with no requester at all, are left
+    as they are for check_existing_rows() to report.
+    """
+    ProductRequest = apps.get_model('api', 'ProductRequest')
+    AuditEvent = apps.get_model('api', 'AuditEvent')
+    alias = schema_editor.connection.alias
+    rows = ProductRequest.objects.using(alias)
+
+    def repair(pk, changes):
+        with transaction.atomic(using=alias):
+            AuditEvent.objects.using(alias).create(
+                entity_type='productrequest', entity_id=pk, action='update', changes=changes,
+            )
+            rows.filter(pk=pk).update(**{field: new for field, (old, new) in changes.items()})
+
+    has_phone = models.Q(requester_phone_number__isnull=False) & ~models.Q(requester_phone_number='')
+    has_organization = models.Q(requesting_organization__isnull=False)
+    has_user = models.Q(requester_user__isnull=False)
+    for row in (
+        rows.filter((has_organization & (has_user | has_phone)) | (has_user & has_phone))
+        .order_by('pk')
+        .values('pk', 'requesting_organization_id', 'requester_user_id', 'requester_phone_number', 'pickup_details')
+    ):
+        changes = {}
+        if row['requesting_organization_id'] is not None and row['requester_user_id'] is not None:
+            changes['requester_user_id'] = [row['requester_user_id'], None]
+        if row['requester_phone_number']:
+            note = f"Contact phone: {row['requester_phone_number']}"
+            details = row['pickup_details']
+            changes['requester_phone_number'] = [row['requester_phone_number'], None]
+            changes['pickup_details'] = [details, f"{details}\n{note}" if details else note]
+        repair(row['pk'], changes)
+
+    by_lower = {status.lower(): status for status in VALID_STATUSES}
+    for pk, status in rows.exclude(status__in=VALID_STATUSES).order_by('pk').values_list('pk', 'status'):
+        corrected = by_lower.get((status or '').strip().lower())
+        if corrected is not None:
+            repair(pk, {'status': [status, corrected]})
+
+
+def check_existing_rows(apps, schema_editor):
+    """Find rows that would violate the constraints, one pk range at a time, so no long table lock is held."""
+    ProductRequest = apps.get_model('api', 'ProductRequest')
+    rows = ProductRequest.objects.using(schema_editor.connection.alias)
+    violating = rows.exclude(EXACTLY_ONE_REQUESTER.condition) | rows.exclude(VALID_STATUS.condition)
+
+    bad_ids = []
+    last_pk = 0
+    while True:
+        chunk_end = rows.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[CHUNK_SIZE - 1:CHUNK_SIZE].first()
+        chunk = violating.filter(pk__gt=last_pk)
+        if chunk_end is not None:
+            chunk = chunk.filter(pk__lte=chunk_end)
+        bad_ids.extend(chunk.order_by('pk').values_list('pk', flat=True))
+        if chunk_end is None:
+            break
+        last_pk = chunk_end
+
+    if bad_ids:
+        raise ValueError(
+            f"{len(bad_ids)} product request(s) have no requester (organization, user or phone number) "
+            f"or an unknown status, and can't be repaired automatically. Fix them in the admin first. "
+            f"Ids: {bad_ids[:100]}"
+        )
+
+
+class AddConstraintWithoutBlocking(migrations.AddConstraint):
+    """
+    On PostgreSQL, add the constraint NOT VALID (a brief lock) and then
+    VALIDATE it, which scans the table without blocking reads or writes
+    because the migration is non-atomic. Elsewhere, a plain AddConstraint.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.execute(str(self.constraint.create_sql(model, schema_editor)) + ' NOT VALID')
+            schema_editor.execute('ALTER TABLE %s VALIDATE CONSTRAINT %s' % (
+                schema_editor.quote_name(model._meta.db_table),
+                schema_editor.quote_name(self.constraint.name),
+            ))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('api', '0012_delta_sync_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_existing_rows, migrations.RunPython.noop),
+        migrations.RunPython(check_existing_rows, migrations.RunPython.noop),
+        AddConstraintWithoutBlocking(model_name='productrequest', constraint=EXACTLY_ONE_REQUESTER),
+        AddConstraintWithoutBlocking(model_name='productrequest', constraint=VALID_STATUS),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_productrequest_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productrequest',
+            name='suspected_duplicate',
+            field=models.BooleanField(default=False, help_text='Set when the same requester asked for the same product and quantity shortly before (api/duplicates.py)'),
+        ),
+    ]
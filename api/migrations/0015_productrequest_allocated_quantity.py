@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_productrequest_suspected_duplicate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productrequest',
+            name='allocated_quantity',
+            field=models.PositiveIntegerField(blank=True, help_text='Units set aside by fair-share allocation when stock is short (api/allocation.py); empty means the full quantity', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='productrequest',
+            constraint=models.CheckConstraint(condition=models.Q(('allocated_quantity__isnull', True), ('allocated_quantity__lte', models.F('quantity')), _connector='OR'), name='productrequest_allocation_within_quantity'),
+        ),
+    ]
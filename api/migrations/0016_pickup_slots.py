@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_productrequest_allocated_quantity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='distributioncenter',
+            name='pickup_slot_capacity',
+            field=models.PositiveSmallIntegerField(default=10, help_text='Pickups per slot; slots are cut from the operating hours (api/pickups.py)'),
+        ),
+        migrations.AddField(
+            model_name='productrequest',
+            name='pickup_code',
+            field=models.CharField(blank=True, editable=False, help_text='One-time code shown by the requester at pickup', max_length=8, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='PickupSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('capacity', models.PositiveSmallIntegerField()),
+                ('booked', models.PositiveSmallIntegerField(default=0)),
+                ('distribution_center', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pickup_slots', to='api.distributioncenter')),
+            ],
+            options={
+                'ordering': ['starts_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='productrequest',
+            name='pickup_slot',
+            field=models.ForeignKey(blank=True, help_text='Booked automatically when the request becomes Ready', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='requests', to='api.pickupslot'),
+        ),
+        migrations.AddConstraint(
+            model_name='pickupslot',
+            constraint=models.UniqueConstraint(fields=('distribution_center', 'starts_at'), name='pickupslot_center_start'),
+        ),
+        migrations.AddConstraint(
+            model_name='pickupslot',
+            constraint=models.CheckConstraint(condition=models.Q(('booked__lte', models.F('capacity'))), name='pickupslot_within_capacity'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_pickup_slots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Donation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('Pledged', 'Pledged'), ('Received', 'Received'), ('Cancelled', 'Cancelled')], default='Pledged', max_length=20)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('pledged_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('received_at', models.DateTimeField(blank=True, null=True)),
+                ('distribution_center', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='donations', to='api.distributioncenter')),
+                ('donor', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='donations', to=settings.AUTH_USER_MODEL)),
+                ('product_type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='donations', to='api.producttype')),
+                ('received_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-pledged_at'],
+                'indexes': [models.Index(fields=['donor', 'pledged_at'], name='donation_donor_pledged'), models.Index(fields=['distribution_center', 'status', 'pledged_at'], name='donation_center_status')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('quantity__gt', 0)), name='donation_quantity_positive')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DonorTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pledge_count', models.PositiveIntegerField(default=0, help_text='Pledges not cancelled')),
+                ('pledged_quantity', models.PositiveIntegerField(default=0, help_text='Units pledged, not cancelled')),
+                ('received_quantity', models.PositiveIntegerField(default=0, help_text='Units received at a center')),
+                ('last_pledged_at', models.DateTimeField(blank=True, null=True)),
+                ('donor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='donation_totals', to=settings.AUTH_USER_MODEL)),
+                ('product_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.producttype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('donor', 'product_type'), name='donortotal_donor_product')],
+            },
+        ),
+    ]
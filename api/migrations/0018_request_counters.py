@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+OPEN_STATUSES = ('Pending', 'Ready')
+
+
+def backfill_counters(apps, schema_editor):
+    """Set each counter from the existing requests, one correlated UPDATE per table."""
+    alias = schema_editor.connection.alias
+    ProductRequest = apps.get_model('api', 'ProductRequest')
+    requests = ProductRequest.objects.using(alias).order_by()
+
+    def total(foreign_key, condition, aggregate):
+        return Coalesce(Subquery(
+            requests.filter(condition, **{foreign_key: OuterRef('pk')})
+            .values(foreign_key).annotate(value=aggregate).values('value')
+        ), 0)
+
+    apps.get_model('api', 'Organization').objects.using(alias).update(
+        open_request_count=total('requesting_organization', Q(status__in=OPEN_STATUSES), Count('pk'))
+    )
+    apps.get_model('api', 'DistributionCenter').objects.using(alias).update(
+        pending_request_count=total('assigned_distribution_center', Q(status='Pending'), Count('pk'))
+    )
+    apps.get_model('api', 'ProductType').objects.using(alias).update(
+        open_demand_quantity=total('product_type', Q(status__in=OPEN_STATUSES), Sum('quantity'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_donations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='distributioncenter',
+            name='pending_request_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Pending requests assigned here, maintained by api/counters.py'),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='open_request_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Pending and Ready requests, maintained by api/counters.py'),
+        ),
+        migrations.AddField(
+            model_name='producttype',
+            name='open_demand_quantity',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Units asked for by Pending and Ready requests, maintained by api/counters.py'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
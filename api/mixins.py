@@ -0,0 +1,332 @@
+# api/mixins.py
+
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from . import idempotency
+from .exceptions import Conflict, IdempotencyKeyReused, PreconditionFailed, SyncCursorExpired
+from .models import AuditEvent, VersionConflict
+
+
+class NormalizedListMixin:
+    """
+    Adds an optional compact response shape to a list view: `?shape=normalized`.
+
+    Each field in `normalized_fields` (a related object's display name that
+    would otherwise repeat on every row) is replaced by the related id, and
+    the names are sent once per page in a `refs` side table:
+
+        {"results": [{"id": 7, "product_type": 2, ...}],
+         "refs": {"product_types": {"2": "Pads"}}}
+
+    Maps name field -> (foreign key field on the model, refs table name).
+    """
+    normalized_fields = {}
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('shape') != 'normalized' or not self.normalized_fields:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        objects = page if page is not None else list(queryset)
+        rows = self.get_serializer(objects, many=True).data
+
+        refs = {table: {} for _, table in self.normalized_fields.values()}
+        for obj, row in zip(objects, rows):
+            for name_field, (fk_field, table) in self.normalized_fields.items():
+                if name_field not in row:  # Left out with ?fields= / ?exclude=
+                    continue
+                name = row.pop(name_field)
+                fk_id = getattr(obj, f'{fk_field}_id')
+                row[fk_field] = fk_id
+                if fk_id is not None:
+                    refs[table][fk_id] = name
+
+        if page is not None:
+            response = self.get_paginated_response(rows)
+        else:
+            response = Response({'results': rows})
+        response.data['refs'] = refs
+        return response
+
+
+class SparseFieldsetMixin:
+    """
+    Shapes the queryset to what a SparseFieldsetSerializerMixin serializer
+    will render on GET: select_related only the relations still in the
+    output, and with ?fields= / ?exclude= also only() the columns it reads
+    plus `sparse_required_fields`, which the view itself uses.
+    """
+    sparse_required_fields = ()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in ('GET', 'HEAD'):
+            return queryset
+
+        serializer = self.get_serializer()
+        only_fields, related = serializer.get_query_requirements()
+        if serializer.is_sparse and only_fields is not None:
+            # Drop joins the view added for fields that are no longer rendered.
+            queryset = queryset.select_related(None).only(*sorted(only_fields | set(self.sparse_required_fields)))
+        if related:
+            queryset = queryset.select_related(*sorted(related))
+        return queryset
+
+
+class ValuesListMixin:
+    """
+    Serves the plain list response of a read-heavy view from a
+    `.values_list()` query instead of model instances, using the row builder
+    compiled from the view's serializer (see compile_values_rows). The JSON
+    is byte-for-byte what the serializer would produce. Falls back to the
+    regular list when the serializer has fields that need instances.
+    """
+
+    def list(self, request, *args, **kwargs):
+        compiled = self.get_serializer().compile_values_rows()
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+        columns, build_rows = compiled
+
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*columns)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(build_rows(page))
+        return Response(build_rows(queryset))
+
+
+class OptimisticConcurrencyMixin:
+    """
+    ETag / If-Match support for detail views of VersionedModel objects.
+
+    Responses carry `ETag: "<version>"`. A PUT or PATCH with `If-Match` is
+    applied only if the row still has that version; otherwise the response
+    is 412 Precondition Failed. Without `If-Match`, the version read at the
+    start of the request is used, so an edit that raced in between is still
+    never silently overwritten.
+    """
+    sparse_required_fields = ('version',)  # For the ETag
+
+    def get_object(self):
+        obj = super().get_object()
+        if self.request.method in ('PUT', 'PATCH'):
+            expected_version = self.get_if_match_version()
+            if expected_version is not None:
+                if expected_version != obj.version:
+                    raise PreconditionFailed()
+                obj.version = expected_version
+        self._versioned_object = obj
+        return obj
+
+    def get_if_match_version(self):
+        header = self.request.headers.get('If-Match')
+        if not header or header.strip() == '*':
+            return None
+        tag = header.split(',')[0].strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        try:
+            return int(tag.strip('"'))
+        except ValueError:
+            raise ValidationError({'If-Match': 'Expected an ETag returned by this endpoint.'})
+
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except VersionConflict:
+            raise PreconditionFailed()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        obj = getattr(self, '_versioned_object', None)
+        if obj is not None and status.is_success(response.status_code) and request.method != 'DELETE':
+            response['ETag'] = f'"{obj.version}"'
+        return response
+
+
+def format_sync_cursor(moment, pk=None):
+    cursor = moment.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return cursor if pk is None else f"{cursor}~{pk}"
+
+
+def parse_sync_cursor(value):
+    """Return (moment, pk) for a cursor; pk is None unless it ends a capped delta."""
+    value, _, pk = value.strip().partition('~')
+    # An unencoded '+' in a UTC offset arrives as a space.
+    moment = parse_datetime(value.replace(' ', '+'))
+    if moment is None or (pk and not pk.isdigit()):
+        raise ValidationError({'updated_since': 'Expected a sync_cursor or an ISO 8601 timestamp.'})
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment, int(pk) if pk else None
+
+
+class DeltaSyncMixin:
+    """
+    Incremental sync for a list view: `?updated_since=<sync_cursor>`.
+
+    Every list response carries a `sync_cursor`. Passing it back returns
+    only the rows changed since then (oldest change first) and the ids of
+    rows deleted since then, with a new cursor:
+
+        {"results": [...], "deleted": [12, 15], "has_more": false, "sync_cursor": "2025-05-01T09:30:00.000000Z"}
+
+    At most SYNC_MAX_ROWS rows are sent at once. If more changed, `has_more`
+    is true and the cursor points just after the last row sent (its
+    timestamp and id); pass it back until `has_more` is false.
+
+    Cursors never move backwards and trail the clock by
+    SYNC_CURSOR_LAG_SECONDS, so a row may be sent twice but is never missed
+    because its transaction committed late. Clients should upsert by id.
+    Deletions come from the audit log; cursors older than
+    SYNC_CURSOR_MAX_AGE_DAYS get 410 Gone and must fetch the full list.
+
+    `sync_updated_field` is the model's auto_now timestamp and
+    `sync_entity_type` its AuditEvent entity_type.
+    """
+    sync_updated_field = None
+    sync_entity_type = None
+
+    def get_tombstone_filters(self):
+        """Filters on the deleted rows' audited values limiting tombstones to the caller's scope, or None for no tombstones."""
+        return None
+
+    def list(self, request, *args, **kwargs):
+        since_param = request.query_params.get('updated_since')
+        now = timezone.now()
+        cursor = now - timedelta(seconds=settings.SYNC_CURSOR_LAG_SECONDS)
+
+        if since_param is None:
+            response = super().list(request, *args, **kwargs)
+            if isinstance(response.data, dict):
+                response.data['sync_cursor'] = format_sync_cursor(cursor)
+            return response
+
+        since, since_pk = parse_sync_cursor(since_param)
+        if since > now:
+            raise ValidationError({'updated_since': 'Cannot be in the future.'})
+        if since < now - timedelta(days=settings.SYNC_CURSOR_MAX_AGE_DAYS):
+            raise SyncCursorExpired()
+
+        field = self.sync_updated_field
+        queryset = self.filter_queryset(self.get_queryset())
+        if since_pk is None:
+            queryset = queryset.filter(**{f'{field}__gte': since})
+        else:
+            queryset = queryset.filter(Q(**{f'{field}__gt': since}) | Q(**{field: since, 'pk__gt': since_pk}))
+        limit = settings.SYNC_MAX_ROWS
+        instances = list(queryset.order_by(field, 'pk')[:limit + 1])
+        has_more = len(instances) > limit
+        instances = instances[:limit]
+        rows = self.get_serializer(instances, many=True).data
+
+        next_cursor = format_sync_cursor(since, since_pk) if since >= cursor else format_sync_cursor(cursor)
+        if has_more:
+            last = getattr(instances[-1], field)
+            # Past the lag, every change up to the last row has committed, so
+            # resume right after it; otherwise stay on the lagged cursor.
+            if last <= cursor:
+                next_cursor = format_sync_cursor(last, instances[-1].pk)
+
+        deleted = []
+        tombstone_filters = self.get_tombstone_filters()
+        if tombstone_filters is not None:
+            deleted = sorted(set(
+                AuditEvent.objects
+                .filter(
+                    entity_type=self.sync_entity_type,
+                    action=AuditEvent.ACTION_DELETE,
+                    occurred_at__gte=since,
+                    **tombstone_filters,
+                )
+                .values_list('entity_id', flat=True)
+            ))
+
+        return Response({
+            'results': rows,
+            'deleted': deleted,
+            'has_more': has_more,
+            'sync_cursor': next_cursor,
+        })
+
+
+class IdempotentCreateMixin:
+    """
+    `Idempotency-Key` header support for POST endpoints, so a client that
+    retries after a dropped connection does not create the record twice.
+
+    The first successful response for a key is stored (see api/idempotency.py)
+    and a retry with the same key gets it back, marked `Idempotent-Replayed:
+    true`, without running the view again. A duplicate that arrives while
+    the first is still running waits for it. Failed requests are not stored,
+    so they can be retried with the same key. Reusing a key for a different
+    payload is 422.
+
+    Keys are per user. Anonymous callers are told apart by the request
+    field named in `idempotency_anonymous_owner_field`, or else by their
+    address, so unrelated clients picking the same key don't collide.
+    Views whose responses carry credentials set
+    `idempotency_response_has_credentials`, which keeps them in the cache
+    for IDEMPOTENCY_CREDENTIALS_TTL_SECONDS only.
+    """
+    max_idempotency_key_length = 255
+    idempotency_anonymous_owner_field = None
+    idempotency_response_has_credentials = False
+
+    def get_idempotency_owner(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        field = self.idempotency_anonymous_owner_field
+        if field and isinstance(request.data.get(field), str):
+            return f'anon-{field}:{request.data[field]}'
+        return f"anon-address:{request.META.get('REMOTE_ADDR', '')}"
+
+    def post(self, request, *args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+        if not idempotency_key:
+            return super().post(request, *args, **kwargs)
+        if len(idempotency_key) > self.max_idempotency_key_length:
+            raise ValidationError({'Idempotency-Key': f'Must be at most {self.max_idempotency_key_length} characters.'})
+
+        digest = idempotency.key_digest(self.get_idempotency_owner(request), idempotency_key)
+        fingerprint = idempotency.request_fingerprint(request)
+        while not idempotency.acquire(digest):
+            try:
+                stored = idempotency.wait_for_response(digest)
+            except TimeoutError:
+                raise Conflict('A request with this Idempotency-Key is still being processed. Retry later.')
+            if stored is not None:
+                return self.replay_response(stored, fingerprint)
+            # The first request failed and released the key; try to run it here.
+
+        try:
+            # Checked under the lock, so a request that finished just before is replayed.
+            stored = idempotency.get_stored_response(digest)
+            if stored is not None:
+                return self.replay_response(stored, fingerprint)
+            response = super().post(request, *args, **kwargs)
+            if status.is_success(response.status_code):
+                idempotency.store_response(digest, fingerprint, response, (
+                    settings.IDEMPOTENCY_CREDENTIALS_TTL_SECONDS if self.idempotency_response_has_credentials
+                    else settings.IDEMPOTENCY_KEY_TTL_SECONDS
+                ))
+            return response
+        finally:
+            idempotency.release(digest)
+
+    def replay_response(self, stored, fingerprint):
+        if stored['fingerprint'] != fingerprint:
+            raise IdempotencyKeyReused()
+        headers = {'Idempotent-Replayed': 'true'}
+        if stored['location']:
+            headers['Location'] = stored['location']
+        return Response(stored['data'], status=stored['status'], headers=headers)
@@ -1,6 +1,12 @@
 # api/models.py
 
-from django.db import models
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.contrib.auth import get_user_model # Import standard User model
 from django.core.exceptions import ValidationError
 from django.db.models.signals import post_save # Import signal
@@ -48,28 +54,60 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"Profile for {self.user.username} ({self.get_role_display()})"
 
-# --- Signal to create UserProfile automatically when a new User is created ---
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
+# --- Signal to create the UserProfile and auth Token when a new User is created ---
+# One receiver for both, so every way of creating a user (registration, admin,
+# createsuperuser) gets them. A brand-new user can't have either yet, so this
+# is two INSERTs, no lookups. Creating them with user=instance also caches them
+# on the instance, so `user.profile` / `user.auth_token` don't query again.
+# api/registration.py runs this inside the sign-up transaction.
+@receiver(post_save, sender=User, dispatch_uid='provision_new_user')
+def provision_new_user(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
+        Token.objects.create(user=instance)
+
+class AuditedModel(models.Model):
+    """
+    Abstract base for models whose changes are written to AuditEvent.
+
+    Remembers the loaded values of `audit_fields` (attnames) so the audit
+    receivers in api/audit.py can record what an update changed.
+    """
+    audit_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._audit_snapshot = {
+            field: instance.__dict__[field] for field in cls.audit_fields if field in instance.__dict__
+        }
+        return instance
+
+
+class CountedModel(models.Model):
+    """
+    Abstract base for models carrying denormalized counters (`counter_fields`).
+
+    Counters only change through `UPDATE ... SET n = n + <delta>` in
+    api/counters.py, in the same transaction as the change they count. save()
+    leaves them out of its UPDATE, so writing back an instance loaded
+    earlier never undoes increments made since.
+    """
+    counter_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        values = [value for value in values if value[0].name not in self.counter_fields]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
 
-# --- No save_user_profile signal needed ---
-# --- ADD Signal to create Auth Token automatically ---
-# This signal is triggered AFTER a User object is saved.
-# It runs IN ADDITION TO the create_user_profile signal.
-@receiver(post_save, sender=User)
-def create_auth_token(sender, instance=None, created=False, **kwargs):
-    if created:
-        # Check if a token already exists for this user (shouldn't for new users created here)
-        # This check is mostly for safety if you have existing users or rerun migrations oddly.
-        if not Token.objects.filter(user=instance).exists():
-            Token.objects.create(user=instance)
-            print(f"Auth Token created for new user: {instance.username}") # Optional debug log
-# *** END ADD Signal ***
 
 # Update Organization and DistributionCenter to link to UserProfile (Keep existing)
-class Organization(models.Model):
+class Organization(CountedModel, AuditedModel):
     admin_profile = models.OneToOneField(
         UserProfile,
         on_delete=models.SET_NULL,
@@ -82,14 +120,24 @@ class Organization(models.Model):
     contact_email = models.EmailField(blank=True)
     contact_phone = models.CharField(max_length=20, blank=True)
     is_verified = models.BooleanField(default=False)
+    open_request_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text="Pending and Ready requests, maintained by api/counters.py"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    audit_fields = (
+        'admin_profile_id', 'name', 'location', 'contact_person',
+        'contact_email', 'contact_phone', 'is_verified',
+    )
+    counter_fields = ('open_request_count',)
+
 
     def __str__(self):
         return f"{self.name} ({self.location})"
 
-class DistributionCenter(models.Model):
+class DistributionCenter(CountedModel, AuditedModel):
     admin_profile = models.OneToOneField(
         UserProfile,
         on_delete=models.SET_NULL,
@@ -101,14 +149,70 @@ class DistributionCenter(models.Model):
     contact_email = models.EmailField(blank=True)
     contact_phone = models.CharField(max_length=20, blank=True)
     operating_hours = models.CharField(max_length=150, blank=True, help_text="e.g., Mon-Fri 9am-5pm")
+    pickup_slot_capacity = models.PositiveSmallIntegerField(
+        default=10,
+        help_text="Pickups per slot; slots are cut from the operating hours (api/pickups.py)"
+    )
+    pending_request_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text="Pending requests assigned here, maintained by api/counters.py"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    audit_fields = (
+        'admin_profile_id', 'name', 'location', 'contact_email',
+        'contact_phone', 'operating_hours',
+    )
+    counter_fields = ('pending_request_count',)
+
 
     def __str__(self):
         return f"{self.name} ({self.location})"
 
 
+class VersionConflict(Exception):
+    """Raised when saving a VersionedModel whose row was changed by someone else since it was read."""
+
+
+class InsufficientStock(VersionConflict):
+    """Raised when fulfilling requests would take more units than a center has on hand."""
+
+
+class VersionedModel(models.Model):
+    """
+    Abstract base adding optimistic concurrency control.
+
+    Every UPDATE is issued as `UPDATE ... SET version = version + 1 WHERE
+    id = <pk> AND version = <self.version>`. If another writer got there
+    first no row matches and VersionConflict is raised, instead of silently
+    overwriting their change.
+
+    Queryset `.update()` calls bypass save(); include
+    `version=F('version') + 1` in them so concurrent editors notice.
+    """
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        version_field = self._meta.get_field('version')
+        values = [value for value in values if value[0] is not version_field]
+        values.append((version_field, None, F('version') + 1))
+
+        if base_qs.filter(pk=pk_val, version=self.version)._update(values) > 0:
+            self.version += 1
+            return True
+        if base_qs.filter(pk=pk_val).exists():
+            raise VersionConflict(
+                f"{self._meta.object_name} {pk_val} was modified by another request (expected version {self.version})."
+            )
+        # Row no longer exists: let save() fall back to INSERT as usual.
+        self._reinserted = True
+        return False
+
+
 # Choices for Product Request Status (Keep existing)
 REQUEST_STATUS_CHOICES = [
     ('Pending', 'Pending'),
@@ -117,27 +221,68 @@ REQUEST_STATUS_CHOICES = [
     ('Cancelled', 'Cancelled'),
 ]
 
-class ProductType(models.Model):
+# Allowed status changes: current status -> statuses it may move to.
+# Fulfilled and Cancelled are final.
+REQUEST_STATUS_TRANSITIONS = {
+    'Pending': {'Ready', 'Cancelled'},
+    'Ready': {'Fulfilled', 'Cancelled', 'Pending'},
+    'Fulfilled': set(),
+    'Cancelled': set(),
+}
+
+
+def can_transition_request(from_status, to_status):
+    return to_status in REQUEST_STATUS_TRANSITIONS.get(from_status, ())
+
+class ProductType(CountedModel):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    open_demand_quantity = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text="Units asked for by Pending and Ready requests, maintained by api/counters.py"
+    )
+
+    counter_fields = ('open_demand_quantity',)
 
     def __str__(self):
         return self.name
 
-class InventoryItem(models.Model):
+class InventoryItem(AuditedModel, VersionedModel):
     distribution_center = models.ForeignKey(DistributionCenter, on_delete=models.CASCADE, related_name='inventory_items')
     product_type = models.ForeignKey(ProductType, on_delete=models.CASCADE, related_name='inventory_entries')
     quantity = models.PositiveIntegerField(default=0)
+    reorder_threshold = models.PositiveIntegerField(
+        default=0,
+        help_text="Raise a low-stock alert when quantity is at or below this level (0 disables)."
+    )
     last_updated = models.DateTimeField(auto_now=True)
 
+    audit_fields = ('distribution_center_id', 'product_type_id', 'quantity', 'reorder_threshold')
+
     class Meta:
         unique_together = ('distribution_center', 'product_type')
         verbose_name_plural = "Inventory Items"
+        # Delta sync (?updated_since=) for all inventory and per center.
+        indexes = [
+            models.Index(fields=['last_updated'], name='inventoryitem_last_updated'),
+            models.Index(fields=['distribution_center', 'last_updated'], name='inventoryitem_center_updated'),
+        ]
 
     def __str__(self):
         return f"{self.quantity} x {self.product_type.name} at {self.distribution_center.name}"
 
-class ProductRequest(models.Model):
+    def is_low_stock(self):
+        return self.reorder_threshold > 0 and self.quantity <= self.reorder_threshold
+
+    def save(self, *args, **kwargs):
+        previous = getattr(self, '_audit_snapshot', {})
+        super().save(*args, **kwargs)
+        # Only a change to quantity or threshold can change the alert state.
+        if (previous.get('quantity'), previous.get('reorder_threshold')) != (self.quantity, self.reorder_threshold):
+            from .alerts import sync_low_stock_alert
+            sync_low_stock_alert(self, previous.get('quantity'), previous.get('reorder_threshold'))
+
+class ProductRequest(AuditedModel, VersionedModel):
     # --- Requester Information (Keep existing) ---
     requesting_organization = models.ForeignKey(
         Organization,
@@ -172,16 +317,80 @@ class ProductRequest(models.Model):
         related_name='assigned_requests'
     )
     pickup_details = models.TextField(blank=True, help_text="Instructions for pickup, e.g., date/time/code")
+    pickup_slot = models.ForeignKey(
+        'PickupSlot',
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='requests',
+        help_text="Booked automatically when the request becomes Ready"
+    )
+    pickup_code = models.CharField(
+        max_length=8,
+        unique=True,
+        null=True, blank=True,
+        editable=False,
+        help_text="One-time code shown by the requester at pickup"
+    )
+    allocated_quantity = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Units set aside by fair-share allocation when stock is short (api/allocation.py); empty means the full quantity"
+    )
+    suspected_duplicate = models.BooleanField(
+        default=False,
+        help_text="Set when the same requester asked for the same product and quantity shortly before (api/duplicates.py)"
+    )
 
     # Timestamps (Keep existing)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    audit_fields = (
+        'requesting_organization_id', 'requester_user_id', 'requester_phone_number',
+        'product_type_id', 'quantity', 'status', 'assigned_distribution_center_id', 'pickup_details',
+        'allocated_quantity', 'suspected_duplicate', 'pickup_slot_id', 'pickup_code',
+    )
+
+    class Meta:
+        # Delta sync (?updated_since=) for staff, organization admins and individuals.
+        indexes = [
+            models.Index(fields=['updated_at'], name='productrequest_updated_at'),
+            models.Index(fields=['requesting_organization', 'updated_at'], name='productrequest_org_updated'),
+            models.Index(fields=['requester_user', 'updated_at'], name='productrequest_user_updated'),
+        ]
+        # Enforced by the database, so bulk_create() and update() are covered too.
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(requesting_organization__isnull=False, requester_user__isnull=True)
+                    & (models.Q(requester_phone_number__isnull=True) | models.Q(requester_phone_number=''))
+                ) | (
+                    models.Q(requesting_organization__isnull=True, requester_user__isnull=False)
+                    & (models.Q(requester_phone_number__isnull=True) | models.Q(requester_phone_number=''))
+                ) | (
+                    models.Q(requesting_organization__isnull=True, requester_user__isnull=True)
+                    & models.Q(requester_phone_number__isnull=False)
+                    & ~models.Q(requester_phone_number='')
+                ),
+                name='productrequest_exactly_one_requester',
+                violation_error_message="A request must have exactly one requester (Organization, User, or Phone Number).",
+            ),
+            models.CheckConstraint(
+                condition=models.Q(status__in=[choice for choice, _ in REQUEST_STATUS_CHOICES]),
+                name='productrequest_valid_status',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(allocated_quantity__isnull=True) | models.Q(allocated_quantity__lte=models.F('quantity')),
+                name='productrequest_allocation_within_quantity',
+            ),
+        ]
+
     # --- Model Validation (Keep existing) ---
     def clean(self):
+        # Also enforced by the productrequest_exactly_one_requester constraint;
+        # checked here for friendlier form errors. Uses the ids, so no queries.
         requester_fields_set = [
-            self.requesting_organization is not None,
-            self.requester_user is not None,
+            self.requesting_organization_id is not None,
+            self.requester_user_id is not None,
             self.requester_phone_number not in [None, '']
         ]
         num_requesters_set = sum(requester_fields_set)
@@ -191,9 +400,140 @@ class ProductRequest(models.Model):
         if num_requesters_set > 1:
             raise ValidationError("A request cannot have multiple primary requester types.")
 
+        self.validate_status_transition()
+
+    def validate_status_transition(self):
+        loaded_status = getattr(self, '_loaded_status', None)
+        if loaded_status and self.status != loaded_status and not can_transition_request(loaded_status, self.status):
+            raise ValidationError({'status': f"Cannot change status from '{loaded_status}' to '{self.status}'."})
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so clean() can validate the transition.
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     def save(self, *args, **kwargs):
-        self.clean()
-        super().save(*args, **kwargs)
+        # The requester and status rules are database constraints; only the
+        # transition rule needs the previously loaded status.
+        self.validate_status_transition()
+        from_status = getattr(self, '_loaded_status', None)
+        # Entering or leaving Ready books or frees a pickup slot along with the change.
+        pickup_changed = self.status != from_status and 'Ready' in (from_status, self.status)
+        from .counters import counter_deltas, request_state
+        before = None if self._state.adding else request_state(self, getattr(self, '_audit_snapshot', {}))
+        after = request_state(self)
+        self._reinserted = False
+        with transaction.atomic() if pickup_changed or before != after else nullcontext():
+            if pickup_changed:
+                from .pickups import sync_pickup
+                sync_pickup(self, from_status)
+            super().save(*args, **kwargs)
+            if from_status and self.status != from_status:
+                ProductRequestStatusLog.objects.create(
+                    product_request=self, from_status=from_status, to_status=self.status
+                )
+            # Deleted meanwhile and written back as a new row: its old
+            # contribution went with the delete, so count it afresh.
+            counter_deltas(None if self._reinserted else before, after).apply()
+            if from_status and from_status != self.status == 'Fulfilled' and self.assigned_distribution_center_id:
+                # Handed over: the units leave the center's inventory.
+                from .pickups import consume_stock
+                consume_stock({
+                    (self.assigned_distribution_center_id, self.product_type_id): self.allocated_quantity or self.quantity,
+                })
+        self._loaded_status = self.status
+
+    @classmethod
+    def bulk_transition(cls, queryset, ids, to_status, changed_by=None):
+        """
+        Move every request in `ids` to `to_status`, all or nothing.
+
+        `queryset` is the set of requests the caller may change. Validation is
+        one SELECT ... FOR UPDATE over all ids; the change is one UPDATE ... WHERE id IN (...)
+        AND status = <from> per distinct current status (usually just one),
+        plus one counter UPDATE per counted model (api/counters.py), and the
+        status log rows are written with a single bulk_create. Moving to
+        Fulfilled also takes the units handed over off the centers' inventory.
+
+        Raises ValidationError for unknown ids or disallowed transitions,
+        VersionConflict if another request changed one of the rows meanwhile,
+        and InsufficientStock if a center hasn't got the units on hand.
+        Returns the sorted list of updated ids.
+        """
+        from .audit import record_event
+        from .counters import CounterDeltas
+        from .duplicates import INACTIVE_STATUSES, update_index_on_commit
+        from .events import publish_on_commit, request_scopes
+
+        ids = set(ids)
+        now = timezone.now()
+        with transaction.atomic():
+            # Locked, so the counter changes below match the rows being updated.
+            rows = queryset.select_for_update(of=('self',)).filter(pk__in=ids).values_list(
+                'pk', 'status', 'requesting_organization_id', 'requester_user_id', 'assigned_distribution_center_id',
+                'product_type_id', 'quantity', 'allocated_quantity', 'requester_phone_number', 'created_at',
+            )
+            current = {}
+            scopes = {}
+            fingerprints = {}
+            counts = CounterDeltas()
+            consumed = Counter()
+            for pk, status, organization_id, user_id, center_id, product_type_id, quantity, allocated, phone, created_at in rows:
+                current[pk] = status
+                scopes[pk] = (organization_id, user_id, center_id)
+                fingerprints[pk] = (user_id, phone, product_type_id, quantity, created_at)
+                if to_status == 'Fulfilled' and status != 'Fulfilled' and center_id is not None:
+                    consumed[(center_id, product_type_id)] += allocated or quantity
+                counts.add((status, organization_id, center_id, product_type_id, quantity), -1)
+                counts.add((to_status, organization_id, center_id, product_type_id, quantity))
+
+            missing = sorted(ids - current.keys())
+            if missing:
+                raise ValidationError({'ids': f"Requests not found: {missing}"})
+            invalid = sorted(pk for pk, status in current.items() if not can_transition_request(status, to_status))
+            if invalid:
+                raise ValidationError({'ids': f"Cannot move requests {invalid} to '{to_status}' from their current status."})
+
+            ids_by_status = defaultdict(list)
+            for pk, status in current.items():
+                ids_by_status[status].append(pk)
+
+            for from_status, pks in ids_by_status.items():
+                updated = cls.objects.filter(pk__in=pks, status=from_status).update(
+                    status=to_status, updated_at=now, version=F('version') + 1
+                )
+                if updated != len(pks):
+                    raise VersionConflict("Some requests changed status while being updated.")
+            counts.apply()
+            if consumed:
+                # Handed over: the units leave the centers' inventory.
+                from .pickups import consume_stock
+                consume_stock(consumed, changed_by=changed_by)
+            if to_status == 'Ready' or ids_by_status.get('Ready'):
+                from .pickups import sync_pickups
+                sync_pickups({pk: (current[pk], scopes[pk][2]) for pk in current}, to_status)
+            ProductRequestStatusLog.objects.bulk_create([
+                ProductRequestStatusLog(
+                    product_request_id=pk, from_status=current[pk], to_status=to_status,
+                    changed_by=changed_by, changed_at=now,
+                )
+                for pk in current
+            ])
+            # .update() sends no post_save, so update the duplicate index and record the audit events here.
+            for pk, from_status in current.items():
+                if to_status in INACTIVE_STATUSES and from_status not in INACTIVE_STATUSES:
+                    update_index_on_commit('discard', pk, *fingerprints[pk])
+                record_event(
+                    cls, pk, AuditEvent.ACTION_STATUS_CHANGE,
+                    {'status': [from_status, to_status]}, actor=changed_by, occurred_at=now,
+                )
+                publish_on_commit(
+                    'product_request', pk, 'update', request_scopes(*scopes[pk]),
+                    {'status': to_status, 'updated_at': now.isoformat()},
+                )
+        return sorted(current)
 
     def __str__(self):
         requester = "Unknown Requester Type"
@@ -203,4 +543,288 @@ class ProductRequest(models.Model):
             requester = f"User: {self.requester_user.username}"
         elif self.requester_phone_number:
             requester = f"SMS: {self.requester_phone_number}"
-        return f"Request for {self.quantity} x {self.product_type.name} by {requester} ({self.status})"
\ No newline at end of file
+        return f"Request for {self.quantity} x {self.product_type.name} by {requester} ({self.status})"
+
+
+class ProductRequestStatusLog(models.Model):
+    """Append-only history of ProductRequest status changes."""
+    product_request = models.ForeignKey(ProductRequest, on_delete=models.CASCADE, related_name='status_log')
+    from_status = models.CharField(max_length=20, choices=REQUEST_STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=REQUEST_STATUS_CHOICES)
+    changed_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='+'
+    )
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['changed_at']
+        indexes = [models.Index(fields=['product_request', 'changed_at'])]
+
+    def __str__(self):
+        return f"Request {self.product_request_id}: {self.from_status} -> {self.to_status}"
+
+
+class PickupSlot(models.Model):
+    """
+    A pickup window at a center, cut from its operating hours (api/pickups.py).
+    `booked` counts the Ready requests holding the slot and never exceeds `capacity`.
+    """
+    distribution_center = models.ForeignKey(DistributionCenter, on_delete=models.CASCADE, related_name='pickup_slots')
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    capacity = models.PositiveSmallIntegerField()
+    booked = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ['starts_at']
+        constraints = [
+            # Also the index for finding a center's next open slots.
+            models.UniqueConstraint(fields=['distribution_center', 'starts_at'], name='pickupslot_center_start'),
+            models.CheckConstraint(condition=models.Q(booked__lte=models.F('capacity')), name='pickupslot_within_capacity'),
+        ]
+
+    def __str__(self):
+        return f"{self.distribution_center_id} {self.starts_at:%Y-%m-%d %H:%M} ({self.booked}/{self.capacity})"
+
+
+DONATION_STATUS_CHOICES = [
+    ('Pledged', 'Pledged'),
+    ('Received', 'Received'),
+    ('Cancelled', 'Cancelled'),
+]
+
+DONATION_STATUS_TRANSITIONS = {
+    'Pledged': {'Received', 'Cancelled'},
+    'Received': set(),
+    'Cancelled': set(),
+}
+
+
+class Donation(models.Model):
+    """
+    One pledge of products to a distribution center, in the donation ledger.
+
+    Rows are written in batches and change status with queryset updates
+    (api/donations.py), which also credit the center's inventory on receipt
+    and keep DonorTotal current.
+    """
+    donor = models.ForeignKey(User, on_delete=models.PROTECT, related_name='donations')
+    product_type = models.ForeignKey(ProductType, on_delete=models.PROTECT, related_name='donations')
+    distribution_center = models.ForeignKey(DistributionCenter, on_delete=models.PROTECT, related_name='donations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=DONATION_STATUS_CHOICES, default='Pledged')
+    note = models.CharField(max_length=255, blank=True)
+    pledged_at = models.DateTimeField(default=timezone.now)
+    received_at = models.DateTimeField(null=True, blank=True)
+    received_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='+'
+    )
+
+    class Meta:
+        ordering = ['-pledged_at']
+        constraints = [
+            models.CheckConstraint(condition=models.Q(quantity__gt=0), name='donation_quantity_positive'),
+        ]
+        indexes = [
+            # A donor's ledger, and a center's incoming pledges.
+            models.Index(fields=['donor', 'pledged_at'], name='donation_donor_pledged'),
+            models.Index(fields=['distribution_center', 'status', 'pledged_at'], name='donation_center_status'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_type_id} from donor {self.donor_id} ({self.status})"
+
+
+class DonorTotal(models.Model):
+    """
+    Running totals of one donor's donations of one product type, so a donor
+    summary reads a handful of rows instead of aggregating the ledger.
+    Maintained by api/donations.py; `recount_donor_totals()` rebuilds them.
+    """
+    donor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='donation_totals')
+    product_type = models.ForeignKey(ProductType, on_delete=models.CASCADE, related_name='+')
+    pledge_count = models.PositiveIntegerField(default=0, help_text="Pledges not cancelled")
+    pledged_quantity = models.PositiveIntegerField(default=0, help_text="Units pledged, not cancelled")
+    received_quantity = models.PositiveIntegerField(default=0, help_text="Units received at a center")
+    last_pledged_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['donor', 'product_type'], name='donortotal_donor_product'),
+        ]
+
+    def __str__(self):
+        return f"Donor {self.donor_id}, product {self.product_type_id}: {self.received_quantity}/{self.pledged_quantity}"
+
+
+class AuditEvent(models.Model):
+    """
+    Append-only record of a create, update, status change or delete.
+
+    Written in batches after commit by api/audit.py. Both indexes lead with
+    columns that grow over time, so history lookups and range scans for
+    archiving stay cheap as the table grows (and map directly onto
+    occurred_at range partitions on PostgreSQL).
+    """
+    ACTION_CREATE = 'create'
+    ACTION_UPDATE = 'update'
+    ACTION_STATUS_CHANGE = 'status_change'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = [
+        (ACTION_CREATE, 'Create'),
+        (ACTION_UPDATE, 'Update'),
+        (ACTION_STATUS_CHANGE, 'Status change'),
+        (ACTION_DELETE, 'Delete'),
+    ]
+
+    entity_type = models.CharField(max_length=50, help_text="Lower-case model name, e.g. 'productrequest'")
+    entity_id = models.BigIntegerField()
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    changes = models.JSONField(
+        default=dict, blank=True, encoder=DjangoJSONEncoder,
+        help_text="Field values on create, {field: [old, new]} on update"
+    )
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='+'
+    )
+    occurred_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['occurred_at']
+        indexes = [
+            models.Index(fields=['entity_type', 'entity_id', 'occurred_at'], name='auditevent_entity_history'),
+            models.Index(fields=['occurred_at'], name='auditevent_occurred_at'),
+        ]
+
+    def __str__(self):
+        return f"{self.action} {self.entity_type} {self.entity_id} at {self.occurred_at:%Y-%m-%d %H:%M:%S}"
+
+
+class InventorySnapshot(models.Model):
+    """
+    Daily stock level of one product at one center.
+
+    One narrow row per (center, product, day), written by the
+    `snapshot_inventory` management command. api/forecasting.py loads these
+    into a dense center x product x day array.
+    """
+    distribution_center = models.ForeignKey(DistributionCenter, on_delete=models.CASCADE, related_name='+')
+    product_type = models.ForeignKey(ProductType, on_delete=models.CASCADE, related_name='+')
+    taken_on = models.DateField()
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['distribution_center', 'product_type', 'taken_on'],
+                name='unique_inventory_snapshot_per_day',
+            ),
+        ]
+        indexes = [models.Index(fields=['taken_on'], name='inventorysnapshot_taken_on')]
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_type_id} at center {self.distribution_center_id} on {self.taken_on}"
+
+
+class LowStockAlert(models.Model):
+    """
+    An inventory item at or below its reorder threshold.
+
+    Open alerts (resolved_at is NULL) form the materialized low-stock set;
+    at most one is open per item. Maintained by api/alerts.py whenever an
+    item's quantity or threshold changes.
+    """
+    inventory_item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='low_stock_alerts')
+    distribution_center = models.ForeignKey(DistributionCenter, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField(help_text="Quantity when the alert was raised")
+    reorder_threshold = models.PositiveIntegerField()
+    raised_at = models.DateTimeField(default=timezone.now)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['inventory_item'],
+                condition=models.Q(resolved_at__isnull=True),
+                name='one_open_low_stock_alert_per_item',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['distribution_center', 'raised_at'],
+                condition=models.Q(resolved_at__isnull=True),
+                name='lowstockalert_open_by_center',
+            ),
+        ]
+
+    def __str__(self):
+        state = 'resolved' if self.resolved_at else 'open'
+        return f"Low stock ({state}): item {self.inventory_item_id}, {self.quantity} <= {self.reorder_threshold}"
+
+
+TASK_STATUS_CHOICES = [
+    ('Queued', 'Queued'),
+    ('Running', 'Running'),
+    ('Succeeded', 'Succeeded'),
+    ('Failed', 'Failed'),
+]
+
+
+class Task(models.Model):
+    """
+    A unit of deferred work in the database-backed task queue (api/tasks.py).
+
+    Workers (`manage.py run_workers`) claim Queued rows whose run_at has
+    passed, run the registered function `name` with `args`/`kwargs`, and
+    either mark them Succeeded or re-queue them with a backoff until
+    max_attempts is reached. At most one Queued or Running task exists per
+    non-empty `key`, which is how periodic jobs avoid piling up.
+    """
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    key = models.CharField(max_length=200, blank=True, help_text="Deduplication key; blank for none")
+    status = models.CharField(max_length=20, choices=TASK_STATUS_CHOICES, default='Queued')
+    priority = models.SmallIntegerField(default=0, help_text="Higher runs first")
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=1)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=models.Q(status__in=['Queued', 'Running']) & ~models.Q(key=''),
+                name='task_one_active_per_key',
+            ),
+        ]
+        indexes = [
+            # The workers' claim query, and finding stuck Running tasks.
+            models.Index(
+                fields=['-priority', 'run_at'],
+                condition=models.Q(status='Queued'),
+                name='task_queued_due',
+            ),
+            models.Index(
+                fields=['locked_at'],
+                condition=models.Q(status='Running'),
+                name='task_running_locked',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
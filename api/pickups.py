@@ -0,0 +1,366 @@
+# api/pickups.py
+"""
+Pickup slots and one-time pickup codes.
+
+Each center's week is cut into PICKUP_SLOT_MINUTES slots from its
+operating_hours text ("Mon-Fri 9am-5pm; Sat 10am-2pm"), falling back to
+PICKUP_DEFAULT_HOURS when the text can't be read. PickupSlot rows are
+created lazily for the next PICKUP_HORIZON_DAYS, the first time a center
+runs out of open slots.
+
+When a request becomes Ready it books the earliest slot with room (at least
+PICKUP_LEAD_MINUTES ahead) at its assigned center and gets a short pickup
+code, stored in a unique (so indexed) column. Booking is a conditional
+UPDATE on the slot's counter, so concurrent bookings never overfill it.
+Leaving Ready for Pending or Cancelled frees the slot and voids the code.
+
+At the counter, redeem_pickup_code() confirms and fulfils a request: one
+indexed lookup, then a short transaction around one conditional UPDATE that
+also keeps the counters, takes the handed-over units off the center's
+inventory (consume_stock) and logs the status change. The audit event and
+the low-stock alert check are written after it commits.
+"""
+
+import re
+import secrets
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+from itertools import zip_longest
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (
+    AuditEvent,
+    DistributionCenter,
+    InsufficientStock,
+    InventoryItem,
+    PickupSlot,
+    ProductRequest,
+    ProductRequestStatusLog,
+    VersionConflict,
+)
+
+# No 0/O, 1/I/L: codes are read out loud and typed in by hand.
+PICKUP_CODE_ALPHABET = '23456789ABCDEFGHJKMNPQRSTUVWXYZ'
+
+DAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+DAY_ALIASES = {
+    'daily': range(7),
+    'everyday': range(7),
+    'every day': range(7),
+    'weekdays': range(5),
+    'weekends': range(5, 7),
+}
+_DAY = r'(mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?'
+_TIME = r'(\d{1,2})(?:[:.](\d{2}))?\s*(?:([ap])\.?m\.?)?'
+_TO = r'\s*(?:-|–|to)\s*'
+HOURS_TOKEN_RE = re.compile(
+    rf'(?P<closed>closed)'
+    rf'|(?P<alias>{"|".join(DAY_ALIASES)})'
+    rf'|(?P<times>{_TIME}{_TO}{_TIME})'
+    rf'|(?P<days>{_DAY}(?:{_TO}{_DAY})?)',
+    re.IGNORECASE,
+)
+
+
+def _minutes(hour, minute, meridiem):
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.lower() == 'p' else 0)
+    return hour * 60 + minute
+
+
+def _time_range(match):
+    # Groups 4-9: start hour, minute, am/pm, then the same for the end.
+    start_hour, start_minute, start_meridiem, end_hour, end_minute, end_meridiem = match.groups()[3:9]
+    if end_meridiem and not start_meridiem:
+        # "9-5pm" is 9am-5pm, "1-5pm" is 1pm-5pm.
+        start = _minutes(start_hour, start_minute, end_meridiem)
+        if start >= _minutes(end_hour, end_minute, end_meridiem):
+            start = _minutes(start_hour, start_minute, 'a')
+    else:
+        start = _minutes(start_hour, start_minute, start_meridiem)
+    end = _minutes(end_hour, end_minute, end_meridiem)
+    if end <= start and not end_meridiem and end < 12 * 60:
+        end += 12 * 60  # "9-5" means 9:00-17:00
+    return start, end
+
+
+def parse_operating_hours(text):
+    """
+    Read opening hours text into {weekday (0 = Monday): [(start, end) minutes]}.
+
+    Day names, ranges and aliases apply to the time ranges that follow them;
+    a time range with no days before it applies to every day, and "closed"
+    drops the days before it. Returns {} if nothing could be read.
+    """
+    hours = defaultdict(list)
+    days, previous_days = [], None
+    for match in HOURS_TOKEN_RE.finditer(text or ''):
+        if match.group('closed'):
+            days, previous_days = [], None
+        elif match.group('alias'):
+            days.extend(DAY_ALIASES[match.group('alias').lower()])
+        elif match.group('days'):
+            first, last = match.group(11), match.group(12)
+            start = DAY_NAMES.index(first.lower())
+            end = DAY_NAMES.index(last.lower()) if last else start
+            days.extend((start + offset) % 7 for offset in range((end - start) % 7 + 1))
+        else:
+            start, end = _time_range(match)
+            # "Mon-Fri 9am-12pm, 2pm-5pm": a second range keeps the same days.
+            days = days or previous_days or list(range(7))
+            if 0 <= start < end <= 24 * 60:
+                for day in days:
+                    hours[day].append((start, end))
+            days, previous_days = [], days
+    return dict(hours)
+
+
+def center_hours(operating_hours):
+    return parse_operating_hours(operating_hours) or parse_operating_hours(settings.PICKUP_DEFAULT_HOURS)
+
+
+def slot_times(hours, earliest, days, slot_minutes):
+    """Yield (starts_at, ends_at) for every slot from `earliest` over the next `days` days."""
+    tz = timezone.get_current_timezone()
+    first_day = timezone.localtime(earliest, tz).date()
+    length = timedelta(minutes=slot_minutes)
+    for offset in range(days + 1):
+        day = first_day + timedelta(days=offset)
+        midnight = datetime.combine(day, time())
+        for start, end in sorted(hours.get(day.weekday(), ())):
+            for minute in range(start, end - slot_minutes + 1, slot_minutes):
+                starts_at = timezone.make_aware(midnight + timedelta(minutes=minute), tz)
+                if starts_at >= earliest:
+                    yield starts_at, starts_at + length
+
+
+def ensure_slots(center_id, earliest):
+    """Create the center's missing PickupSlot rows for the booking horizon."""
+    center = DistributionCenter.objects.values('operating_hours', 'pickup_slot_capacity').get(pk=center_id)
+    PickupSlot.objects.bulk_create(
+        [
+            PickupSlot(
+                distribution_center_id=center_id, starts_at=starts_at, ends_at=ends_at,
+                capacity=center['pickup_slot_capacity'],
+            )
+            for starts_at, ends_at in slot_times(
+                center_hours(center['operating_hours']), earliest,
+                settings.PICKUP_HORIZON_DAYS, settings.PICKUP_SLOT_MINUTES,
+            )
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def book_slots(center_id, count, earliest=None):
+    """
+    Book `count` places in the center's earliest open slots. Returns one slot
+    id per place booked, fewer than `count` if the horizon is full.
+    """
+    earliest = earliest or timezone.now() + timedelta(minutes=settings.PICKUP_LEAD_MINUTES)
+    booked = []
+    for attempt in range(2):
+        open_slots = (
+            PickupSlot.objects
+            .filter(distribution_center_id=center_id, starts_at__gte=earliest, booked__lt=F('capacity'))
+            .order_by('starts_at')
+            .values_list('pk', 'capacity', 'booked')[:count - len(booked)]
+        )
+        for pk, capacity, already_booked in open_slots:
+            take = min(capacity - already_booked, count - len(booked))
+            # Only applies if the slot still has room for all of them.
+            if PickupSlot.objects.filter(pk=pk, booked__lte=capacity - take).update(booked=F('booked') + take):
+                booked.extend([pk] * take)
+            if len(booked) == count:
+                return booked
+        if attempt == 0:
+            ensure_slots(center_id, earliest)
+    return booked
+
+
+def release_slots(slot_ids):
+    for slot_id, count in Counter(pk for pk in slot_ids if pk is not None).items():
+        PickupSlot.objects.filter(pk=slot_id, booked__gte=count).update(booked=F('booked') - count)
+
+
+def normalize_pickup_code(code):
+    return re.sub(r'[\s-]', '', code or '').upper()
+
+
+def new_pickup_codes(count):
+    """`count` random codes not used by any request yet (the unique index has the last word)."""
+    codes = set()
+    while len(codes) < count:
+        candidates = set()
+        while len(candidates) < count - len(codes):
+            candidates.add(''.join(secrets.choice(PICKUP_CODE_ALPHABET) for _ in range(settings.PICKUP_CODE_LENGTH)))
+        candidates -= codes
+        candidates -= set(ProductRequest.objects.filter(pickup_code__in=candidates).values_list('pickup_code', flat=True))
+        codes |= candidates
+    return list(codes)
+
+
+def sync_pickup(request, from_status):
+    """Book or free `request`'s pickup for its status change. Called by ProductRequest.save() before saving."""
+    if request.status == 'Ready':
+        slots = book_slots(request.assigned_distribution_center_id, 1) if request.assigned_distribution_center_id else []
+        request.pickup_slot_id = slots[0] if slots else None
+        request.pickup_code = new_pickup_codes(1)[0]
+    elif request.status != 'Fulfilled':
+        release_slots([request.pickup_slot_id])
+        request.pickup_slot_id = None
+        request.pickup_code = None
+
+
+def sync_pickups(requests, to_status):
+    """
+    The same for ProductRequest.bulk_transition(), after its UPDATE.
+    `requests` maps id -> (previous status, assigned center id).
+    """
+    if to_status == 'Ready':
+        by_center = defaultdict(list)
+        for pk, (_, center_id) in requests.items():
+            by_center[center_id].append(pk)
+        codes = iter(new_pickup_codes(len(requests)))
+        updates = []
+        for center_id, pks in by_center.items():
+            slots = book_slots(center_id, len(pks)) if center_id else []
+            updates.extend(
+                ProductRequest(pk=pk, pickup_slot_id=slot_id, pickup_code=next(codes))
+                for pk, slot_id in zip_longest(pks, slots)
+            )
+        ProductRequest.objects.bulk_update(updates, ['pickup_slot', 'pickup_code'], batch_size=500)
+    elif to_status != 'Fulfilled':
+        leaving = ProductRequest.objects.filter(pk__in=[pk for pk, (status, _) in requests.items() if status == 'Ready'])
+        release_slots(leaving.values_list('pickup_slot_id', flat=True))
+        leaving.update(pickup_slot=None, pickup_code=None)
+
+
+def consume_stock(consumed, changed_by=None):
+    """
+    Take handed-over units off the shelves: `consumed` maps (center_id,
+    product_type_id) -> units. Each item is debited with a conditional
+    UPDATE ... SET quantity = quantity - n WHERE quantity >= n, so stock
+    never goes negative and concurrent debits can't both take the last
+    units. Raises InsufficientStock (call inside the caller's transaction,
+    so nothing is kept) if a center doesn't have the units on hand.
+    Low-stock alerts are refreshed once the transaction commits.
+    """
+    from .alerts import refresh_low_stock_alerts
+    from .audit import record_event
+    from .events import ALL_SCOPE, publish_on_commit
+
+    consumed = {key: units for key, units in consumed.items() if units}
+    if not consumed:
+        return
+    now = timezone.now()
+    for (center_id, product_type_id), units in sorted(consumed.items()):
+        updated = InventoryItem.objects.filter(
+            distribution_center_id=center_id, product_type_id=product_type_id, quantity__gte=units,
+        ).update(quantity=F('quantity') - units, version=F('version') + 1, last_updated=now)
+        if not updated:
+            raise InsufficientStock(
+                f"Center {center_id} doesn't have {units} units of product type {product_type_id} on hand. "
+                "Update its inventory first."
+            )
+
+    items = InventoryItem.objects.filter(
+        distribution_center_id__in={center_id for center_id, _ in consumed},
+        product_type_id__in={product_type_id for _, product_type_id in consumed},
+    ).values_list('pk', 'distribution_center_id', 'product_type_id', 'quantity', 'version')
+    items = [item for item in items if (item[1], item[2]) in consumed]
+    # Alerts only report on stock, so they needn't hold up the transaction.
+    item_ids = [item[0] for item in items]
+    transaction.on_commit(lambda: refresh_low_stock_alerts(item_ids))
+
+    # .update() sends no post_save, so record the audit and live events here.
+    for pk, center_id, product_type_id, quantity, version in items:
+        record_event(
+            InventoryItem, pk, AuditEvent.ACTION_UPDATE,
+            {'quantity': [quantity + consumed[(center_id, product_type_id)], quantity]},
+            actor=changed_by, occurred_at=now,
+        )
+        publish_on_commit(
+            'inventory_item', pk, 'update', [ALL_SCOPE, ('center', center_id)],
+            {
+                'distribution_center': center_id, 'product_type': product_type_id,
+                'quantity': quantity, 'version': version, 'last_updated': now.isoformat(),
+            },
+        )
+
+
+def redeem_pickup_code(code, center_id=None, changed_by=None):
+    """
+    Fulfil the Ready request holding `code`, at `center_id` unless None (staff).
+
+    Seven queries: the lookup on the unique pickup_code index, then in one
+    transaction the conditional UPDATE of the request, the counter UPDATEs
+    (usually two: organization or center, and product type), the conditional
+    UPDATE taking the stock handed over (the allocated quantity, else the
+    requested one) off the center's inventory and a SELECT of what is left,
+    and the status log INSERT. After commit: the audit INSERT, the live
+    events, and two SELECTs (plus a write if an alert opens or closes) for
+    low-stock alerts.
+    Raises ProductRequest.DoesNotExist for an unknown code or another
+    center's request, and VersionConflict if it is not (or no longer) Ready
+    or the center hasn't got the stock on hand.
+    Returns the request's pickup details.
+    """
+    from .audit import record_event
+    from .counters import counter_deltas
+    from .events import publish_on_commit, request_scopes
+
+    code = normalize_pickup_code(code)
+    pickup = ProductRequest.objects.values(
+        'pk', 'status', 'quantity', 'allocated_quantity', 'product_type_id', 'product_type__name',
+        'assigned_distribution_center_id', 'requesting_organization_id', 'requester_user_id',
+        'pickup_slot__starts_at', 'pickup_slot__ends_at', 'version',
+    ).get(pickup_code=code)
+    if center_id is not None and pickup['assigned_distribution_center_id'] != center_id:
+        raise ProductRequest.DoesNotExist()
+    if pickup['status'] != 'Ready':
+        raise VersionConflict(f"This request is {pickup['status']}, not ready for pickup.")
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Matching the version too keeps the counters below in step with the row.
+        updated = ProductRequest.objects.filter(pk=pickup['pk'], version=pickup['version'], status='Ready').update(
+            status='Fulfilled', updated_at=now, version=F('version') + 1
+        )
+        if not updated:
+            raise VersionConflict("This request has just been redeemed or changed. Try again.")
+        state = (
+            pickup['requesting_organization_id'], pickup['assigned_distribution_center_id'],
+            pickup['product_type_id'], pickup['quantity'],
+        )
+        counter_deltas(('Ready', *state), ('Fulfilled', *state)).apply()
+        consume_stock(
+            {(pickup['assigned_distribution_center_id'], pickup['product_type_id']): pickup['allocated_quantity'] or pickup['quantity']},
+            changed_by=changed_by,
+        )
+        ProductRequestStatusLog.objects.create(
+            product_request_id=pickup['pk'], from_status='Ready', to_status='Fulfilled',
+            changed_by=changed_by, changed_at=now,
+        )
+        # .update() sends no post_save, so record the audit and live events here.
+        record_event(
+            ProductRequest, pickup['pk'], AuditEvent.ACTION_STATUS_CHANGE,
+            {'status': ['Ready', 'Fulfilled']}, actor=changed_by, occurred_at=now,
+        )
+        publish_on_commit(
+            'product_request', pickup['pk'], 'update',
+            request_scopes(
+                pickup['requesting_organization_id'], pickup['requester_user_id'],
+                pickup['assigned_distribution_center_id'],
+            ),
+            {'status': 'Fulfilled', 'updated_at': now.isoformat()},
+        )
+    pickup['status'] = 'Fulfilled'
+    pickup['version'] += 1
+    return pickup
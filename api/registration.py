@@ -0,0 +1,42 @@
+# api/registration.py
+"""
+The sign-up path: one function creating the user, their profile and their
+auth token.
+
+The password is hashed before the transaction opens. Hashing is the slow,
+CPU-bound part of a sign-up (tens to hundreds of milliseconds by design),
+and on SQLite a transaction holds the database write lock from BEGIN, so
+hashing inside it would serialize every other writer behind it. The
+transaction itself is then three INSERTs: the user, and the profile and
+token from the provision_new_user receiver (api/models.py), which also
+caches them on the returned user so the response needs no further queries.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+User = get_user_model()
+
+
+def register_user(username, email, password, first_name='', last_name=''):
+    """
+    Create and return a new user with their profile and auth token, all or
+    nothing. Raises ValidationError if the username was taken meanwhile.
+    """
+    user = User(
+        username=User.normalize_username(username),
+        email=User.objects.normalize_email(email),
+        first_name=first_name,
+        last_name=last_name,
+    )
+    user.set_password(password)
+    try:
+        with transaction.atomic():
+            user.save()
+    except IntegrityError:
+        # The serializer checked the username, but a concurrent sign-up may have won.
+        if User.objects.filter(username=user.username).exists():
+            raise ValidationError({'username': "A user with that username already exists."})
+        raise
+    return user
@@ -0,0 +1,41 @@
+# api/renderers.py
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to DRF's json.dumps renderer.
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that serializes with orjson when it is installed.
+
+    Output is byte-for-byte what DRF's compact, unicode JSONRenderer produces
+    for serializer data. Indented output (browsable API, `; indent=` media
+    type parameters) and non-default settings use the stock renderer.
+    """
+    _encoder = JSONEncoder()
+    # Datetimes and dataclasses go through DRF's encoder so their formatting
+    # (e.g. the trailing 'Z' for UTC) matches exactly.
+    _orjson_options = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self._encoder.default, option=self._orjson_options)
+        # Match JSONRenderer, which always escapes these so the output is a
+        # strict JavaScript subset.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,38 @@
+# api/routers.py
+
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+
+# Set by ReplicaPinningMiddleware for the duration of a request. Only reads made
+# while this is True go to the replica; everything else (writes, unsafe
+# requests, pinned clients, management commands, shell) stays on the primary.
+replica_reads_allowed = ContextVar('replica_reads_allowed', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads to the 'replica' alias when one is configured and the current
+    request allows it. All writes and migrations go to 'default'.
+    """
+
+    def db_for_read(self, model, **hints):
+        if replica_reads_allowed.get() and replica_configured():
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primary and replica hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
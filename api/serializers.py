@@ -2,6 +2,7 @@
 
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
 from rest_framework.serializers import ModelSerializer
 from django.contrib.auth.password_validation import validate_password
 
@@ -12,11 +13,143 @@ from .models import (
     ProductType,
     InventoryItem,
     ProductRequest,
-    USER_ROLE_CHOICES
+    Donation,
+    AuditEvent,
+    LowStockAlert,
+    USER_ROLE_CHOICES,
+    REQUEST_STATUS_CHOICES
 )
+from .allocation import ALLOCATION_MODES
+from .registration import register_user
 
 User = get_user_model()
 
+
+class SparseFieldsetSerializerMixin:
+    """
+    Lets GET callers choose the fields they need: `?fields=id,status` and/or
+    `?exclude=pickup_details`. Unrequested fields are dropped before
+    serialization, so their lookups never run; get_query_requirements()
+    tells SparseFieldsetMixin views which columns and joins are left.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        self.is_sparse = False
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return
+
+        requested = self._parse_field_list(request.query_params.get('fields'))
+        excluded = self._parse_field_list(request.query_params.get('exclude'))
+        if requested is None and excluded is None:
+            return
+
+        readable = [name for name, field in self.fields.items() if not field.write_only]
+        unknown = sorted(((requested or set()) | (excluded or set())) - set(readable))
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Unknown field(s): {', '.join(unknown)}"})
+
+        for name in readable:
+            if (requested is not None and name not in requested) or (excluded and name in excluded):
+                self.fields.pop(name)
+        self.is_sparse = True
+
+    @staticmethod
+    def _parse_field_list(value):
+        if value is None:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    def get_query_requirements(self):
+        """
+        Return (only_fields, select_related) for the fields being rendered.
+        only_fields is None when some field reads something other than a
+        model field (a method or property), so nothing may be deferred.
+        """
+        only_fields, related = set(), set()
+        resolvable = True
+        for field in self.fields.values():
+            if field.write_only:
+                continue
+            if field.source == '*':
+                resolvable = False
+                continue
+            model, path = self.Meta.model, []
+            for position, attr in enumerate(field.source_attrs):
+                try:
+                    model_field = model._meta.get_field(attr)
+                except FieldDoesNotExist:
+                    resolvable = False
+                    break
+                path.append(attr)
+                if model_field.is_relation and position < len(field.source_attrs) - 1:
+                    related.add('__'.join(path))
+                    # The foreign key column itself must be loaded to follow it.
+                    only_fields.add('__'.join(path))
+                    model = model_field.related_model
+            only_fields.add('__'.join(path))
+        return (only_fields if resolvable else None), related
+
+    # Field types whose to_representation() returns a value from .values()
+    # unchanged (PrimaryKeyRelatedField returns the related id).
+    VALUES_PASSTHROUGH_FIELDS = (
+        serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+        serializers.ChoiceField, serializers.PrimaryKeyRelatedField,
+    )
+
+    def compile_values_rows(self):
+        """
+        Build a function turning `.values_list(*columns)` tuples into the
+        same rows this serializer's to_representation() produces, for the
+        fields currently being rendered. Returns (columns, build_rows), or
+        None if a field cannot be read from a values query (a method field,
+        a property, a to-many relation), in which case callers serialize
+        instances as usual.
+        """
+        names, columns, conversions = [], [], []
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*':
+                return None
+            model, path = self.Meta.model, []
+            for position, attr in enumerate(field.source_attrs):
+                try:
+                    model_field = model._meta.get_field(attr)
+                except FieldDoesNotExist:
+                    return None
+                if model_field.one_to_many or model_field.many_to_many:
+                    return None
+                path.append(attr)
+                if model_field.is_relation and position < len(field.source_attrs) - 1:
+                    model = model_field.related_model
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is not None:
+                return None
+            if isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone'):
+                # Resolve the active timezone once, not per value; these field
+                # instances belong to this serializer (and request) only.
+                field.timezone = field.default_timezone()
+            if not isinstance(field, self.VALUES_PASSTHROUGH_FIELDS):
+                conversions.append((len(columns), field.to_representation))
+            names.append(name)
+            columns.append('__'.join(path))
+
+        def build_rows(rows):
+            if not conversions:
+                return [dict(zip(names, row)) for row in rows]
+            built = []
+            for row in rows:
+                row = list(row)
+                for index, to_representation in conversions:
+                    # Serializers render None as None without calling the field.
+                    if row[index] is not None:
+                        row[index] = to_representation(row[index])
+                built.append(dict(zip(names, row)))
+            return built
+
+        return columns, build_rows
+
 # --- UserProfile Serializer (Keep existing) ---
 class UserProfileSerializer(ModelSerializer):
     class Meta:
@@ -26,29 +159,46 @@ class UserProfileSerializer(ModelSerializer):
 
 # --- Standard Serializers (Keep existing) ---
 
-class ProductTypeSerializer(serializers.ModelSerializer):
+class ProductTypeSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductType
-        fields = ['id', 'name', 'description']
+        fields = ['id', 'name', 'description', 'open_demand_quantity']
 
-class DistributionCenterSerializer(serializers.ModelSerializer):
+class DistributionCenterSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = DistributionCenter
         fields = [
-            'id', 'name', 'location', 'contact_email', 'contact_phone', 'operating_hours'
+            'id', 'name', 'location', 'contact_email', 'contact_phone', 'operating_hours',
+            'pickup_slot_capacity', 'pending_request_count',
         ]
 
-class InventoryItemSerializer(serializers.ModelSerializer):
+class InventoryItemSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     product_type_name = serializers.CharField(source='product_type.name', read_only=True)
 
     class Meta:
         model = InventoryItem
         fields = [
-            'id', 'distribution_center', 'product_type', 'product_type_name', 'quantity', 'last_updated'
+            'id', 'distribution_center', 'product_type', 'product_type_name', 'quantity', 'reorder_threshold',
+            'last_updated', 'version'
         ]
-        read_only_fields = ['last_updated', 'product_type_name']
+        read_only_fields = ['last_updated', 'product_type_name', 'version']
+
+class LowStockAlertSerializer(serializers.ModelSerializer):
+    product_type = serializers.IntegerField(source='inventory_item.product_type_id', read_only=True)
+    product_type_name = serializers.CharField(source='inventory_item.product_type.name', read_only=True)
+    distribution_center_name = serializers.CharField(source='distribution_center.name', read_only=True)
+    current_quantity = serializers.IntegerField(source='inventory_item.quantity', read_only=True)
 
-class OrganizationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LowStockAlert
+        fields = [
+            'id', 'inventory_item', 'distribution_center', 'distribution_center_name',
+            'product_type', 'product_type_name', 'quantity', 'current_quantity',
+            'reorder_threshold', 'raised_at'
+        ]
+        read_only_fields = fields
+
+class OrganizationSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     admin_username = serializers.CharField(source='admin_profile.user.username', read_only=True, allow_null=True)
     admin_profile_id = serializers.PrimaryKeyRelatedField(source='admin_profile', read_only=True, allow_null=True)
 
@@ -57,20 +207,22 @@ class OrganizationSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'admin_profile', 'admin_profile_id', 'admin_username',
             'name', 'location', 'contact_person', 'contact_email',
-            'contact_phone', 'is_verified', 'created_at'
+            'contact_phone', 'is_verified', 'created_at', 'open_request_count'
         ]
-        read_only_fields = ['is_verified', 'created_at', 'admin_username', 'admin_profile_id']
+        read_only_fields = ['is_verified', 'created_at', 'admin_username', 'admin_profile_id', 'open_request_count']
         extra_kwargs = {
             'admin_profile': {'write_only': True, 'required': False, 'allow_null': True}
         }
 
 
-class ProductRequestSerializer(serializers.ModelSerializer):
+class ProductRequestSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     # Fields that are ONLY output by the API (read-only)
     requesting_organization_name = serializers.CharField(source='requesting_organization.name', read_only=True, allow_null=True)
     requester_username = serializers.CharField(source='requester_user.username', read_only=True, allow_null=True)
     product_type_name = serializers.CharField(source='product_type.name', read_only=True)
     assigned_distribution_center_name = serializers.CharField(source='assigned_distribution_center.name', read_only=True, allow_null=True)
+    pickup_slot_start = serializers.DateTimeField(source='pickup_slot.starts_at', read_only=True, allow_null=True)
+    pickup_slot_end = serializers.DateTimeField(source='pickup_slot.ends_at', read_only=True, allow_null=True)
 
     class Meta:
         model = ProductRequest
@@ -89,10 +241,16 @@ class ProductRequestSerializer(serializers.ModelSerializer):
             'status', # String choice - set by admin view
             'assigned_distribution_center', # DistributionCenter ID - set by admin view
             'pickup_details', # Text field - set by admin view
+            'allocated_quantity', # Set by fair-share allocation (api/allocation.py)
+            'suspected_duplicate', # Set by the create view's duplicate check (api/duplicates.py)
+            'pickup_code', # One-time code shown at the center, set when Ready (api/pickups.py)
+            'pickup_slot_start', # Booked pickup slot, set when Ready
+            'pickup_slot_end',
 
             # Fields that are ONLY output by the API (read-only timestamps)
             'created_at',
             'updated_at',
+            'version', # Row version, also sent as the ETag on detail responses
 
             # Include the read-only name fields for output
             'requesting_organization_name',
@@ -110,6 +268,12 @@ class ProductRequestSerializer(serializers.ModelSerializer):
             'assigned_distribution_center_name',
             'created_at',
             'updated_at',
+            'version',
+            'allocated_quantity',
+            'suspected_duplicate',
+            'pickup_code',
+            'pickup_slot_start',
+            'pickup_slot_end',
         ]
         # *** End Corrected read_only_fields ***
 
@@ -141,6 +305,84 @@ class ProductRequestSerializer(serializers.ModelSerializer):
         }
 
 
+class ProductRequestTransitionSerializer(serializers.Serializer):
+    """Input for moving many product requests to a new status at once."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=1000,
+    )
+    to_status = serializers.ChoiceField(choices=REQUEST_STATUS_CHOICES)
+
+
+class AllocationSerializer(serializers.Serializer):
+    """Options for a fair-share allocation plan (api/allocation.py)."""
+    mode = serializers.ChoiceField(choices=ALLOCATION_MODES, required=False)
+    product_types = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+    )
+
+
+class PickupCodeSerializer(serializers.Serializer):
+    """A pickup code presented at a distribution center."""
+    code = serializers.CharField(max_length=20, trim_whitespace=True)
+
+
+class DonationSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    donor_username = serializers.CharField(source='donor.username', read_only=True)
+    product_type_name = serializers.CharField(source='product_type.name', read_only=True)
+    distribution_center_name = serializers.CharField(source='distribution_center.name', read_only=True)
+
+    class Meta:
+        model = Donation
+        fields = [
+            'id', 'donor', 'donor_username', 'product_type', 'product_type_name',
+            'distribution_center', 'distribution_center_name', 'quantity', 'status', 'note',
+            'pledged_at', 'received_at',
+        ]
+        read_only_fields = fields
+
+
+class DonationPledgeSerializer(serializers.Serializer):
+    """
+    One pledge in a batch. Ids are plain integers here and are checked for the
+    whole batch at once by api/donations.py, instead of one query per pledge.
+    `donor` and `pledged_at` are only honoured for staff importing pledges.
+    """
+    product_type = serializers.IntegerField(min_value=1)
+    distribution_center = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=1_000_000)
+    note = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    donor = serializers.IntegerField(min_value=1, required=False)
+    pledged_at = serializers.DateTimeField(required=False)
+
+
+class DonationBatchSerializer(serializers.Serializer):
+    """Input for recording many pledges in one call."""
+    pledges = DonationPledgeSerializer(many=True, allow_empty=False, max_length=1000)
+
+
+class DonationTransitionSerializer(serializers.Serializer):
+    """Input for marking many pledges received or cancelled at once."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=1000,
+    )
+    to_status = serializers.ChoiceField(choices=['Received', 'Cancelled'])
+
+
+class AuditEventSerializer(serializers.ModelSerializer):
+    actor_username = serializers.CharField(source='actor.username', read_only=True, allow_null=True)
+
+    class Meta:
+        model = AuditEvent
+        fields = ['id', 'entity_type', 'entity_id', 'action', 'changes', 'actor', 'actor_username', 'occurred_at']
+        read_only_fields = fields
+
+
 # --- User Serializers for dj-rest-auth --- (Keep existing)
 
 class RegisterSerializer(ModelSerializer):
@@ -162,15 +404,16 @@ class RegisterSerializer(ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        validated_data_for_user = validated_data.copy()
-        if 'password2' in validated_data_for_user:
-             validated_data_for_user.pop('password2')
-
-        user = User.objects.create_user(**validated_data_for_user)
-        return user
+        try:
+            return register_user(
+                validated_data['username'], validated_data['email'], validated_data['password'],
+                first_name=validated_data.get('first_name', ''), last_name=validated_data.get('last_name', ''),
+            )
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.message_dict)
 
 
-class CustomUserDetailsSerializer(ModelSerializer):
+class CustomUserDetailsSerializer(SparseFieldsetSerializerMixin, ModelSerializer):
     id = serializers.IntegerField(read_only=True)
     username = serializers.CharField(read_only=True)
     email = serializers.EmailField(read_only=True)
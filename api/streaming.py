@@ -0,0 +1,200 @@
+# api/streaming.py
+"""
+ASGI app serving the live change event stream at /api/events/.
+
+It is mounted in front of Django in backend/asgi.py rather than written as a
+Django view: Django's ASGI handler keeps a dedicated thread per request for
+the request's whole lifetime once any sync middleware or ORM call has run,
+which would mean one idle thread per open stream. Here authentication and
+scope lookup run once on the shared thread pool, and after that an open
+stream is only a coroutine waiting on its queue, so a worker can hold
+thousands of them.
+
+Browsers' EventSource cannot send headers, so besides the session cookie a
+client can connect with `?ticket=`: a signed ticket from POST
+/api/events/ticket/ naming the user, valid for EVENT_STREAM_TICKET_SECONDS
+and accepted once. Unlike the auth token it replaces, it is harmless once
+it has landed in a proxy or server log.
+"""
+
+import asyncio
+import json
+import re
+import secrets
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from corsheaders.conf import conf as cors_conf
+from django.conf import settings
+from django.contrib.auth import get_user, get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.db import close_old_connections
+from rest_framework.authtoken.models import Token
+
+from .events import get_broker, subscription_keys
+
+EVENT_STREAM_PATH = '/api/events/'
+TICKET_SALT = 'api.streaming.ticket'
+
+
+def issue_stream_ticket(user):
+    """Return a ticket letting `user` open one event stream within EVENT_STREAM_TICKET_SECONDS."""
+    return signing.dumps({'user': user.pk, 'nonce': secrets.token_urlsafe(12)}, salt=TICKET_SALT)
+
+
+def _redeem_ticket(ticket):
+    """Return the user a valid, unused ticket was issued to, or None."""
+    try:
+        payload = signing.loads(ticket, salt=TICKET_SALT, max_age=settings.EVENT_STREAM_TICKET_SECONDS)
+    except signing.BadSignature:  # Includes SignatureExpired
+        return None
+    # Single use: only the first redemption adds the nonce. Needs a shared
+    # cache (REDIS_URL) to hold across worker processes.
+    if not cache.add(f"event-stream-ticket:{payload['nonce']}", 1, settings.EVENT_STREAM_TICKET_SECONDS):
+        return None
+    return get_user_model().objects.filter(pk=payload['user']).first()
+
+
+def _resolve_subscriber(ticket, token_key, session_key):
+    """Return (user, scope keys) for a ticket, token or session, or (None, None)."""
+    close_old_connections()
+    try:
+        user = None
+        if ticket:
+            user = _redeem_ticket(ticket)
+        elif token_key:
+            token = Token.objects.select_related('user').filter(key=token_key).first()
+            user = token.user if token is not None else None
+        elif session_key:
+            engine = import_module(settings.SESSION_ENGINE)
+            # get_user only needs request.session; it also checks the session hash.
+            user = get_user(SimpleNamespace(session=engine.SessionStore(session_key)))
+        if user is None or not user.is_active or not user.is_authenticated:
+            return None, None
+        return user, subscription_keys(user)
+    finally:
+        close_old_connections()
+
+
+def _cors_headers(origin):
+    if not origin:
+        return []
+    allowed = (
+        cors_conf.CORS_ALLOW_ALL_ORIGINS
+        or origin in cors_conf.CORS_ALLOWED_ORIGINS
+        or any(re.match(pattern, origin) for pattern in cors_conf.CORS_ALLOWED_ORIGIN_REGEXES)
+    )
+    if not allowed:
+        return []
+    headers = [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'Origin')]
+    if cors_conf.CORS_ALLOW_CREDENTIALS:
+        headers.append((b'access-control-allow-credentials', b'true'))
+    return headers
+
+
+def format_event(event):
+    payload = {key: value for key, value in event.items() if key != 'scopes'}
+    return f"id: {event['event_id']}\nevent: {event['type']}\ndata: {json.dumps(payload)}\n\n".encode()
+
+
+class EventStreamApp:
+    """
+    Routes GET /api/events/ to the event stream and everything else to Django.
+
+    Clients authenticate with `?ticket=<stream ticket>` (EventSource cannot set
+    headers), an `Authorization: Token ...` header, or the session cookie.
+    """
+
+    def __init__(self, django_application, path=EVENT_STREAM_PATH):
+        self.django_application = django_application
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            return await self.django_application(scope, receive, send)
+
+        headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+        cors = _cors_headers(headers.get('origin'))
+
+        if scope['method'] == 'OPTIONS':
+            return await self._respond(send, 204, cors + [
+                (b'access-control-allow-methods', b'GET, OPTIONS'),
+                (b'access-control-allow-headers', b'authorization, last-event-id'),
+            ])
+        if scope['method'] != 'GET':
+            return await self._respond(send, 405, cors + [(b'allow', b'GET, OPTIONS')])
+
+        ticket = parse_qs(scope.get('query_string', b'').decode()).get('ticket', [None])[0]
+        authorization = headers.get('authorization', '')
+        token_key = authorization[6:].strip() if authorization.startswith('Token ') else None
+        cookies = SimpleCookie(headers.get('cookie', ''))
+        session = cookies.get(settings.SESSION_COOKIE_NAME)
+
+        user, keys = await sync_to_async(_resolve_subscriber, thread_sensitive=False)(
+            ticket, token_key, session.value if session else None
+        )
+        if user is None:
+            return await self._respond(
+                send, 401, cors + [(b'content-type', b'application/json')],
+                b'{"detail":"Authentication credentials were not provided."}',
+            )
+
+        print(f"User {user.username} subscribed to live events with scopes {sorted(keys)}")
+        await self._stream(receive, send, keys, cors)
+
+    async def _respond(self, send, status, headers, body=b''):
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _stream(self, receive, send, keys, cors):
+        broker = get_broker()
+        subscription = broker.subscribe(keys)
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': cors + [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),  # Disable proxy buffering (nginx)
+            ]})
+            await self._send_chunk(send, f"retry: {settings.EVENT_STREAM_RETRY_MS}\n\n".encode())
+
+            while True:
+                next_event = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected},
+                    timeout=settings.EVENT_STREAM_HEARTBEAT_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnected in done:
+                    next_event.cancel()
+                    break
+                if not done:
+                    next_event.cancel()
+                    # Comment line: keeps proxies from closing an idle connection.
+                    await self._send_chunk(send, b": keep-alive\n\n")
+                    continue
+
+                if subscription.overflowed:
+                    # The client fell behind and events were dropped; have it refetch.
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    subscription.overflowed = False
+                    await self._send_chunk(send, b"event: resync\ndata: {}\n\n")
+                    continue
+                await self._send_chunk(send, format_event(next_event.result()))
+        except OSError:  # The server reports a send to a closed connection.
+            pass
+        finally:
+            broker.unsubscribe(subscription)
+            disconnected.cancel()
+
+    async def _send_chunk(self, send, chunk):
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+    async def _wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
@@ -0,0 +1,265 @@
+# api/tasks.py
+"""
+A database-backed task queue for work that should run after the response.
+
+Register a function with @task and queue it with `func.enqueue(*args)` or
+`func.schedule(args, kwargs, run_at=..., key=...)`. The Task row is written
+in the caller's transaction, so work queued by a request that rolls back
+never runs. `manage.py run_workers` runs the queue.
+
+Claiming is one short transaction: SELECT the due rows (FOR UPDATE SKIP
+LOCKED where the database supports it, so Postgres workers skip each
+other's rows instead of queueing behind them), then mark them Running with
+a conditional UPDATE. On SQLite the transaction starts with BEGIN
+IMMEDIATE (see DATABASES in settings), which already serializes claimers;
+the `status = 'Queued'` condition and the (locked_by, locked_at) re-read
+keep claims exclusive on any backend.
+
+A task that raises is re-queued after an exponential backoff with jitter
+until max_attempts, then marked Failed. Running tasks whose worker went
+away are released after TASK_LOCK_TIMEOUT_SECONDS. Periodic jobs
+(@task(every=...)) keep exactly one pending run via their key and queue the
+next one when a run finishes.
+"""
+
+import io
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+REGISTRY = {}
+
+
+class TaskFunction:
+    """A function registered with @task; call it directly or queue it."""
+
+    def __init__(self, func, name, max_attempts, priority, every):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.priority = priority
+        self.every = every
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        """Queue a run with these (JSON-serializable) arguments, due now."""
+        return self.schedule(args, kwargs)
+
+    def schedule(self, args=(), kwargs=None, run_at=None, key='', priority=None):
+        """
+        Queue a run due at `run_at` (default now). With a `key`, nothing is
+        queued while another run with that key is Queued or Running; the
+        existing task is returned instead.
+        """
+        task = Task(
+            name=self.name, args=list(args), kwargs=kwargs or {}, key=key,
+            priority=self.priority if priority is None else priority,
+            run_at=run_at or timezone.now(), max_attempts=self.max_attempts,
+        )
+        if not key:
+            task.save()
+            return task
+        try:
+            with transaction.atomic():
+                task.save()
+            return task
+        except IntegrityError:
+            return Task.objects.filter(key=key, status__in=['Queued', 'Running']).first()
+
+
+def task(func=None, *, name=None, max_attempts=None, priority=0, every=None):
+    """
+    Register `func` as a task, under `name` (default module.function).
+    `every` (a timedelta) makes it a periodic job run by the workers.
+    """
+    def register(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        if task_name in REGISTRY:
+            raise ValueError(f"A task named '{task_name}' is already registered.")
+        REGISTRY[task_name] = TaskFunction(
+            func, task_name, max_attempts or settings.TASK_MAX_ATTEMPTS, priority, every,
+        )
+        return REGISTRY[task_name]
+    return register(func) if func else register
+
+
+def retry_delay(attempts):
+    """Seconds before retry number `attempts`: exponential, capped, half of it random."""
+    delay = min(settings.TASK_RETRY_BACKOFF_MAX_SECONDS, settings.TASK_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def schedule_periodic():
+    """Make sure every periodic job has a pending run. Safe to call from every worker."""
+    for func in REGISTRY.values():
+        if func.every:
+            func.schedule(key=func.name)
+
+
+def claim_tasks(worker_id, limit):
+    """Mark up to `limit` due tasks Running for `worker_id` and return them."""
+    now = timezone.now()
+    due = Task.objects.filter(status='Queued', run_at__lte=now).order_by('-priority', 'run_at', 'pk')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        Task.objects.filter(pk__in=ids, status='Queued').update(
+            status='Running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+        return list(
+            Task.objects.filter(pk__in=ids, status='Running', locked_by=worker_id, locked_at=now)
+            .order_by('-priority', 'run_at', 'pk')
+        )
+
+
+def release_tasks(tasks):
+    """Put claimed tasks that weren't started back in the queue, uncounted."""
+    for claimed in tasks:
+        Task.objects.filter(pk=claimed.pk, status='Running', locked_by=claimed.locked_by).update(
+            status='Queued', locked_by='', locked_at=None, attempts=F('attempts') - 1,
+        )
+
+
+def release_stale_tasks():
+    """Re-queue (or fail, if out of attempts) tasks Running for longer than the lock timeout."""
+    cutoff = timezone.now() - timedelta(seconds=settings.TASK_LOCK_TIMEOUT_SECONDS)
+    stale = Task.objects.filter(status='Running', locked_at__lt=cutoff)
+    error = f"Still running after {settings.TASK_LOCK_TIMEOUT_SECONDS}s; the worker was presumably stopped."
+    stale.filter(attempts__lt=F('max_attempts')).update(
+        status='Queued', locked_by='', locked_at=None, run_at=timezone.now(), last_error=error,
+    )
+    stale.update(status='Failed', locked_by='', finished_at=timezone.now(), last_error=error)
+
+
+def finish_task(claimed, error=''):
+    """
+    Record the outcome of a run and return the task's new status, or None if
+    it was released to another worker meanwhile (nothing is written then).
+    """
+    now = timezone.now()
+    if error and claimed.attempts < claimed.max_attempts:
+        changes = {'status': 'Queued', 'run_at': now + timedelta(seconds=retry_delay(claimed.attempts)), 'locked_at': None}
+    else:
+        changes = {'status': 'Failed' if error else 'Succeeded', 'finished_at': now}
+    func = REGISTRY.get(claimed.name)
+    with transaction.atomic():
+        updated = Task.objects.filter(pk=claimed.pk, status='Running', locked_by=claimed.locked_by).update(
+            locked_by='', last_error=error, **changes
+        )
+        if updated and changes['status'] != 'Queued' and func and func.every and claimed.key == func.name:
+            func.schedule(run_at=now + func.every, key=func.name)
+    return changes['status'] if updated else None
+
+
+def run_task(claimed):
+    """Run one claimed task and record the outcome, like finish_task()."""
+    func = REGISTRY.get(claimed.name)
+    try:
+        if func is None:
+            raise LookupError(f"No task registered as '{claimed.name}'.")
+        func.func(*claimed.args, **claimed.kwargs)
+    except Exception:
+        return finish_task(claimed, traceback.format_exc())
+    return finish_task(claimed)
+
+
+class Worker:
+    """
+    One polling loop, run in a thread of `run_workers`. Claims a batch of due
+    tasks, runs them in order and polls again, until `stop` is set (or, with
+    `once`, the queue has nothing due).
+    """
+
+    def __init__(self, number, stop, batch_size, poll_interval, once=False, log=print):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{number}"
+        self.stop = stop
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.once = once
+        self.log = log
+
+    def run(self):
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                release_stale_tasks()
+                claimed = claim_tasks(self.worker_id, self.batch_size)
+                for i, current in enumerate(claimed):
+                    if self.stop.is_set():
+                        release_tasks(claimed[i:])
+                        break
+                    status = run_task(current)
+                    self.log(
+                        f"[{self.worker_id}] {current.name} #{current.pk} attempt {current.attempts}: "
+                        f"{status or 'released meanwhile, outcome discarded'}"
+                    )
+                if not claimed:
+                    if self.once:
+                        break
+                    self.stop.wait(self.poll_interval)
+        finally:
+            connection.close()
+
+
+def run_worker_threads(threads, stop, batch_size, poll_interval, once=False, log=print):
+    """Run `threads` workers in this process until they stop."""
+    workers = [
+        threading.Thread(
+            target=Worker(number, stop, batch_size, poll_interval, once=once, log=log).run,
+            name=f"task-worker-{number}",
+        )
+        for number in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+
+# --- Periodic jobs ---
+
+def _run_command(name, *args):
+    out = io.StringIO()
+    call_command(name, *args, stdout=out)
+    print(out.getvalue().strip())
+
+
+@task(name='snapshot_inventory', every=timedelta(days=1))
+def snapshot_inventory():
+    """Record today's stock levels for the forecasts (see the snapshot_inventory command)."""
+    _run_command('snapshot_inventory')
+
+
+@task(name='recount_counters', every=timedelta(days=1))
+def recount_counters():
+    """Repair any drift in the denormalized request counters (see the recount command)."""
+    _run_command('recount')
+
+
+@task(name='purge_tasks', every=timedelta(days=1))
+def purge_tasks():
+    """Delete finished tasks older than TASK_KEEP_DAYS."""
+    cutoff = timezone.now() - timedelta(days=settings.TASK_KEEP_DAYS)
+    finished = Task.objects.filter(Q(status='Succeeded') | Q(status='Failed'), finished_at__lt=cutoff)
+    while True:
+        ids = list(finished.values_list('pk', flat=True)[:1000])
+        if not ids:
+            break
+        Task.objects.filter(pk__in=ids).delete()
@@ -1,3 +1,1318 @@
-from django.test import TestCase
+# api/tests.py
 
-# Create your tests here.
+import asyncio
+import contextlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import duplicates, registration, tasks
+from .allocation import ALLOCATION_MODES, allocate, build_plan, fair_shares
+from .donations import recount_donor_totals
+from .middleware import PIN_COOKIE_NAME
+from .models import (
+    DistributionCenter, Donation, DonorTotal, InventoryItem, Organization, PickupSlot, ProductRequest, ProductType,
+    Task, VersionConflict,
+)
+from .pickups import redeem_pickup_code
+from .serializers import InventoryItemSerializer, ProductRequestSerializer
+
+User = get_user_model()
+
+
+def tables_queried(queries, table):
+    return [query['sql'] for query in queries.captured_queries if table in query['sql']]
+
+
+def selected_columns(sql):
+    return [column.split(' AS ')[0] for column in re.match(r'SELECT (.*?) FROM ', sql).group(1).split(', ')]
+
+
+def make_requests():
+    """Requests from an organization, an individual and a phone, with and without a center and pickup slot."""
+    pads = ProductType.objects.create(name='Pads')
+    center = DistributionCenter.objects.create(name='Central', location='1 Main St', operating_hours='')
+    organization = Organization.objects.create(name='Girls Club', location='Nairobi')
+    individual = User.objects.create_user('amina')
+    ProductRequest.objects.create(requesting_organization=organization, product_type=pads, quantity=40)
+    ready = ProductRequest.objects.create(
+        requester_user=individual, product_type=pads, quantity=3, allocated_quantity=2,
+        assigned_distribution_center=center, pickup_details='Side door',
+    )
+    ready.status = 'Ready'  # Books a pickup slot and sets a pickup code
+    ready.save()
+    ProductRequest.objects.create(requester_phone_number='+254700000001', product_type=pads, quantity=1, status='Cancelled')
+
+
+def serializer_body(response, serializer_class, queryset, query=None):
+    """What `response` would hold had its results been rendered by the serializer from model instances."""
+    request = Request(APIRequestFactory().get('/', query or {}))
+    data = dict(response.data)
+    data['results'] = serializer_class(queryset, many=True, context={'request': request}).data
+    return response.accepted_renderer.render(data, response.accepted_media_type, response.renderer_context)
+
+
+def run_in_threads(*targets):
+    """Start `targets` together, each in its own thread and database connection, and wait for them."""
+    barrier = threading.Barrier(len(targets))
+    errors = []
+
+    def run(target):
+        try:
+            barrier.wait()
+            target()
+        except Exception as e:  # Re-raised below, in the test's thread
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+# --- Read replica routing (api/routers.py, ReplicaPinningMiddleware) ---
+class ReplicaRoutingTests(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        # What DATABASE_REPLICA_URL sets up in settings, but as a database of
+        # its own, so each read can be traced to the database that answered
+        # it. Added here rather than in `databases` so the other tests run
+        # without a replica.
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        settings.DATABASES['replica'] = {
+            **connections['default'].settings_dict, 'NAME': os.path.join(cls.replica_dir.name, 'replica.sqlite3'),
+        }
+        # Migrations only run on the primary (PrimaryReplicaRouter.allow_migrate);
+        # a real replica gets its schema by replication.
+        # The test flush skips it for the same reason, so this row stays put.
+        with connections['replica'].schema_editor() as editor:
+            editor.create_model(ProductType)
+        ProductType.objects.using('replica').create(name='Pads (replica)')
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del settings.DATABASES['replica']
+        cls.replica_dir.cleanup()
+
+    def setUp(self):
+        ProductType.objects.create(name='Pads')
+        self.client = APIClient()
+
+    def get_product_types(self):
+        response = self.client.get('/api/product-types/')
+        self.assertEqual(response.status_code, 200)
+        return sorted(product_type['name'] for product_type in response.json()['results'])
+
+    def test_safe_method_reads_go_to_the_replica(self):
+        self.assertEqual(self.get_product_types(), ['Pads (replica)'])
+
+    def test_pinned_client_reads_from_the_primary(self):
+        self.client.cookies[PIN_COOKIE_NAME] = str(int(time.time()) + 60)
+        self.assertEqual(self.get_product_types(), ['Pads'])
+
+    def test_expired_pin_reads_from_the_replica_again(self):
+        self.client.cookies[PIN_COOKIE_NAME] = str(int(time.time()) - 1)
+        self.assertEqual(self.get_product_types(), ['Pads (replica)'])
+
+    def test_write_sets_the_pin_cookie(self):
+        response = self.client.post('/api/product-types/', {'name': 'Cups'}, format='json')
+        pin = response.cookies[PIN_COOKIE_NAME]
+        self.assertGreater(int(pin.value), time.time())
+        self.assertEqual(pin['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        # A row the lagging replica doesn't have yet is still seen by the pinned client.
+        ProductType.objects.create(name='Cups')
+        self.assertEqual(self.get_product_types(), ['Cups', 'Pads'])
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        self.assertEqual(list(ProductType.objects.values_list('name', flat=True)), ['Pads'])
+
+
+# --- Optimistic concurrency (VersionedModel, OptimisticConcurrencyMixin) ---
+class LostUpdateTests(TransactionTestCase):
+    def setUp(self):
+        center = DistributionCenter.objects.create(name='Central', location='1 Main St')
+        self.item = InventoryItem.objects.create(
+            distribution_center=center, product_type=ProductType.objects.create(name='Pads'), quantity=10,
+        )
+
+    def test_racing_saves_of_one_row_cannot_both_win(self):
+        copies = [InventoryItem.objects.get(pk=self.item.pk) for _ in range(2)]
+        outcomes = {}
+
+        def save(copy, quantity):
+            def target():
+                copy.quantity = quantity
+                try:
+                    copy.save()
+                    outcomes[quantity] = 'saved'
+                except VersionConflict:
+                    outcomes[quantity] = 'conflict'
+            return target
+
+        run_in_threads(save(copies[0], 7), save(copies[1], 3))
+
+        self.assertEqual(sorted(outcomes.values()), ['conflict', 'saved'])
+        self.item.refresh_from_db()
+        winner = next(quantity for quantity, outcome in outcomes.items() if outcome == 'saved')
+        self.assertEqual(self.item.quantity, winner)
+        self.assertEqual(self.item.version, 2)
+
+
+class IfMatchTests(TestCase):
+    def setUp(self):
+        center = DistributionCenter.objects.create(name='Central', location='1 Main St')
+        self.item = InventoryItem.objects.create(
+            distribution_center=center, product_type=ProductType.objects.create(name='Pads'), quantity=10,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        self.url = f'/api/inventory/{self.item.pk}/'
+
+    def test_responses_carry_the_version_as_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], '"1"')
+
+    def test_matching_if_match_is_applied(self):
+        response = self.client.patch(self.url, {'quantity': 4}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"2"')
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity, self.item.version), (4, 2))
+
+    def test_stale_if_match_is_refused(self):
+        InventoryItem.objects.get(pk=self.item.pk).save()  # Someone else's edit: version 2
+        response = self.client.patch(self.url, {'quantity': 4}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 412)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity, self.item.version), (10, 2))
+
+
+# --- Sparse fieldsets (?fields= / ?exclude=) and .values() list pages ---
+class SparseFieldsetTests(TestCase):
+    url = '/api/product-requests/'
+
+    def setUp(self):
+        make_requests()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def get_rows(self, query):
+        """Return the response and the SQL of the query that read the rows."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, query)
+        self.assertEqual(response.status_code, 200, response.content)
+        [sql] = [sql for sql in tables_queried(queries, 'FROM "api_productrequest"') if 'COUNT(' not in sql]
+        return response, sql
+
+    def test_fields_narrows_the_output_and_the_columns(self):
+        response, sql = self.get_rows({'fields': 'id,status'})
+        self.assertEqual(len(response.data['results']), 3)
+        for row in response.data['results']:
+            self.assertEqual(set(row), {'id', 'status'})
+        self.assertEqual(selected_columns(sql), ['"api_productrequest"."id"', '"api_productrequest"."status"'])
+        self.assertNotIn('JOIN', sql)
+
+    def test_related_field_joins_only_what_it_reads(self):
+        response, sql = self.get_rows({'fields': 'id,product_type_name'})
+        self.assertEqual([row['product_type_name'] for row in response.data['results']], ['Pads'] * 3)
+        self.assertEqual(selected_columns(sql), ['"api_productrequest"."id"', '"api_producttype"."name"'])
+        self.assertEqual(sql.count('JOIN'), 1)
+
+    def test_exclude_drops_the_field_and_its_column(self):
+        response, sql = self.get_rows({'exclude': 'pickup_details,assigned_distribution_center_name'})
+        row = response.data['results'][0]
+        self.assertNotIn('pickup_details', row)
+        self.assertNotIn('assigned_distribution_center_name', row)
+        self.assertIn('status', row)
+        self.assertNotIn('pickup_details', sql)
+        self.assertNotIn('api_distributioncenter', sql)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(self.url, {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_values_rows_match_the_serializer_byte_for_byte(self):
+        query = {'fields': 'id,status,pickup_code,pickup_slot_start,created_at,requester_username'}
+        response = self.client.get(self.url, query)
+        queryset = ProductRequest.objects.order_by('-created_at')
+        self.assertEqual(response.content, serializer_body(response, ProductRequestSerializer, queryset, query))
+
+    def test_instance_views_defer_the_other_columns(self):
+        # The product type list serializes instances, narrowed with only().
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/product-types/', {'fields': 'name'})
+        self.assertEqual([row for row in response.data['results']], [{'name': 'Pads'}])
+        [sql] = [sql for sql in tables_queried(queries, 'FROM "api_producttype"') if 'COUNT(' not in sql]
+        self.assertEqual(selected_columns(sql), ['"api_producttype"."id"', '"api_producttype"."name"'])
+
+
+class ValuesRowsDifferentialTests(TestCase):
+    """The row builder compiled from a serializer (compile_values_rows) against the serializer itself."""
+
+    def setUp(self):
+        make_requests()
+        center = DistributionCenter.objects.get()
+        InventoryItem.objects.create(distribution_center=center, product_type=ProductType.objects.get(), quantity=5)
+        InventoryItem.objects.create(
+            distribution_center=center, product_type=ProductType.objects.create(name='Cups'), quantity=0,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def assertSameJSON(self, serializer_class, queryset):
+        serializer = serializer_class(context={'request': Request(APIRequestFactory().get('/'))})
+        compiled = serializer.compile_values_rows()
+        self.assertIsNotNone(compiled, "Every field should be readable from a values query.")
+        columns, build_rows = compiled
+        built = build_rows(queryset.values_list(*columns))
+        expected = serializer_class(queryset, many=True, context=serializer.context).data
+        self.assertEqual(JSONRenderer().render(built), JSONRenderer().render(expected))
+
+    def test_request_rows_with_null_relations_and_datetimes(self):
+        queryset = ProductRequest.objects.order_by('pk')
+        # One row each without a requester user, an organization, a center and a pickup slot.
+        self.assertTrue(queryset.filter(requester_user__isnull=True, requesting_organization__isnull=False).exists())
+        self.assertTrue(queryset.filter(requesting_organization__isnull=True, requester_user__isnull=True).exists())
+        self.assertTrue(queryset.filter(assigned_distribution_center__isnull=True).exists())
+        self.assertTrue(queryset.filter(pickup_slot__isnull=False).exists())
+        self.assertSameJSON(ProductRequestSerializer, queryset)
+
+    def test_inventory_rows(self):
+        self.assertSameJSON(InventoryItemSerializer, InventoryItem.objects.order_by('pk'))
+
+    def test_datetimes_follow_the_active_timezone(self):
+        with timezone.override('Africa/Nairobi'):
+            self.assertSameJSON(ProductRequestSerializer, ProductRequest.objects.order_by('pk'))
+            self.assertSameJSON(InventoryItemSerializer, InventoryItem.objects.order_by('pk'))
+
+    def test_list_pages_match_the_serializer(self):
+        for url, serializer_class, queryset in (
+            ('/api/product-requests/', ProductRequestSerializer, ProductRequest.objects.order_by('-created_at')),
+            ('/api/inventory/', InventoryItemSerializer,
+             InventoryItem.objects.order_by('distribution_center__name', 'product_type__name')),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, serializer_body(response, serializer_class, queryset))
+
+
+# --- /api/auth/user/ (api/user_details.py) ---
+@override_settings(USER_DETAILS_CACHE_SECONDS=300)
+class UserDetailsQueryTests(TestCase):
+    url = '/api/auth/user/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('amina')
+        self.client = APIClient()
+        # Token authentication, as the frontend uses: one query per request.
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.user.auth_token.key}')
+
+    def test_cache_miss_is_one_query_after_authentication(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'amina')
+
+    def test_cache_hit_needs_no_query_after_authentication(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data, first.data)
+
+    def test_profile_change_drops_the_cached_document(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile.location = 'Kisumu'
+            self.user.profile.save()
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['location'], 'Kisumu')
+
+    @override_settings(USER_DETAILS_CACHE_SECONDS=0)
+    def test_disabled_cache_queries_every_time(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+
+# --- Admin changelists (api/admin.py) ---
+class AdminChangelistQueryTests(TestCase):
+    """Each changelist costs the same number of queries however many rows the page shows."""
+
+    # Changelist -> queries per page: session, user, count(s), rows (with
+    # their relations joined) and any list filter choices.
+    changelists = {
+        '/admin/auth/user/': 6,
+        '/admin/api/organization/': 6,
+        '/admin/api/distributioncenter/': 5,
+        '/admin/api/productrequest/': 6,
+        '/admin/api/productrequest/?status__exact=Pending': 6,
+        '/admin/api/inventoryitem/': 7,
+    }
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        self.pads = ProductType.objects.create(name='Pads')
+
+    def add_rows(self, count):
+        """`count` more of everything, each row with the relations its changelist displays."""
+        start = User.objects.count()
+        for n in range(start, start + count):
+            org_admin = User.objects.create_user(f'org{n}')
+            center_admin = User.objects.create_user(f'center{n}')
+            individual = User.objects.create_user(f'user{n}')
+            organization = Organization.objects.create(
+                name=f'Org {n}', location='Nairobi', admin_profile=org_admin.profile,
+            )
+            center = DistributionCenter.objects.create(
+                name=f'Center {n}', location='1 Main St', admin_profile=center_admin.profile,
+            )
+            InventoryItem.objects.create(distribution_center=center, product_type=self.pads, quantity=n)
+            ProductRequest.objects.create(
+                requesting_organization=organization, product_type=self.pads, quantity=5,
+                assigned_distribution_center=center,
+            )
+            ProductRequest.objects.create(requester_user=individual, product_type=self.pads, quantity=1)
+
+    def test_changelist_queries(self):
+        for rows in (2, 6):
+            self.add_rows(rows)
+            for url, expected in self.changelists.items():
+                with self.subTest(url=url, rows=rows), self.assertNumQueries(expected):
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+
+
+# --- Request counters (api/counters.py) ---
+class CounterConsistencyTests(TransactionTestCase):
+    """Counters kept by concurrent writers must match a full recount."""
+
+    def setUp(self):
+        self.organizations = [Organization.objects.create(name=f'Org {n}', location='Nairobi') for n in range(2)]
+        self.centers = [DistributionCenter.objects.create(name=f'Center {n}', location='1 Main St') for n in range(2)]
+        self.product_types = [ProductType.objects.create(name=name) for name in ('Pads', 'Cups')]
+        for center in self.centers:
+            for product_type in self.product_types:
+                InventoryItem.objects.create(distribution_center=center, product_type=product_type, quantity=10000)
+        self.ids = [self.create_request(n).pk for n in range(40)]
+
+    def create_request(self, n):
+        return ProductRequest.objects.create(
+            requesting_organization=self.organizations[n % 2], product_type=self.product_types[n // 2 % 2],
+            assigned_distribution_center=self.centers[n // 4 % 2], quantity=n + 1,
+        )
+
+    def counters(self):
+        return (
+            list(Organization.objects.order_by('pk').values_list('open_request_count', flat=True)),
+            list(DistributionCenter.objects.order_by('pk').values_list('pending_request_count', flat=True)),
+            list(ProductType.objects.order_by('pk').values_list('open_demand_quantity', flat=True)),
+        )
+
+    def test_concurrent_writes_leave_counters_a_recount_agrees_with(self):
+        ids = self.ids
+        # Refused writes are expected when the threads collide; they must leave no trace.
+        collisions = (VersionConflict, DjangoValidationError, ProductRequest.DoesNotExist)
+
+        def bulk(batch, to_status):
+            def target():
+                for start in range(0, len(batch), 5):
+                    try:
+                        ProductRequest.bulk_transition(ProductRequest.objects.all(), batch[start:start + 5], to_status)
+                    except collisions:
+                        pass
+            return target
+
+        def one_by_one(batch, to_status):
+            def target():
+                for pk in batch:
+                    try:
+                        instance = ProductRequest.objects.get(pk=pk)
+                        instance.status = to_status
+                        instance.save()
+                    except collisions:
+                        pass
+            return target
+
+        def delete(batch):
+            def target():
+                for pk in batch:
+                    ProductRequest.objects.filter(pk=pk).delete()
+            return target
+
+        def edit_quantities(batch):
+            def target():
+                for pk in batch:
+                    try:
+                        instance = ProductRequest.objects.get(pk=pk)
+                        instance.quantity += 100
+                        instance.save()
+                    except collisions:
+                        pass
+            return target
+
+        def create(count):
+            def target():
+                for n in range(count):
+                    self.create_request(n)
+            return target
+
+        run_in_threads(
+            bulk(ids[0:24], 'Ready'),
+            bulk(ids[0:12], 'Fulfilled'),
+            one_by_one(ids[8:32], 'Cancelled'),
+            one_by_one(ids[16:28], 'Pending'),
+            edit_quantities(ids[4:36]),
+            delete(ids[20:40:3]),
+            create(10),
+        )
+
+        before = self.counters()
+        self.assertNotEqual(before, ([0, 0], [0, 0], [0, 0]))
+        out = io.StringIO()
+        call_command('recount', '--check', stdout=out)  # Raises CommandError on any drift
+        self.assertIn('Counters are consistent.', out.getvalue())
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            tasks.recount_counters()
+        self.assertEqual(self.counters(), before)
+
+
+# --- Task queue (api/tasks.py) ---
+calls = []
+
+
+@tasks.task(name='tests.record', max_attempts=3)
+def record(value, label=''):
+    calls.append((value, label))
+
+
+@tasks.task(name='tests.fail', max_attempts=2)
+def fail():
+    raise RuntimeError("Boom")
+
+
+@override_settings(TASK_RETRY_BACKOFF_SECONDS=10, TASK_RETRY_BACKOFF_MAX_SECONDS=60)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_writes_a_queued_task(self):
+        queued = record.enqueue(7, label='seven')
+        queued.refresh_from_db()
+        self.assertEqual(
+            (queued.name, queued.args, queued.kwargs, queued.status, queued.max_attempts),
+            ('tests.record', [7], {'label': 'seven'}, 'Queued', 3),
+        )
+        self.assertEqual(calls, [])  # Nothing runs until a worker claims it
+
+    def test_enqueue_rolls_back_with_the_caller(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            record.enqueue(1)
+            raise RuntimeError("The request failed")
+        self.assertFalse(Task.objects.exists())
+
+    def test_claim_takes_due_tasks_by_priority(self):
+        later = record.schedule((1,), run_at=timezone.now() + timedelta(hours=1))
+        low = record.schedule((2,))
+        high = record.schedule((3,), priority=5)
+        claimed = tasks.claim_tasks('worker-1', 10)
+        self.assertEqual([task.pk for task in claimed], [high.pk, low.pk])
+        self.assertEqual({(task.status, task.locked_by, task.attempts) for task in claimed}, {('Running', 'worker-1', 1)})
+        self.assertEqual(Task.objects.get(pk=later.pk).status, 'Queued')
+        self.assertEqual(tasks.claim_tasks('worker-2', 10), [])
+
+    def test_run_task_succeeds(self):
+        record.enqueue(4)
+        [claimed] = tasks.claim_tasks('worker-1', 10)
+        self.assertEqual(tasks.run_task(claimed), 'Succeeded')
+        self.assertEqual(calls, [(4, '')])
+        claimed.refresh_from_db()
+        self.assertEqual((claimed.status, claimed.locked_by), ('Succeeded', ''))
+        self.assertIsNotNone(claimed.finished_at)
+
+    def test_failure_is_retried_with_backoff_then_failed(self):
+        fail.enqueue()
+        [claimed] = tasks.claim_tasks('worker-1', 10)
+        before = timezone.now()
+        self.assertEqual(tasks.run_task(claimed), 'Queued')
+        claimed.refresh_from_db()
+        self.assertIn('RuntimeError: Boom', claimed.last_error)
+        # First retry: half of the 10 s backoff fixed, half random.
+        self.assertGreaterEqual(claimed.run_at, before + timedelta(seconds=5))
+        self.assertLessEqual(claimed.run_at, timezone.now() + timedelta(seconds=10))
+        self.assertEqual(tasks.claim_tasks('worker-1', 10), [])  # Not due yet
+
+        Task.objects.filter(pk=claimed.pk).update(run_at=timezone.now())
+        [claimed] = tasks.claim_tasks('worker-1', 10)
+        self.assertEqual(claimed.attempts, 2)
+        self.assertEqual(tasks.run_task(claimed), 'Failed')  # max_attempts=2
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        for attempts, delay in ((1, 10), (2, 20), (3, 40), (4, 60), (9, 60)):
+            with self.subTest(attempts=attempts):
+                for _ in range(20):
+                    self.assertTrue(delay / 2 <= tasks.retry_delay(attempts) <= delay)
+
+    def test_outcome_of_a_released_task_is_discarded(self):
+        record.enqueue(5)
+        [claimed] = tasks.claim_tasks('worker-1', 10)
+        Task.objects.filter(pk=claimed.pk).update(locked_at=timezone.now() - timedelta(days=1))
+        tasks.release_stale_tasks()
+        self.assertEqual(Task.objects.get(pk=claimed.pk).status, 'Queued')
+        self.assertIsNone(tasks.finish_task(claimed))
+        self.assertEqual(Task.objects.get(pk=claimed.pk).status, 'Queued')
+
+    def test_periodic_jobs_keep_exactly_one_pending_run(self):
+        periodic = [func for func in tasks.REGISTRY.values() if func.every]
+        self.assertTrue(periodic)
+        tasks.schedule_periodic()
+        tasks.schedule_periodic()
+        self.assertEqual(
+            sorted(Task.objects.filter(status='Queued').values_list('key', flat=True)),
+            sorted(func.name for func in periodic),
+        )
+
+        job = tasks.REGISTRY['purge_tasks']
+        Task.objects.exclude(key=job.name).delete()
+        [claimed] = tasks.claim_tasks('worker-1', 10)
+        finished_at = timezone.now()
+        self.assertEqual(tasks.run_task(claimed), 'Succeeded')
+        [next_run] = Task.objects.filter(key=job.name, status='Queued')
+        self.assertAlmostEqual(next_run.run_at, finished_at + job.every, delta=timedelta(seconds=5))
+
+
+class TaskClaimRaceTests(TransactionTestCase):
+    def test_two_workers_never_claim_the_same_task(self):
+        record.enqueue(1)
+        claims = {}
+
+        def claim(worker_id):
+            return lambda: claims.__setitem__(worker_id, tasks.claim_tasks(worker_id, 10))
+
+        run_in_threads(claim('worker-1'), claim('worker-2'))
+        self.assertEqual(sorted(len(claimed) for claimed in claims.values()), [0, 1])
+
+    def test_concurrent_workers_split_the_queue(self):
+        for n in range(30):
+            record.enqueue(n)
+        claimed = []
+
+        def claim(worker_id):
+            def target():
+                while batch := tasks.claim_tasks(worker_id, 4):
+                    claimed.extend((task.pk, task.locked_by) for task in batch)
+            return target
+
+        run_in_threads(*(claim(f'worker-{n}') for n in range(4)))
+        self.assertEqual(len(claimed), 30)
+        self.assertEqual(len({pk for pk, _ in claimed}), 30)
+        self.assertEqual(
+            sorted(Task.objects.values_list('pk', 'locked_by')), sorted(claimed),
+        )
+
+    def test_worker_threads_run_the_queue(self):
+        calls.clear()
+        for n in range(6):
+            record.enqueue(n)
+        tasks.run_worker_threads(2, threading.Event(), batch_size=2, poll_interval=0.01, once=True, log=lambda line: None)
+        self.assertEqual(sorted(value for value, _ in calls), list(range(6)))
+        self.assertEqual(set(Task.objects.values_list('status', flat=True)), {'Succeeded'})
+
+
+# --- Delta sync (DeltaSyncMixin) ---
+@override_settings(SYNC_MAX_ROWS=3)
+class DeltaSyncTests(TestCase):
+    url = '/api/product-requests/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        pads = ProductType.objects.create(name='Pads')
+        self.ids = [
+            ProductRequest.objects.create(requester_phone_number=f'+2547000000{n:02}', product_type=pads, quantity=1).pk
+            for n in range(8)
+        ]
+
+    def sync(self, cursor):
+        response = self.client.get(self.url, {'updated_since': cursor})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_capped_deltas_continue_after_rows_sharing_a_timestamp(self):
+        # One bulk update: every row gets the same timestamp, past the lag.
+        changed_at = timezone.now() - timedelta(minutes=1)
+        ProductRequest.objects.update(updated_at=changed_at)
+
+        cursor, received, pages = (changed_at - timedelta(seconds=1)).isoformat(), [], []
+        while True:
+            data = self.sync(cursor)
+            received += [row['id'] for row in data['results']]
+            pages.append((len(data['results']), data['has_more']))
+            cursor = data['sync_cursor']
+            if not data['has_more']:
+                break
+        self.assertEqual(pages, [(3, True), (3, True), (2, False)])
+        self.assertEqual(received, self.ids)
+
+    def test_delta_under_the_cap_has_no_more(self):
+        ProductRequest.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        ProductRequest.objects.filter(pk__in=self.ids[:2]).update(updated_at=timezone.now())
+        data = self.sync((timezone.now() - timedelta(hours=1)).isoformat())
+        self.assertEqual([row['id'] for row in data['results']], self.ids[:2])
+        self.assertFalse(data['has_more'])
+
+    def test_malformed_cursor_is_rejected(self):
+        response = self.client.get(self.url, {'updated_since': '2025-01-01T00:00:00Z~x'})
+        self.assertEqual(response.status_code, 400)
+
+
+# --- Stock leaving on fulfilment (api/pickups.py consume_stock) ---
+class FulfilmentStockTests(TestCase):
+    def setUp(self):
+        self.center = DistributionCenter.objects.create(name='Central', location='1 Main St')
+        pads = ProductType.objects.create(name='Pads')
+        self.item = InventoryItem.objects.create(distribution_center=self.center, product_type=pads, quantity=10)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        self.pads = pads
+
+    def ready_request(self, quantity, allocated_quantity=None):
+        request = ProductRequest.objects.create(
+            requester_phone_number='+254700000001', product_type=self.pads, quantity=quantity,
+            allocated_quantity=allocated_quantity, assigned_distribution_center=self.center,
+        )
+        request.status = 'Ready'
+        request.save()
+        return request
+
+    def stock(self):
+        self.item.refresh_from_db()
+        return self.item.quantity
+
+    def test_every_way_into_fulfilled_takes_the_units(self):
+        redeemed = self.ready_request(3, allocated_quantity=2)
+        response = self.client.post('/api/pickups/verify/', {'code': redeemed.pickup_code}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.stock(), 8)  # The allocated quantity
+
+        patched = self.ready_request(3)
+        response = self.client.patch(f'/api/product-requests/{patched.pk}/', {'status': 'Fulfilled'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.stock(), 5)
+
+        batch = [self.ready_request(1).pk, self.ready_request(2).pk]
+        response = self.client.post(
+            '/api/product-requests/transition/', {'ids': batch, 'to_status': 'Fulfilled'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.stock(), 2)
+
+    def test_shortage_is_a_conflict_and_changes_nothing(self):
+        request = self.ready_request(11)
+        for method, url, data in (
+            ('patch', f'/api/product-requests/{request.pk}/', {'status': 'Fulfilled'}),
+            ('post', '/api/product-requests/transition/', {'ids': [request.pk], 'to_status': 'Fulfilled'}),
+            ('post', '/api/pickups/verify/', {'code': request.pickup_code}),
+        ):
+            with self.subTest(url=url):
+                response = getattr(self.client, method)(url, data, format='json')
+                self.assertEqual(response.status_code, 409, response.content)
+                self.assertEqual(self.stock(), 10)
+                self.assertEqual(ProductRequest.objects.get(pk=request.pk).status, 'Ready')
+
+
+    def test_admin_shows_a_shortage_instead_of_failing(self):
+        request = self.ready_request(11)
+        admin = Client()
+        admin.force_login(User.objects.create_superuser('admin'))
+        url = f'/admin/api/productrequest/{request.pk}/change/'
+        form = admin.get(url).context['adminform'].form
+        data = {name: '' if value is None else value for name, value in form.initial.items() if name in form.fields}
+        data['status'] = 'Fulfilled'
+
+        response = admin.post(url, data, follow=True)
+
+        self.assertEqual(response.redirect_chain, [(url, 302)])
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ["Not saved: Center 1 doesn't have 11 units of product type 1 on hand. Update its inventory first."],
+        )
+        self.assertEqual(self.stock(), 10)
+        self.assertEqual(ProductRequest.objects.get(pk=request.pk).status, 'Ready')
+
+class AsgiApplicationTests(TransactionTestCase):
+    def setUp(self):
+        from backend.asgi import PooledWsgiToAsgi, wsgi_application
+        from .streaming import EventStreamApp
+
+        self.executor = ThreadPoolExecutor(1)
+        self.application = EventStreamApp(PooledWsgiToAsgi(wsgi_application, self.executor))
+        self.addCleanup(self.executor.shutdown)
+        self.addCleanup(self.executor.submit, connection.close)
+
+    def get(self, path):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'testserver')], 'http_version': '1.1',
+        }
+        asyncio.run(self.application(scope, receive, send))
+        return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+    def test_requests_reuse_the_pool_threads_connection(self):
+        ProductType.objects.create(name='Pads')
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            opened.append(connection)
+
+        connection_created.connect(count)
+        self.addCleanup(connection_created.disconnect, count)
+
+        for _ in range(3):
+            status, body = self.get('/api/product-types/')
+            self.assertEqual(status, 200)
+            self.assertIn(b'Pads', body)
+        self.assertEqual(len(opened), 1)
+
+    def test_event_stream_is_served_by_the_stream_app(self):
+        status, body = self.get('/api/events/')
+        self.assertEqual(status, 401)
+        self.assertIn(b'Authentication credentials', body)
+
+
+class RequestConstraintMigrationTests(TransactionTestCase):
+    before, after = ('api', '0012_delta_sync_indexes'), ('api', '0013_productrequest_constraints')
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate([self.before])
+        apps = self.executor.loader.project_state([self.before]).apps
+        self.ProductRequest = apps.get_model('api', 'ProductRequest')
+        self.AuditEvent = apps.get_model('api', 'AuditEvent')
+        user = apps.get_model(settings.AUTH_USER_MODEL).objects.create(username='amina')
+        self.requester = {
+            'requesting_organization': apps.get_model('api', 'Organization').objects.create(name='Girls Club'),
+            'requester_user_id': user.pk,
+            'product_type': apps.get_model('api', 'ProductType').objects.create(name='Pads'),
+        }
+
+    def tearDown(self):
+        MigrationExecutor(connection).migrate(self.executor.loader.graph.leaf_nodes('api'))
+
+    def create(self, **fields):
+        return self.ProductRequest.objects.create(quantity=1, **fields)
+
+    def migrate(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate([self.after])
+
+    def test_repairs_are_recorded_with_the_old_values(self):
+        organization, user_id, pads = self.requester.values()
+        both = self.create(requesting_organization=organization, requester_user_id=user_id, product_type=pads)
+        phone = self.create(
+            requester_user_id=user_id, requester_phone_number='+254700000001', pickup_details='Side door',
+            product_type=pads,
+        )
+        lower = self.create(requester_user_id=user_id, status=' ready', product_type=pads)
+
+        self.migrate()
+
+        self.assertEqual(
+            list(self.ProductRequest.objects.order_by('pk').values_list(
+                'requesting_organization', 'requester_user', 'requester_phone_number', 'pickup_details', 'status',
+            )),
+            [
+                (organization.pk, None, None, '', 'Pending'),
+                (None, user_id, None, 'Side door\nContact phone: +254700000001', 'Pending'),
+                (None, user_id, None, '', 'Ready'),
+            ],
+        )
+        changes = {event.entity_id: event.changes for event in self.AuditEvent.objects.filter(action='update')}
+        self.assertEqual(changes, {
+            both.pk: {'requester_user_id': [user_id, None]},
+            phone.pk: {
+                'requester_phone_number': ['+254700000001', None],
+                'pickup_details': ['Side door', 'Side door\nContact phone: +254700000001'],
+            },
+            lower.pk: {'status': [' ready', 'Ready']},
+        })
+
+    def test_unknown_status_stops_the_migration_unchanged(self):
+        organization, user_id, pads = self.requester.values()
+        shipped = self.create(requesting_organization=organization, status='Shipped', product_type=pads)
+        orphan = self.create(product_type=pads)
+
+        with self.assertRaisesMessage(ValueError, f"Ids: [{shipped.pk}, {orphan.pk}]"):
+            self.migrate()
+
+        shipped.refresh_from_db()
+        self.assertEqual(shipped.status, 'Shipped')
+        self.ProductRequest.objects.filter(pk__in=[shipped.pk, orphan.pk]).delete()
+
+
+class DuplicateRequestTests(TestCase):
+    def setUp(self):
+        self.pads = ProductType.objects.create(name='Pads')
+        self.amina = User.objects.create_user('amina')
+        self.client = APIClient()
+        self.client.force_authenticate(self.amina)
+        duplicates._index = duplicates.build_index()
+        self.addCleanup(setattr, duplicates, '_index', None)
+        cache.clear()
+
+    def ask(self, quantity=2):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/product-requests/', {'product_type': self.pads.pk, 'quantity': quantity}, format='json')
+
+    def test_repeated_request_is_flagged(self):
+        self.assertIs(self.ask().data['suspected_duplicate'], False)
+        self.assertIs(self.ask().data['suspected_duplicate'], True)
+        self.assertIs(self.ask(quantity=3).data['suspected_duplicate'], False)
+
+    @override_settings(DUPLICATE_REQUEST_POLICY='reject')
+    def test_repeated_request_is_rejected(self):
+        self.assertEqual(self.ask().status_code, 201)
+        response = self.ask()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['detail'].code, 'duplicate_request')
+        self.assertEqual(ProductRequest.objects.count(), 1)
+
+    @override_settings(DUPLICATE_REQUEST_POLICY='reject')
+    def test_cancelling_frees_the_requester_to_ask_again(self):
+        staff = APIClient()
+        staff.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        for cancel in (
+            lambda pk: staff.patch(f'/api/product-requests/{pk}/', {'status': 'Cancelled'}, format='json'),
+            lambda pk: staff.post('/api/product-requests/transition/', {'ids': [pk], 'to_status': 'Cancelled'}, format='json'),
+        ):
+            pk = self.ask().data['id']
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(cancel(pk).status_code, 200)
+            self.assertEqual(self.ask().status_code, 201)
+            ProductRequest.objects.filter(status='Pending').update(status='Cancelled')
+            duplicates._index = duplicates.build_index()
+
+    def test_requests_older_than_the_window_do_not_count(self):
+        self.ask()
+        later = timezone.now() + timedelta(hours=settings.DUPLICATE_REQUEST_WINDOW_HOURS)
+        with mock.patch('api.duplicates.timezone.now', return_value=later - timedelta(minutes=1)):
+            self.assertIs(duplicates.check_duplicate_request(self.pads, 2, requester_user=self.amina), True)
+        bucket = timedelta(minutes=settings.DUPLICATE_INDEX_BUCKET_MINUTES)
+        with mock.patch('api.duplicates.timezone.now', return_value=later + bucket):
+            self.assertIs(duplicates.check_duplicate_request(self.pads, 2, requester_user=self.amina), False)
+
+    def test_rebuild_picks_up_other_workers_requests(self):
+        ProductRequest.objects.bulk_create([ProductRequest(requester_user=self.amina, product_type=self.pads, quantity=2)])
+        self.assertIs(duplicates.check_duplicate_request(self.pads, 2, requester_user=self.amina), False)
+
+        duplicates.refresh_index()
+
+        self.assertIs(duplicates.check_duplicate_request(self.pads, 2, requester_user=self.amina), True)
+
+    def test_changes_committed_during_a_rebuild_are_kept(self):
+        build_index = duplicates.build_index
+
+        def build_while_a_request_commits():
+            index = build_index()
+            self.ask()
+            return index
+
+        with mock.patch('api.duplicates.build_index', build_while_a_request_commits):
+            duplicates.refresh_index()
+        self.assertIs(duplicates.check_duplicate_request(self.pads, 2, requester_user=self.amina), True)
+
+    @override_settings(DUPLICATE_INDEX_SHARED=True)
+    def test_shared_cache_carries_other_workers_requests(self):
+        # Another worker's create and cancellation reach this one through the cache alone.
+        fingerprint = duplicates.request_fingerprint(self.amina.pk, None, self.pads.pk, 2)
+        duplicates._update_shared_index('add', fingerprint, timezone.now())
+        self.assertIs(duplicates.check_duplicate_request(self.pads, 2, requester_user=self.amina), True)
+
+        duplicates._update_shared_index('discard', fingerprint, timezone.now())
+        self.assertIs(duplicates.check_duplicate_request(self.pads, 2, requester_user=self.amina), False)
+
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def sign_up_data(username):
+    return {'username': username, 'email': f'{username}@example.com', 'password': 'Lt-6b1d9c2e', 'password2': 'Lt-6b1d9c2e'}
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def sign_up(self, username, key):
+        return self.client.post('/api/auth/registration/', sign_up_data(username), format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.sign_up('amina', 'k1')
+        retry = self.sign_up('amina', 'k1')
+
+        self.assertEqual(first.status_code, 201, first.content)
+        self.assertEqual((retry.status_code, retry.data), (201, first.data))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(User.objects.filter(username='amina').count(), 1)
+
+    def test_key_reused_for_another_body_is_refused(self):
+        self.sign_up('amina', 'k1')
+        response = self.client.post(
+            '/api/auth/registration/', {**sign_up_data('amina'), 'email': 'other@example.com'},
+            format='json', HTTP_IDEMPOTENCY_KEY='k1',
+        )
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(User.objects.get(username='amina').email, 'amina@example.com')
+
+    def test_anonymous_sign_ups_with_the_same_key_do_not_collide(self):
+        self.assertEqual(self.sign_up('amina', '1').status_code, 201)
+        response = self.sign_up('wanjiru', '1')
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_sign_up_response_is_kept_only_briefly(self):
+        self.sign_up('amina', 'k1')
+        later = time.time() + settings.IDEMPOTENCY_CREDENTIALS_TTL_SECONDS + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            response = self.sign_up('amina', 'k1')
+
+        self.assertEqual(response.status_code, 400)  # Ran again: the username is taken
+        self.assertNotIn('Idempotent-Replayed', response)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class IdempotencyKeyRaceTests(TransactionTestCase):
+    def test_concurrent_retry_waits_for_the_first_and_replays_it(self):
+        cache.clear()
+        register_user = registration.register_user
+
+        def slow_register_user(*args, **kwargs):
+            time.sleep(0.3)  # Long enough for the retry to find the key taken
+            return register_user(*args, **kwargs)
+
+        responses = []
+
+        def sign_up():
+            responses.append(APIClient().post(
+                '/api/auth/registration/', sign_up_data('amina'), format='json', HTTP_IDEMPOTENCY_KEY='k1',
+            ))
+
+        with mock.patch('api.serializers.register_user', slow_register_user):
+            run_in_threads(sign_up, sign_up)
+
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        self.assertEqual(sorted(response.get('Idempotent-Replayed', '') for response in responses), ['', 'true'])
+        self.assertEqual(responses[0].data, responses[1].data)
+        self.assertEqual(User.objects.filter(username='amina').count(), 1)
+
+
+class PickupTests(TestCase):
+    def setUp(self):
+        self.pads = ProductType.objects.create(name='Pads')
+        self.center = DistributionCenter.objects.create(
+            name='Central', location='1 Main St', operating_hours='Mon-Fri 9am-5pm', pickup_slot_capacity=1,
+        )
+        self.item = InventoryItem.objects.create(distribution_center=self.center, product_type=self.pads, quantity=100)
+        self.organization = Organization.objects.create(name='Girls Club')
+        self.client = APIClient()
+        self.client.force_authenticate(self.center_admin('central_admin', self.center))
+
+    def center_admin(self, username, center):
+        user = User.objects.create_user(username)
+        user.profile.role = 'center_admin'
+        user.profile.save()
+        center.admin_profile = user.profile
+        center.save()
+        return user
+
+    def ready_request(self, quantity=2):
+        request = ProductRequest.objects.create(
+            requesting_organization=self.organization, product_type=self.pads, quantity=quantity,
+            assigned_distribution_center=self.center,
+        )
+        request.status = 'Ready'
+        request.save()
+        return request
+
+    def redeem(self, code, client=None):
+        return (client or self.client).post('/api/pickups/verify/', {'code': code}, format='json')
+
+    def test_ready_books_the_earliest_slots_with_room(self):
+        first, second = self.ready_request(), self.ready_request()
+
+        self.assertNotEqual(first.pickup_slot_id, second.pickup_slot_id)  # One pickup per slot
+        self.assertLess(first.pickup_slot.starts_at, second.pickup_slot.starts_at)
+        self.assertGreaterEqual(
+            first.pickup_slot.starts_at, timezone.now() + timedelta(minutes=settings.PICKUP_LEAD_MINUTES),
+        )
+        earlier = PickupSlot.objects.filter(distribution_center=self.center, starts_at__lt=first.pickup_slot.starts_at)
+        self.assertFalse(earlier.filter(starts_at__gte=timezone.now() + timedelta(minutes=settings.PICKUP_LEAD_MINUTES)).exists())
+
+    def test_leaving_ready_frees_the_slot_and_voids_the_code(self):
+        request = self.ready_request()
+        slot = request.pickup_slot
+        request.status = 'Pending'
+        request.save()
+
+        slot.refresh_from_db()
+        self.assertEqual(slot.booked, 0)
+        self.assertEqual((request.pickup_slot_id, request.pickup_code), (None, None))
+        self.assertEqual(self.ready_request().pickup_slot_id, slot.pk)  # Free for the next one
+
+    def test_codes_are_unique_and_unambiguous(self):
+        requests = [
+            ProductRequest.objects.create(requesting_organization=self.organization, product_type=self.pads, quantity=1)
+            for _ in range(30)
+        ]
+        ProductRequest.bulk_transition(ProductRequest.objects.all(), [request.pk for request in requests], 'Ready')
+
+        codes = list(ProductRequest.objects.values_list('pickup_code', flat=True))
+        self.assertEqual(len(set(codes)), 30)
+        for code in codes:
+            self.assertEqual(len(code), settings.PICKUP_CODE_LENGTH)
+            self.assertFalse(set(code) & set('01OIL'))
+
+    def test_code_is_redeemed_once(self):
+        request = self.ready_request()
+        spaced = f'{request.pickup_code[:3]} {request.pickup_code[3:].lower()}'
+
+        self.assertEqual(self.redeem(spaced).status_code, 200)
+        response = self.redeem(request.pickup_code)
+
+        self.assertEqual(response.status_code, 409)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 98)  # Taken once
+
+    def test_another_centers_code_is_unknown(self):
+        request = self.ready_request()
+        other = APIClient()
+        other.force_authenticate(self.center_admin('east_admin', DistributionCenter.objects.create(name='East', location='2 Side St')))
+
+        self.assertEqual(self.redeem(request.pickup_code, other).status_code, 404)
+        self.assertEqual(self.redeem('ZZZZZZ').status_code, 404)
+        self.assertEqual(ProductRequest.objects.get(pk=request.pk).status, 'Ready')
+
+    def test_redemption_query_count(self):
+        request = self.ready_request()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            redeem_pickup_code(request.pickup_code)
+
+        statements = [query['sql'] for query in queries.captured_queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(statements), 7, '\n'.join(statements))
+        self.assertEqual(len(callbacks), 3)  # Audit events, live events and low-stock alerts
+
+
+class DonationLedgerTests(TestCase):
+    def setUp(self):
+        self.pads = ProductType.objects.create(name='Pads')
+        self.cups = ProductType.objects.create(name='Cups')
+        self.center = DistributionCenter.objects.create(name='Central', location='1 Main St')
+        self.donor = User.objects.create_user('donor')
+        self.donor.profile.role = 'donor'
+        self.donor.profile.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.donor)
+        self.staff = APIClient()
+        self.staff.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def pledge(self, *pledges):
+        return self.client.post('/api/donations/', {'pledges': [
+            {'product_type': product_type.pk, 'distribution_center': self.center.pk, 'quantity': quantity}
+            for product_type, quantity in pledges
+        ]}, format='json')
+
+    def transition(self, client, ids, to_status):
+        return client.post('/api/donations/transition/', {'ids': ids, 'to_status': to_status}, format='json')
+
+    def totals(self):
+        return {
+            row[0]: row[1:]
+            for row in DonorTotal.objects.filter(donor=self.donor).values_list(
+                'product_type__name', 'pledge_count', 'pledged_quantity', 'received_quantity',
+            )
+        }
+
+    def test_batch_is_recorded_with_running_totals(self):
+        response = self.pledge((self.pads, 5), (self.pads, 3), (self.cups, 2))
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(Donation.objects.filter(donor=self.donor, status='Pledged').count(), 3)
+        self.assertEqual(self.totals(), {'Pads': (2, 8, 0), 'Cups': (1, 2, 0)})
+
+    def test_unknown_ids_reject_the_whole_batch(self):
+        response = self.client.post('/api/donations/', {'pledges': [
+            {'product_type': self.pads.pk, 'distribution_center': self.center.pk, 'quantity': 1},
+            {'product_type': 999, 'distribution_center': 998, 'quantity': 1},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['product_type'], ["Unknown product types: [999]"])
+        self.assertEqual(response.data['distribution_center'], ["Unknown distribution centers: [998]"])
+        self.assertFalse(Donation.objects.exists())
+        self.assertFalse(DonorTotal.objects.exists())
+
+    def test_receiving_credits_inventory_in_place(self):
+        item = InventoryItem.objects.create(distribution_center=self.center, product_type=self.pads, quantity=10)
+        ids = self.pledge((self.pads, 5), (self.pads, 3), (self.cups, 4)).data['ids']
+        InventoryItem.objects.filter(pk=item.pk).update(quantity=F('quantity') + 1)  # A stock edit meanwhile
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.transition(self.staff, ids, 'Received')
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            dict(InventoryItem.objects.filter(distribution_center=self.center).values_list('product_type__name', 'quantity')),
+            {'Pads': 19, 'Cups': 4},  # Cups had no inventory row yet
+        )
+        [credit] = [sql for sql in tables_queried(queries, 'api_inventoryitem') if sql.startswith('UPDATE')]
+        self.assertIn('SET "quantity" = ("api_inventoryitem"."quantity" + CASE', credit)
+        self.assertEqual(self.totals(), {'Pads': (2, 8, 8), 'Cups': (1, 4, 4)})
+
+    def test_cancelling_takes_the_pledge_off_the_totals(self):
+        ids = self.pledge((self.pads, 5), (self.pads, 3)).data['ids']
+
+        response = self.transition(self.client, [ids[0]], 'Cancelled')
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.totals(), {'Pads': (1, 3, 0)})
+        self.assertEqual(self.transition(self.client, [ids[1]], 'Received').status_code, 403)  # Donors only cancel
+
+    def test_recount_agrees_with_the_running_totals(self):
+        ids = self.pledge((self.pads, 5), (self.pads, 3), (self.cups, 2), (self.cups, 7)).data['ids']
+        self.transition(self.staff, [ids[0], ids[2]], 'Received')
+        self.transition(self.client, [ids[1]], 'Cancelled')
+        running = list(DonorTotal.objects.order_by('product_type').values(
+            'donor', 'product_type', 'pledge_count', 'pledged_quantity', 'received_quantity', 'last_pledged_at',
+        ))
+
+        recount_donor_totals()
+
+        self.assertEqual(running, list(DonorTotal.objects.order_by('product_type').values(
+            'donor', 'product_type', 'pledge_count', 'pledged_quantity', 'received_quantity', 'last_pledged_at',
+        )))
+
+
+class AllocationTests(TestCase):
+    def test_random_allocations_never_overdraw_or_overserve(self):
+        rng = np.random.default_rng(45)
+        for mode in ALLOCATION_MODES:
+            for _ in range(200):
+                group_count = int(rng.integers(1, 5))
+                requests, centers = int(rng.integers(0, 40)), int(rng.integers(0, 8))
+                quantities = rng.integers(1, 30, requests)
+                weights = rng.choice([1.0, 2.0, 3.5], requests)
+                groups = rng.integers(0, group_count, requests)
+                center_groups = rng.integers(0, group_count, centers)
+                stock = rng.integers(0, 60, centers)
+
+                assigned, units = allocate(quantities, weights, groups, center_groups, stock, mode)
+
+                with self.subTest(mode=mode, quantities=quantities.tolist(), stock=stock.tolist()):
+                    self.assertTrue((units >= 0).all() and (units <= quantities).all())  # No request over-served
+                    self.assertTrue(((assigned >= 0) == (units > 0)).all())
+                    served = units > 0
+                    self.assertTrue((center_groups[assigned[served]] == groups[served]).all())  # The right product
+                    drawn = np.bincount(assigned[served], units[served], minlength=centers)
+                    self.assertTrue((drawn <= stock).all())  # No center over-drawn
+                    demand = np.bincount(groups, quantities, minlength=group_count)
+                    supply = np.bincount(center_groups, stock, minlength=group_count)
+                    self.assertTrue((np.bincount(groups, units, minlength=group_count) <= np.minimum(demand, supply)).all())
+
+    def test_fair_shares_fill_smallest_requests_first(self):
+        rng = np.random.default_rng(46)
+        for _ in range(200):
+            quantities = rng.integers(1, 30, 25)
+            groups = rng.integers(0, 3, 25)
+            supply = rng.integers(0, 300, 3)
+
+            units = fair_shares(quantities, np.ones(25), groups, supply)
+
+            with self.subTest(quantities=quantities.tolist(), groups=groups.tolist(), supply=supply.tolist()):
+                self.assertTrue((units <= quantities).all())
+                demand = np.bincount(groups, quantities, minlength=3)
+                self.assertEqual(np.bincount(groups, units, minlength=3).tolist(), np.minimum(demand, supply).tolist())
+                for i in np.flatnonzero(units < quantities):
+                    # Nobody in a short group got more than one unit over a request left short.
+                    self.assertTrue((units[groups == groups[i]] <= units[i] + 1).all())
+
+    def test_apply_refuses_a_plan_overtaken_by_another_change(self):
+        pads = ProductType.objects.create(name='Pads')
+        center = DistributionCenter.objects.create(name='Central', location='1 Main St')
+        InventoryItem.objects.create(distribution_center=center, product_type=pads, quantity=5)
+        organization = Organization.objects.create(name='Girls Club')
+        requests = [
+            ProductRequest.objects.create(requesting_organization=organization, product_type=pads, quantity=quantity)
+            for quantity in (2, 3, 4)
+        ]
+        staff = APIClient()
+        staff.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+        def plan_then_lose_the_race(*args):
+            plan = build_plan(*args)
+            ProductRequest.objects.filter(pk=requests[0].pk).update(status='Cancelled')  # Another staff member
+            return plan
+
+        with mock.patch('api.views.build_plan', plan_then_lose_the_race):
+            response = staff.post('/api/product-requests/allocation/', {}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(ProductRequest.objects.filter(assigned_distribution_center__isnull=False).exists())
+        center.refresh_from_db()
+        self.assertEqual(center.pending_request_count, 0)
+
+        response = staff.post('/api/product-requests/allocation/', {}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            sorted(ProductRequest.objects.filter(status='Pending').values_list('allocated_quantity', flat=True)),
+            [2, 3],  # 5 units split between requests for 3 and 4
+        )
@@ -0,0 +1,145 @@
+# api/throttling.py
+
+import hashlib
+import math
+
+from rest_framework.throttling import SimpleRateThrottle
+
+from .models import UserProfile
+
+STATS_KEY_FORMAT = 'throttle_stats_%(scope)s_%(decision)s'
+
+
+def record_throttle_decision(cache, scope, allowed):
+    """Bump the shared allowed/throttled counter for a throttle scope."""
+    key = STATS_KEY_FORMAT % {'scope': scope, 'decision': 'allowed' if allowed else 'throttled'}
+    # add() is a no-op if the key exists; incr() is atomic on every Django cache backend.
+    cache.add(key, 0, None)
+    cache.incr(key)
+
+
+def get_throttle_stats(cache, scopes):
+    """Return {scope: {'allowed': n, 'throttled': n}} for the given scopes."""
+    keys = {
+        (scope, decision): STATS_KEY_FORMAT % {'scope': scope, 'decision': decision}
+        for scope in scopes
+        for decision in ('allowed', 'throttled')
+    }
+    values = cache.get_many(keys.values())
+    stats = {scope: {'allowed': 0, 'throttled': 0} for scope in scopes}
+    for (scope, decision), key in keys.items():
+        stats[scope][decision] = values.get(key, 0)
+    return stats
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """
+    Sliding-window counter throttle.
+
+    DRF's SimpleRateThrottle stores the timestamp of every request in the
+    window, so memory and work per check grow with the rate. This keeps two
+    integer counters per client instead -- the current and previous fixed
+    window -- and estimates the sliding count as
+
+        previous * (share of the previous window still in view) + current
+
+    Each check is one get_many() plus one incr(), whatever the rate.
+    """
+    cache_format = 'throttle_%(scope)s_%(ident)s_%(window)d'
+
+    def get_cache_key(self, request, view):
+        raise NotImplementedError('.get_cache_key() must be overridden')
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        ident = self.get_cache_key(request, view)
+        if ident is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = self.now - window * self.duration
+        current_key = self.cache_format % {'scope': self.scope, 'ident': ident, 'window': window}
+        previous_key = self.cache_format % {'scope': self.scope, 'ident': ident, 'window': window - 1}
+
+        counts = self.cache.get_many([current_key, previous_key])
+        self.current_count = counts.get(current_key, 0)
+        self.previous_count = counts.get(previous_key, 0)
+        previous_weight = (self.duration - self.elapsed) / self.duration
+
+        allowed = self.previous_count * previous_weight + self.current_count < self.num_requests
+        if allowed:
+            # The counter must outlive the next window, where it is read as "previous".
+            self.cache.add(current_key, 0, self.duration * 2)
+            self.cache.incr(current_key)
+        record_throttle_decision(self.cache, self.scope, allowed)
+        return allowed
+
+    def wait(self):
+        """Seconds until the sliding estimate drops back under the limit."""
+        remaining_in_window = self.duration - self.elapsed
+        if self.current_count < self.num_requests and self.previous_count:
+            # Solve previous * (remaining - t) / duration + current < limit for t.
+            headroom = self.num_requests - self.current_count
+            wait = remaining_in_window - self.duration * headroom / self.previous_count
+        else:
+            # The current window alone is full: wait for it to roll over, then
+            # for its weight as the previous window to decay under the limit.
+            wait = remaining_in_window + self.duration * (1 - self.num_requests / max(self.current_count, 1))
+        return max(math.ceil(wait), 1)
+
+
+class RoleRateThrottle(SlidingWindowRateThrottle):
+    """
+    Per-user limit whose rate depends on the user's UserProfile.role.
+
+    Staff use the 'staff' rate, users without a profile the 'individual'
+    rate and anonymous clients the 'anon' rate, keyed by IP address.
+    """
+    scope = 'anon'
+
+    def allow_request(self, request, view):
+        self.scope = self.get_scope(request)
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+    def get_scope(self, request):
+        user = request.user
+        if not (user and user.is_authenticated):
+            return 'anon'
+        if user.is_staff or user.is_superuser:
+            return 'staff'
+        try:
+            return user.profile.role
+        except UserProfile.DoesNotExist:
+            return 'individual'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
+
+
+class TokenRateThrottle(SlidingWindowRateThrottle):
+    """Per-API-token limit, so one leaked or looping token can't use up a user's whole budget."""
+    scope = 'token'
+
+    def get_cache_key(self, request, view):
+        token = getattr(request, 'auth', None)
+        key = getattr(token, 'key', None)
+        if not key:
+            return None
+        # Never put the raw token into cache keys.
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+class PhoneNumberRateThrottle(SlidingWindowRateThrottle):
+    """Per-sender limit for SMS requests, keyed by the requester's phone number."""
+    scope = 'sms_phone'
+
+    def get_cache_key(self, request, view):
+        phone_number = ''.join(request.POST.get('From', '').split())
+        return phone_number or None
@@ -17,15 +17,37 @@ urlpatterns = [
 
     # Product Request endpoints
     path('product-requests/', views.ProductRequestListCreateAPIView.as_view(), name='product-request-list-create'),
+    path('product-requests/transition/', views.ProductRequestTransitionAPIView.as_view(), name='product-request-transition'),
+    path('product-requests/allocation/', views.ProductRequestAllocationAPIView.as_view(), name='product-request-allocation'),
     path('product-requests/<int:pk>/', views.ProductRequestRetrieveUpdateDestroyAPIView.as_view(), name='product-request-detail'),
 
+    # Pickup endpoints
+    path('pickups/verify/', views.PickupVerifyAPIView.as_view(), name='pickup-verify'),
+
+    # Donation endpoints
+    path('donations/', views.DonationListCreateAPIView.as_view(), name='donation-list-create'),
+    path('donations/transition/', views.DonationTransitionAPIView.as_view(), name='donation-transition'),
+    path('donations/summary/', views.DonorSummaryAPIView.as_view(), name='donor-summary'),
+
     # Inventory endpoints
     path('inventory/', views.InventoryItemListAPIView.as_view(), name='inventory-item-list'),
+    path('inventory/forecast/', views.InventoryForecastAPIView.as_view(), name='inventory-forecast'),
+    path('inventory/forecast/alerts/', views.InventoryForecastAlertsAPIView.as_view(), name='inventory-forecast-alerts'),
+    path('inventory/low-stock/', views.LowStockAlertListAPIView.as_view(), name='inventory-low-stock'),
     path('inventory/<int:pk>/', views.InventoryItemRetrieveUpdateAPIView.as_view(), name='inventory-item-detail'),
 
     # SMS Webhook endpoint
     path('sms/webhook/', views.sms_webhook, name='sms-webhook'),
 
+    # Live events: the stream itself (/api/events/) is served by api/streaming.py
+    path('events/ticket/', views.EventStreamTicketAPIView.as_view(), name='event-stream-ticket'),
+
+    # Audit log (staff only)
+    path('audit-events/', views.AuditEventListAPIView.as_view(), name='audit-event-list'),
+
+    # Metrics endpoints (staff only)
+    path('metrics/throttles/', views.ThrottleStatsAPIView.as_view(), name='throttle-stats'),
+
     # TODO: Add Authentication endpoints (Login, Logout, Register User) later using DRF or dj-rest-auth/djoser
     # >>> REMOVE THIS LINE <<<
     # path('auth/user/', views.CurrentUserAPIView.as_view(), name='current-user'),
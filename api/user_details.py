@@ -0,0 +1,87 @@
+# api/user_details.py
+"""
+The /api/auth/user/ document, which the frontend fetches on every page load.
+
+It is built with one query (the user joined to its profile and the
+organization / center the profile manages) and cached per user for
+USER_DETAILS_CACHE_SECONDS. The signal receivers below drop a user's cached
+document once a change to the user, their profile or a managed organization
+or center commits.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+
+from .models import UserProfile, Organization, DistributionCenter
+
+User = get_user_model()
+
+
+def user_details_cache_key(user_id):
+    return f'user_details:{user_id}'
+
+
+def get_user_details_queryset():
+    return User.objects.select_related(
+        'profile', 'profile__managed_organization', 'profile__managed_distribution_center'
+    )
+
+
+def get_cached_user_details(user_id):
+    if settings.USER_DETAILS_CACHE_SECONDS <= 0:
+        return None
+    return cache.get(user_details_cache_key(user_id))
+
+
+def cache_user_details(user_id, data):
+    if settings.USER_DETAILS_CACHE_SECONDS > 0:
+        cache.set(user_details_cache_key(user_id), data, settings.USER_DETAILS_CACHE_SECONDS)
+
+
+def invalidate_user_details(user_ids=(), profile_ids=()):
+    """Drop the cached documents of these users (or profiles' users) after the transaction commits."""
+    user_ids = {pk for pk in user_ids if pk is not None}
+    profile_ids = {pk for pk in profile_ids if pk is not None}
+    if not user_ids and not profile_ids:
+        return
+
+    def invalidate():
+        ids = set(user_ids)
+        if profile_ids:
+            ids.update(UserProfile.objects.filter(pk__in=profile_ids).values_list('user_id', flat=True))
+        cache.delete_many([user_details_cache_key(pk) for pk in ids])
+
+    transaction.on_commit(invalidate)
+
+
+def user_changed(sender, instance, **kwargs):
+    invalidate_user_details(user_ids=[instance.pk])
+
+
+def profile_changed(sender, instance, **kwargs):
+    invalidate_user_details(user_ids=[instance.user_id])
+
+
+def managed_entity_saving(sender, instance, raw=False, **kwargs):
+    # The admin being replaced loses the link, so their document changes too.
+    if not raw:
+        previous = getattr(instance, '_audit_snapshot', {}).get('admin_profile_id')
+        if previous != instance.admin_profile_id:
+            invalidate_user_details(profile_ids=[previous])
+
+
+def managed_entity_changed(sender, instance, **kwargs):
+    invalidate_user_details(profile_ids=[instance.admin_profile_id])
+
+
+post_save.connect(user_changed, sender=User, dispatch_uid='user_details_user_saved')
+post_delete.connect(user_changed, sender=User, dispatch_uid='user_details_user_deleted')
+post_save.connect(profile_changed, sender=UserProfile, dispatch_uid='user_details_profile_saved')
+post_delete.connect(profile_changed, sender=UserProfile, dispatch_uid='user_details_profile_deleted')
+for _model in (Organization, DistributionCenter):
+    pre_save.connect(managed_entity_saving, sender=_model, dispatch_uid=f'user_details_{_model._meta.model_name}_saving')
+    post_save.connect(managed_entity_changed, sender=_model, dispatch_uid=f'user_details_{_model._meta.model_name}_saved')
+    post_delete.connect(managed_entity_changed, sender=_model, dispatch_uid=f'user_details_{_model._meta.model_name}_deleted')
@@ -1,16 +1,24 @@
 # api/views.py
 
+import logging
+
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied, ValidationError as DRFValidationError
+from rest_framework.views import APIView
+from rest_framework.settings import api_settings
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError as DRFValidationError
+from django.conf import settings
 from django.contrib.auth import get_user_model
 # Import ensure_csrf_cookie decorator
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie # <-- Import ensure_csrf_cookie
 from django.views.decorators.http import require_POST
 from django.http import HttpResponse, JsonResponse # Import JsonResponse
+from django.db import models as django_models, transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
 
 # Import the default RegisterView from dj-rest-auth
 from dj_rest_auth.registration.views import RegisterView as DjRestAuthRegisterView
+from dj_rest_auth.views import UserDetailsView as DjRestAuthUserDetailsView
 
 from .models import (
     UserProfile,
@@ -19,6 +27,11 @@ from .models import (
     ProductType,
     InventoryItem,
     ProductRequest,
+    Donation,
+    AuditEvent,
+    LowStockAlert,
+    InsufficientStock,
+    VersionConflict,
     USER_ROLE_CHOICES
 )
 from .serializers import (
@@ -28,10 +41,41 @@ from .serializers import (
     ProductRequestSerializer,
     CustomUserDetailsSerializer,
     OrganizationSerializer,
-    RegisterSerializer
+    RegisterSerializer,
+    ProductRequestTransitionSerializer,
+    AllocationSerializer,
+    PickupCodeSerializer,
+    DonationSerializer,
+    DonationBatchSerializer,
+    DonationTransitionSerializer,
+    AuditEventSerializer,
+    LowStockAlertSerializer
+)
+from .exceptions import Conflict
+from .allocation import apply_plan, build_plan
+from .donations import donor_summary, ingest_pledges, transition_donations
+from .duplicates import check_duplicate_request
+from .forecasting import forecast_stock
+from .pickups import redeem_pickup_code
+from .streaming import issue_stream_ticket
+from .mixins import (
+    DeltaSyncMixin,
+    IdempotentCreateMixin,
+    NormalizedListMixin,
+    OptimisticConcurrencyMixin,
+    SparseFieldsetMixin,
+    ValuesListMixin
+)
+from .user_details import cache_user_details, get_cached_user_details, get_user_details_queryset
+from .throttling import (
+    RoleRateThrottle,
+    TokenRateThrottle,
+    PhoneNumberRateThrottle,
+    get_throttle_stats
 )
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 # --- CSRF Cookie View ---
 @ensure_csrf_cookie # This decorator tells Django to set the csrftoken cookie
@@ -47,40 +91,64 @@ def csrf_cookie_view(request):
 
 
 # --- Custom Registration View (Keep existing) ---
-class CustomRegisterView(DjRestAuthRegisterView):
-    # ... (keep existing code from previous step) ...
+class CustomRegisterView(IdempotentCreateMixin, DjRestAuthRegisterView):
     """
-    Custom registration view to fix the serializer.save() argument issue
-    and potentially add custom logic during registration if needed later.
+    Registration through api/registration.py: the user, profile and auth
+    token are created in one transaction, and the token returned in the
+    response is the one cached on the new user, so no further queries.
+    (Also fixes dj-rest-auth's serializer.save(request) call, which our
+    ModelSerializer-based RegisterSerializer doesn't take.)
     """
-    def perform_create(self, serializer):
-        # ... (keep perform_create logic from previous step) ...
-        print(">>> CustomRegisterView.perform_create called <<<")
-        print("Serializer validated_data:", serializer.validated_data)
+    idempotency_anonymous_owner_field = 'username'
+    idempotency_response_has_credentials = True  # The new account's auth token
 
+    def perform_create(self, serializer):
         user = serializer.save()
-
-        print("User created successfully by serializer.save():", user)
+        logger.info("User %s registered.", user.pk)
         return user
 
 
+# --- Current User View ---
+class CustomUserDetailsView(DjRestAuthUserDetailsView):
+    """
+    /api/auth/user/ with the profile and its managed organization / center
+    loaded in one query, and the whole document cached per user (see
+    api/user_details.py). ?fields= / ?exclude= requests skip the cache.
+    """
+
+    def get_object(self):
+        return get_user_details_queryset().get(pk=self.request.user.pk)
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'fields' in request.query_params or 'exclude' in request.query_params:
+            return super().retrieve(request, *args, **kwargs)
+
+        data = get_cached_user_details(request.user.pk)
+        if data is None:
+            data = dict(self.get_serializer(self.get_object()).data)
+            cache_user_details(request.user.pk, data)
+        return Response(data)
+
+
 # --- Public/General Read-Only Views (Keep existing) ---
-class ProductTypeListAPIView(generics.ListAPIView):
+class ProductTypeListAPIView(SparseFieldsetMixin, generics.ListAPIView):
     """API endpoint that allows Product Types to be viewed by anyone."""
     queryset = ProductType.objects.all()
     serializer_class = ProductTypeSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [RoleRateThrottle]
 
 
-class DistributionCenterListAPIView(generics.ListAPIView):
+class DistributionCenterListAPIView(SparseFieldsetMixin, generics.ListAPIView):
     """API endpoint that allows Distribution Centers to be viewed by anyone."""
     queryset = DistributionCenter.objects.all()
     serializer_class = DistributionCenterSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [RoleRateThrottle]
 
 
 # --- Organization Views (Keep existing) ---
-class OrganizationListCreateAPIView(generics.ListCreateAPIView):
+class OrganizationListCreateAPIView(IdempotentCreateMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     """API endpoint that allows Organizations to be listed and created."""
     queryset = Organization.objects.all()
     serializer_class = OrganizationSerializer
@@ -94,10 +162,33 @@ class OrganizationListCreateAPIView(generics.ListCreateAPIView):
 
 
 # --- Product Request Views (Keep existing) ---
-class ProductRequestListCreateAPIView(generics.ListCreateAPIView):
+class ProductRequestListCreateAPIView(IdempotentCreateMixin, DeltaSyncMixin, NormalizedListMixin, ValuesListMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     """API endpoint for authenticated users/organizations to create new requests and view their existing requests."""
     serializer_class = ProductRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [RoleRateThrottle, TokenRateThrottle]
+    normalized_fields = {
+        'requesting_organization_name': ('requesting_organization', 'organizations'),
+        'requester_username': ('requester_user', 'users'),
+        'product_type_name': ('product_type', 'product_types'),
+        'assigned_distribution_center_name': ('assigned_distribution_center', 'distribution_centers'),
+    }
+    sync_updated_field = 'updated_at'
+    sync_entity_type = 'productrequest'
+
+    def get_tombstone_filters(self):
+        # Same scoping as get_queryset, applied to the deleted rows' audited values.
+        user = self.request.user
+        if user.is_staff or user.is_superuser:
+            return {}
+        user_profile = getattr(user, 'profile', None)
+        user_role = user_profile.role if user_profile else None
+        if user_role == 'organization_admin':
+            managed_org = getattr(user_profile, 'managed_organization', None)
+            return {'changes__requesting_organization_id': managed_org.id} if managed_org else None
+        if user_role == 'individual':
+            return {'changes__requester_user_id': user.id}
+        return None
 
     def get_queryset(self):
         # ... (keep the get_queryset logic from previous versions) ...
@@ -185,7 +276,12 @@ class ProductRequestListCreateAPIView(generics.ListCreateAPIView):
 
         elif user_role == 'individual':
              print(f"Creating Individual Web Request by user: {user.username}")
-             serializer.save(requester_user=user)
+             suspected_duplicate = check_duplicate_request(
+                 serializer.validated_data['product_type'], serializer.validated_data['quantity'], requester_user=user
+             )
+             if suspected_duplicate:
+                 print(f"Request by {user.username} flagged as a suspected duplicate.")
+             serializer.save(requester_user=user, suspected_duplicate=suspected_duplicate)
              return
 
         else:
@@ -193,8 +289,14 @@ class ProductRequestListCreateAPIView(generics.ListCreateAPIView):
              raise PermissionDenied("You do not have permission to create this type of request.")
 
 
-class ProductRequestRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
-    """API endpoint for retrieving, updating, or deleting a specific product request."""
+class ProductRequestRetrieveUpdateDestroyAPIView(OptimisticConcurrencyMixin, SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
+    """
+    API endpoint for retrieving, updating, or deleting a specific product request.
+
+    A `status` in a PUT/PATCH moves the request like the transition endpoint
+    does, with the same rules and the same permissions (staff, or the admin
+    of the assigned center).
+    """
     serializer_class = ProductRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -254,15 +356,337 @@ class ProductRequestRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyA
         print(f"User {user.username} with role '{user_role}' is not authorized to retrieve specific requests. Denying access.")
         raise PermissionDenied("You do not have permission to retrieve this request.")
 
+    def perform_update(self, serializer):
+        # `status` is read-only in the serializer; a change to it is applied here
+        # through save(), so the transition rules, status log, pickup slot and
+        # counters work as elsewhere, and only users allowed to use the
+        # transition endpoint may make it.
+        to_status = self.request.data.get('status')
+        changes_status = to_status is not None and to_status != serializer.instance.status
+        if changes_status and not status_change_queryset(self.request.user).filter(pk=serializer.instance.pk).exists():
+            raise PermissionDenied("You do not have permission to change this request's status.")
+
+        with transaction.atomic():
+            instance = serializer.save()
+            if changes_status:
+                instance.status = to_status
+                try:
+                    instance.save()
+                except DjangoValidationError as e:
+                    raise DRFValidationError(e.message_dict)
+                except InsufficientStock as e:
+                    raise Conflict(str(e))
+                print(f"User {self.request.user.username} moved request {instance.pk} to '{to_status}'.")
+
+
+def status_change_queryset(user):
+    """
+    The requests `user` may change the status of: all of them for staff, those
+    assigned to their center for center admins. Raises PermissionDenied for
+    anyone else.
+    """
+    if user.is_staff or user.is_superuser:
+        return ProductRequest.objects.all()
 
-    # TODO: Implement update, partial_update, destroy methods with object-level permissions.
+    try:
+        user_profile = user.profile
+    except UserProfile.DoesNotExist:
+        raise PermissionDenied("User profile missing.")
+
+    if user_profile.role == 'center_admin':
+        try:
+            managed_center = user_profile.managed_distribution_center
+        except DistributionCenter.DoesNotExist:
+            managed_center = None
+        if managed_center:
+            return ProductRequest.objects.filter(assigned_distribution_center=managed_center)
+
+    print(f"User {user.username} with role '{user_profile.role}' is not authorized to change request status.")
+    raise PermissionDenied("You do not have permission to change request status.")
+
+
+class ProductRequestTransitionAPIView(generics.GenericAPIView):
+    """
+    API endpoint to move many product requests to a new status in one call.
+
+    Staff may change any request; center admins only requests assigned to
+    their center. Every id must exist and allow the transition, or nothing
+    is changed.
+    """
+    serializer_class = ProductRequestTransitionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return status_change_queryset(self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        to_status = serializer.validated_data['to_status']
+
+        try:
+            updated_ids = ProductRequest.bulk_transition(
+                self.get_queryset(),
+                serializer.validated_data['ids'],
+                to_status,
+                changed_by=request.user,
+            )
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.message_dict)
+        except InsufficientStock as e:
+            raise Conflict(str(e))
+        except VersionConflict:
+            raise Conflict()
+
+        print(f"User {request.user.username} moved {len(updated_ids)} requests to '{to_status}'.")
+        return Response({'to_status': to_status, 'updated': updated_ids}, status=status.HTTP_200_OK)
+
+
+class ProductRequestAllocationAPIView(generics.GenericAPIView):
+    """
+    Fair-share allocation of scarce stock to unassigned Pending requests (staff only).
+
+    GET previews the plan: a per-product-type summary and the proposed
+    (request, center, quantity) assignments. POST builds the plan again and
+    applies it in one transaction. Both accept `mode` (max_min or
+    proportional) and `product_types` to limit the run.
+    """
+    serializer_class = AllocationSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_plan(self, data):
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return build_plan(serializer.validated_data.get('product_types'), serializer.validated_data.get('mode'))
+
+    def get(self, request, *args, **kwargs):
+        plan = self.get_plan(request.query_params)
+        return Response({'mode': plan.mode, 'summary': plan.summary, 'assignments': plan.assignments()})
+
+    def post(self, request, *args, **kwargs):
+        plan = self.get_plan(request.data)
+        try:
+            assigned = apply_plan(plan, changed_by=request.user)
+        except VersionConflict:
+            raise Conflict()
+
+        print(f"User {request.user.username} applied a '{plan.mode}' allocation to {assigned} requests.")
+        return Response({'mode': plan.mode, 'summary': plan.summary, 'assigned': assigned}, status=status.HTTP_200_OK)
+
+
+class PickupVerifyAPIView(generics.GenericAPIView):
+    """
+    Check a pickup code at the counter and mark its request Fulfilled.
+
+    Center admins can only redeem codes for requests assigned to their
+    center; staff can redeem any. A code works once: an unknown code (or
+    another center's) is 404, one already used or no longer Ready is 409.
+    """
+    serializer_class = PickupCodeSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [RoleRateThrottle, TokenRateThrottle]
+
+    def get_center_id(self):
+        """None for staff (any center), else the center admin's managed center."""
+        user = self.request.user
+        if user.is_staff or user.is_superuser:
+            return None
+
+        user_profile = getattr(user, 'profile', None)
+        if user_profile and user_profile.role == 'center_admin':
+            managed_center = getattr(user_profile, 'managed_distribution_center', None)
+            if managed_center:
+                return managed_center.id
+
+        print(f"User {user.username} is not authorized to verify pickups.")
+        raise PermissionDenied("You do not have permission to verify pickups.")
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        center_id = self.get_center_id()
+
+        try:
+            pickup = redeem_pickup_code(serializer.validated_data['code'], center_id, changed_by=request.user)
+        except ProductRequest.DoesNotExist:
+            raise NotFound("Unknown pickup code.")
+        except VersionConflict as e:
+            raise Conflict(str(e))
+
+        print(f"User {request.user.username} handed over request {pickup['pk']} by pickup code.")
+        return Response({
+            'product_request': pickup['pk'],
+            'status': pickup['status'],
+            'product_type_name': pickup['product_type__name'],
+            'quantity': pickup['allocated_quantity'] or pickup['quantity'],
+            'pickup_slot_start': pickup['pickup_slot__starts_at'],
+            'pickup_slot_end': pickup['pickup_slot__ends_at'],
+        }, status=status.HTTP_200_OK)
+
+
+# --- Donation Views ---
+class DonationListCreateAPIView(IdempotentCreateMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
+    """
+    The donation ledger. GET lists donations: donors see their own, center
+    admins the pledges to their center, staff all (filter with ?donor= and
+    ?center_id=). POST records a batch of pledges, `{"pledges": [...]}`, in
+    one transaction; donors pledge as themselves, staff may import pledges
+    for any donor.
+    """
+    serializer_class = DonationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [RoleRateThrottle, TokenRateThrottle]
+
+    def get_serializer_class(self):
+        if self.request.method == 'POST':
+            return DonationBatchSerializer
+        return DonationSerializer
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Donation.objects.select_related('donor', 'product_type', 'distribution_center')
+        if user.is_staff or user.is_superuser:
+            donor_id = self.request.query_params.get('donor')
+            center_id = self.request.query_params.get('center_id')
+            if donor_id and donor_id.isdigit():
+                queryset = queryset.filter(donor_id=int(donor_id))
+            if center_id and center_id.isdigit():
+                queryset = queryset.filter(distribution_center_id=int(center_id))
+            return queryset
+
+        user_profile = getattr(user, 'profile', None)
+        user_role = user_profile.role if user_profile else None
+        if user_role == 'donor':
+            return queryset.filter(donor=user)
+        if user_role == 'center_admin':
+            managed_center = getattr(user_profile, 'managed_distribution_center', None)
+            return queryset.filter(distribution_center=managed_center) if managed_center else queryset.none()
+
+        print(f"User {user.username} with role '{user_role}' is not authorized to view donations.")
+        raise PermissionDenied("You do not have permission to view donations.")
+
+    def create(self, request, *args, **kwargs):
+        user = request.user
+        is_staff = user.is_staff or user.is_superuser
+        user_profile = getattr(user, 'profile', None)
+        if not is_staff and (user_profile is None or user_profile.role != 'donor'):
+            print(f"User {user.username} is not a donor. Denying pledge.")
+            raise PermissionDenied("Only donors can pledge donations.")
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pledges = [
+            {
+                'donor_id': (pledge.get('donor') if is_staff else None) or user.id,
+                'product_type_id': pledge['product_type'],
+                'distribution_center_id': pledge['distribution_center'],
+                'quantity': pledge['quantity'],
+                'note': pledge.get('note', ''),
+                'pledged_at': pledge.get('pledged_at') if is_staff else None,
+            }
+            for pledge in serializer.validated_data['pledges']
+        ]
+        try:
+            donations = ingest_pledges(pledges)
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.message_dict)
+
+        print(f"User {user.username} recorded {len(donations)} pledges.")
+        return Response(
+            {'created': len(donations), 'ids': [donation.pk for donation in donations]},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class DonationTransitionAPIView(generics.GenericAPIView):
+    """
+    Mark many pledges Received or Cancelled in one call, all or nothing.
+
+    Receiving credits the center's inventory. Center admins may change
+    pledges to their center, staff any; donors may only cancel their own.
+    """
+    serializer_class = DonationTransitionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self, to_status):
+        user = self.request.user
+        if user.is_staff or user.is_superuser:
+            return Donation.objects.all()
+
+        user_profile = getattr(user, 'profile', None)
+        user_role = user_profile.role if user_profile else None
+        if user_role == 'center_admin':
+            managed_center = getattr(user_profile, 'managed_distribution_center', None)
+            if managed_center:
+                return Donation.objects.filter(distribution_center=managed_center)
+        elif user_role == 'donor' and to_status == 'Cancelled':
+            return Donation.objects.filter(donor=user)
+
+        print(f"User {user.username} with role '{user_role}' is not authorized to mark donations {to_status}.")
+        raise PermissionDenied("You do not have permission to change these donations.")
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        to_status = serializer.validated_data['to_status']
+
+        try:
+            updated_ids = transition_donations(
+                self.get_queryset(to_status),
+                serializer.validated_data['ids'],
+                to_status,
+                changed_by=request.user,
+            )
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.message_dict)
+        except VersionConflict:
+            raise Conflict()
+
+        print(f"User {request.user.username} marked {len(updated_ids)} donations '{to_status}'.")
+        return Response({'to_status': to_status, 'updated': updated_ids}, status=status.HTTP_200_OK)
+
+
+class DonorSummaryAPIView(APIView):
+    """
+    A donor's pledged and received totals, overall and per product type,
+    read from the pre-aggregated DonorTotal rows. Staff may pass ?donor=<id>.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [RoleRateThrottle, TokenRateThrottle]
+
+    def get(self, request, *args, **kwargs):
+        donor_id = request.user.id
+        requested = request.query_params.get('donor')
+        if requested and (request.user.is_staff or request.user.is_superuser):
+            if not requested.isdigit():
+                raise DRFValidationError({'donor': 'Must be a user id.'})
+            donor_id = int(requested)
+        return Response(donor_summary(donor_id))
 
 
 # --- Inventory Views (Keep existing) ---
-class InventoryItemListAPIView(generics.ListAPIView):
+class InventoryItemListAPIView(DeltaSyncMixin, NormalizedListMixin, ValuesListMixin, SparseFieldsetMixin, generics.ListAPIView):
     """API endpoint to list inventory items."""
     serializer_class = InventoryItemSerializer
     permission_classes = [permissions.IsAuthenticated]
+    normalized_fields = {
+        'product_type_name': ('product_type', 'product_types'),
+    }
+    sync_updated_field = 'last_updated'
+    sync_entity_type = 'inventoryitem'
+
+    def get_tombstone_filters(self):
+        # Same scoping as get_queryset, applied to the deleted rows' audited values.
+        user = self.request.user
+        user_profile = getattr(user, 'profile', None)
+        user_role = user_profile.role if user_profile else None
+        if user.is_staff or user.is_superuser or user_role == 'system_admin':
+            center_id = self.request.query_params.get('center_id', None)
+            return {'changes__distribution_center_id': int(center_id)} if center_id and center_id.isdigit() else {}
+        if user_role == 'center_admin':
+            managed_center = getattr(user_profile, 'managed_distribution_center', None)
+            return {'changes__distribution_center_id': managed_center.id} if managed_center else None
+        return None
 
     def get_queryset(self):
         # ... (keep the get_queryset logic from previous versions) ...
@@ -285,9 +709,9 @@ class InventoryItemListAPIView(generics.ListAPIView):
 
         if user.is_staff or user.is_superuser or user_role == 'system_admin':
              center_id = self.request.query_params.get('center_id', None)
-             if center_id is not None:
+             if center_id and center_id.isdigit():
                   print(f"Admin/Staff user {user.username} filtering inventory by center_id={center_id}")
-                  return queryset.filter(distribution_center_id=center_id).order_by('distribution_center__name', 'product_type__name')
+                  return queryset.filter(distribution_center_id=int(center_id)).order_by('distribution_center__name', 'product_type__name')
              print(f"Admin/Staff user {user.username} listing all inventory.")
              return queryset.order_by('distribution_center__name', 'product_type__name')
 
@@ -309,8 +733,71 @@ class InventoryItemListAPIView(generics.ListAPIView):
         raise PermissionDenied("You do not have permission to view inventory.")
 
 
-class InventoryItemRetrieveUpdateAPIView(generics.RetrieveUpdateAPIView):
+class InventoryForecastAPIView(InventoryItemListAPIView):
+    """
+    API endpoint forecasting days of stock remaining for the inventory the user may list,
+    soonest stock-out first. Staff may filter with ?center_id=.
+    """
+    alerts_only = False
+
+    def list(self, request, *args, **kwargs):
+        forecast = forecast_stock(self.get_queryset())
+        if self.alerts_only:
+            alert_days = settings.FORECAST_ALERT_DAYS
+            forecast = [row for row in forecast if row['days_remaining'] is not None and row['days_remaining'] <= alert_days]
+        page = self.paginate_queryset(forecast)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(forecast)
+
+
+class InventoryForecastAlertsAPIView(InventoryForecastAPIView):
+    """API endpoint listing inventory forecast to run out within FORECAST_ALERT_DAYS."""
+    alerts_only = True
+
+
+class LowStockAlertListAPIView(generics.ListAPIView):
+    """
+    API endpoint listing inventory items currently at or below their reorder threshold.
+    Staff see every center (optionally ?center_id=); center admins see their own.
+    """
+    serializer_class = LowStockAlertSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        # Open alerts only: served by the partial index on (distribution_center, raised_at).
+        queryset = (
+            LowStockAlert.objects
+            .filter(resolved_at__isnull=True)
+            .select_related('inventory_item__product_type', 'distribution_center')
+            .order_by('distribution_center_id', '-raised_at')
+        )
+        user = self.request.user
+        if user.is_staff or user.is_superuser:
+            center_id = self.request.query_params.get('center_id')
+            if center_id and center_id.isdigit():
+                return queryset.filter(distribution_center_id=int(center_id))
+            return queryset
+
+        try:
+            user_profile = user.profile
+        except UserProfile.DoesNotExist:
+            raise PermissionDenied("User profile missing. Cannot view inventory.")
+
+        if user_profile.role == 'center_admin':
+            try:
+                managed_center = user_profile.managed_distribution_center
+            except DistributionCenter.DoesNotExist:
+                return LowStockAlert.objects.none()
+            return queryset.filter(distribution_center=managed_center)
+
+        print(f"User {user.username} with role '{user_profile.role}' is not authorized to view low-stock alerts.")
+        raise PermissionDenied("You do not have permission to view inventory.")
+
+
+class InventoryItemRetrieveUpdateAPIView(OptimisticConcurrencyMixin, SparseFieldsetMixin, generics.RetrieveUpdateAPIView):
     """API endpoint to retrieve or update the quantity of a specific inventory item."""
+    queryset = InventoryItem.objects.select_related('product_type', 'distribution_center')
     serializer_class = InventoryItemSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -321,7 +808,7 @@ class InventoryItemRetrieveUpdateAPIView(generics.RetrieveUpdateAPIView):
     def perform_update(self, serializer):
         # ... (keep the perform_update logic from previous versions) ...
         user = self.request.user
-        inventory_item = self.get_object()
+        inventory_item = serializer.instance
 
         user_role = None
         try: user_profile = user.profile; user_role = user_profile.role
@@ -330,7 +817,7 @@ class InventoryItemRetrieveUpdateAPIView(generics.RetrieveUpdateAPIView):
 
         if not (user.is_staff or user.is_superuser or user_role == 'system_admin'):
             is_center_admin_for_this_center = False
-            if user_role == 'center_admin' and instance.assigned_distribution_center:
+            if user_role == 'center_admin' and inventory_item.distribution_center:
                  try:
                       managed_center = user.profile.managed_distribution_center
                       if managed_center == inventory_item.distribution_center:
@@ -346,10 +833,12 @@ class InventoryItemRetrieveUpdateAPIView(generics.RetrieveUpdateAPIView):
              if serializer.validated_data['quantity'] < 0:
                   raise DRFValidationError({"quantity": "Quantity cannot be negative."})
              update_data['quantity'] = serializer.validated_data['quantity']
+        if 'reorder_threshold' in serializer.validated_data:
+             update_data['reorder_threshold'] = serializer.validated_data['reorder_threshold']
 
         if not update_data:
              print(f"User {user.username} sent update request for inventory item {inventory_item.id} but included no valid update fields.")
-             raise DRFValidationError("No valid fields provided for update (only 'quantity' is allowed).")
+             raise DRFValidationError("No valid fields provided for update (only 'quantity' and 'reorder_threshold' are allowed).")
 
         serializer.save(**update_data)
         print(f"Inventory item {inventory_item.id} quantity updated by user {user.username}. New quantity: {inventory_item.quantity}")
@@ -360,7 +849,62 @@ class InventoryItemRetrieveUpdateAPIView(generics.RetrieveUpdateAPIView):
 @require_POST
 def sms_webhook(request):
     # ... (keep sms_webhook logic) ...
+    throttle = PhoneNumberRateThrottle()
+    if not throttle.allow_request(request, None):
+        print(f"SMS Webhook throttled for sender {request.POST.get('From')}")
+        response = HttpResponse("Too many messages.", status=429)
+        response['Retry-After'] = str(throttle.wait())
+        return response
+
     print("SMS Webhook received!")
     print(f"From: {request.POST.get('From')}")
     print(f"Body: {request.POST.get('Body')}")
-    return HttpResponse("Webhook received.", status=200)
\ No newline at end of file
+    return HttpResponse("Webhook received.", status=200)
+
+
+# --- Throttle Metrics View ---
+class ThrottleStatsAPIView(APIView):
+    """API endpoint exposing allowed/throttled counters per throttle scope (staff only)."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        scopes = sorted(api_settings.DEFAULT_THROTTLE_RATES)
+        return Response(get_throttle_stats(RoleRateThrottle.cache, scopes))
+
+
+# --- Live Events View ---
+class EventStreamTicketAPIView(APIView):
+    """
+    API endpoint issuing a short-lived, single-use ticket for opening the live
+    event stream, `GET /api/events/?ticket=<ticket>`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        return Response({
+            'ticket': issue_stream_ticket(request.user),
+            'expires_in': settings.EVENT_STREAM_TICKET_SECONDS,
+        })
+
+
+# --- Audit Log View ---
+class AuditEventListAPIView(generics.ListAPIView):
+    """
+    API endpoint listing the change history of one entity, newest first (staff only).
+    Requires ?entity_type=<model name>&entity_id=<id>, e.g. entity_type=inventoryitem.
+    """
+    serializer_class = AuditEventSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_queryset(self):
+        entity_type = self.request.query_params.get('entity_type')
+        entity_id = self.request.query_params.get('entity_id')
+        if not entity_type or not entity_id or not entity_id.isdigit():
+            raise DRFValidationError("Both 'entity_type' and a numeric 'entity_id' query parameters are required.")
+        # Served by the (entity_type, entity_id, occurred_at) index.
+        return (
+            AuditEvent.objects
+            .filter(entity_type=entity_type.lower(), entity_id=int(entity_id))
+            .select_related('actor')
+            .order_by('-occurred_at', '-id')
+        )
@@ -2,15 +2,55 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests to /api/events/ (the live change event stream) are answered by
+api.streaming.EventStreamApp; everything else goes to the WSGI application
+(backend/wsgi.py), run on a fixed pool of WSGI_THREADS threads.
+
+Django's own ASGI handler runs each request's sync code on a thread of its
+own, so a persistent database connection would be left behind in an idle
+thread after every request. The long-lived pool threads keep theirs, as a
+threaded gunicorn worker would: DB_CONN_MAX_AGE and the per-connection
+SQLite pragmas apply exactly as under WSGI.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-from django.core.asgi import get_asgi_application
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from django.conf import settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+# Sets up Django, and starts the worker's duplicate index refresh.
+from backend.wsgi import application as wsgi_application  # noqa: E402
+
+# Imported after Django is set up, as it uses models.
+from api.streaming import EventStreamApp  # noqa: E402
+
+_run_wsgi_app = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """asgiref's WsgiToAsgi, but running the WSGI app on `executor`'s threads."""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        instance = WsgiToAsgiInstance(self.wsgi_application, self.duplicate_header_limit)
+        instance.run_wsgi_app = sync_to_async(
+            _run_wsgi_app.__get__(instance), thread_sensitive=False, executor=self.executor,
+        )
+        await instance(scope, receive, send)
+
+
+django_application = PooledWsgiToAsgi(
+    wsgi_application, ThreadPoolExecutor(settings.WSGI_THREADS, thread_name_prefix='wsgi'),
+)
+
+application = EventStreamApp(django_application)
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -69,6 +70,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware', # Outermost after security so it sees the final body
+    'api.middleware.ReplicaPinningMiddleware', # Must run before anything that queries the DB
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -78,6 +81,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'api.middleware.AuditContextMiddleware', # Lets audit events record the acting user
 ]
 
 # Optional: CORS settings
@@ -91,6 +95,7 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True # Needed if you use cookies or authentication headers (like your token)
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # --- CSRF Settings (Add/Update these) ---
 # Set CSRF cookie to be accessible by JavaScript
@@ -129,15 +134,231 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '600'))
+DB_CONN_HEALTH_CHECKS = os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+# Native connection pooling (Django 5.1+, PostgreSQL with psycopg 3 only).
+# Set DB_POOL=True to enable. Pooled connections replace persistent ones,
+# so CONN_MAX_AGE is forced to 0 when the pool is on.
+DB_POOL = os.environ.get('DB_POOL', 'False') == 'True'
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', '300'))
+
 DATABASES = {
     'default': dj_database_url.config(
         # Feel free to modify this default if you need to use a different database
         default=f"sqlite:///{os.path.join(BASE_DIR, 'db.sqlite3')}",
-        conn_max_age=600
+        conn_max_age=DB_CONN_MAX_AGE,
+        # Ping reused connections before handing them to a request so a
+        # connection dropped while the host idled is replaced, not raised.
+        conn_health_checks=DB_CONN_HEALTH_CHECKS,
+    )
+}
+
+# Optional read replica. When DATABASE_REPLICA_URL is set, api.routers sends
+# reads from safe-method requests here (see api.middleware.ReplicaPinningMiddleware).
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        DATABASE_REPLICA_URL,
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=DB_CONN_HEALTH_CHECKS,
     )
+    # Tests run against a single database; the replica mirrors it.
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+
+# Seconds a client keeps reading from the primary after a write, so it
+# always sees its own changes even while the replica is lagging.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '15'))
+
+# SQLite performance profile, applied by Django on every new connection.
+# WAL lets readers run alongside a writer, the busy timeout makes writers
+# wait for the lock instead of failing with "database is locked", and
+# BEGIN IMMEDIATE takes the write lock up front so a transaction never has
+# to upgrade a read lock mid-way (which SQLite cannot wait on).
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', '20'))  # seconds
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024)))  # bytes
+SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', '-32000'))  # negative = KiB
+
+for _db in DATABASES.values():
+    if DB_POOL and _db['ENGINE'] == 'django.db.backends.postgresql':
+        _db['CONN_MAX_AGE'] = 0
+        _db.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_idle': DB_POOL_MAX_IDLE,
+            # Django passes ConnectionPool.check_connection as the pool's
+            # check callback when CONN_HEALTH_CHECKS is on.
+        }
+    elif _db['ENGINE'] == 'django.db.backends.sqlite3':
+        _db.setdefault('OPTIONS', {}).update({
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+                f'PRAGMA cache_size={SQLITE_CACHE_SIZE};'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+        })
+
+
+# Response compression (api.middleware.CompressionMiddleware)
+# brotli and zstd are used when the `brotli` / `zstandard` packages are
+# installed and the client accepts them; gzip is always available.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))  # bytes
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4'))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get('COMPRESSION_ZSTD_LEVEL', '3'))
+
+
+# Stock forecasting (api/forecasting.py)
+FORECAST_WINDOW_DAYS = int(os.environ.get('FORECAST_WINDOW_DAYS', '28'))
+FORECAST_SMOOTHING = float(os.environ.get('FORECAST_SMOOTHING', '0.1'))  # per-day decay of older demand
+FORECAST_ALERT_DAYS = float(os.environ.get('FORECAST_ALERT_DAYS', '7'))  # alert when stock runs out sooner
+
+
+# /api/auth/user/ documents are cached per user (api/user_details.py); 0 disables.
+# Invalidation goes through the cache, so it is off by default unless REDIS_URL
+# shares the cache: with the per-process LocMemCache, an edit served by one
+# worker would leave the others serving the old document.
+USER_DETAILS_CACHE_SECONDS = int(os.environ.get(
+    'USER_DETAILS_CACHE_SECONDS', '300' if os.environ.get('REDIS_URL') else '0'
+))
+
+# Delta sync (?updated_since= on the request and inventory lists)
+# Cursors trail the current time by SYNC_CURSOR_LAG_SECONDS so rows written by
+# transactions still in flight are picked up on the next sync. Deletions are
+# read from the audit log, so keep archive_audit_events --days above the max age.
+SYNC_CURSOR_LAG_SECONDS = int(os.environ.get('SYNC_CURSOR_LAG_SECONDS', '5'))
+SYNC_CURSOR_MAX_AGE_DAYS = int(os.environ.get('SYNC_CURSOR_MAX_AGE_DAYS', '90'))
+SYNC_MAX_ROWS = int(os.environ.get('SYNC_MAX_ROWS', '500'))  # per delta, then has_more
+
+# Live change events (api/events.py, served at /api/events/ over ASGI)
+# LocalBroker only reaches clients connected to the same worker process;
+# point EVENT_BROKER at a shared broker when running several workers.
+EVENT_BROKER = os.environ.get('EVENT_BROKER', 'api.events.LocalBroker')
+EVENT_STREAM_HEARTBEAT_SECONDS = int(os.environ.get('EVENT_STREAM_HEARTBEAT_SECONDS', '15'))
+EVENT_STREAM_MAX_PENDING = int(os.environ.get('EVENT_STREAM_MAX_PENDING', '100'))  # per client, then resync
+EVENT_STREAM_RETRY_MS = int(os.environ.get('EVENT_STREAM_RETRY_MS', '5000'))  # client reconnect delay
+# Lifetime of the single-use ?ticket= from POST /api/events/ticket/.
+EVENT_STREAM_TICKET_SECONDS = int(os.environ.get('EVENT_STREAM_TICKET_SECONDS', '30'))
+# backend/asgi.py serves every other request through the WSGI app on this many
+# threads per worker process. Each thread keeps its own database connection
+# (DB_CONN_MAX_AGE), so size DB_POOL_MAX_SIZE and the server's limit to match.
+WSGI_THREADS = int(os.environ.get('WSGI_THREADS', '8'))
+
+# Duplicate request detection on create (api/duplicates.py)
+# A request repeating the same requester, product type and quantity within the
+# window is flagged for review ('flag'), refused with 409 ('reject') or let
+# through ('off'). Each worker builds its index at startup and rebuilds it in the
+# background every REFRESH seconds. SHARED also counts every worker's creates in
+# the cache, so a retry landing on another worker is caught before the next
+# rebuild; it needs REDIS_URL, as LocMemCache is per process.
+DUPLICATE_REQUEST_POLICY = os.environ.get('DUPLICATE_REQUEST_POLICY', 'flag')
+DUPLICATE_REQUEST_WINDOW_HOURS = int(os.environ.get('DUPLICATE_REQUEST_WINDOW_HOURS', '12'))
+DUPLICATE_INDEX_BUCKET_MINUTES = int(os.environ.get('DUPLICATE_INDEX_BUCKET_MINUTES', '60'))
+DUPLICATE_INDEX_REFRESH_SECONDS = int(os.environ.get('DUPLICATE_INDEX_REFRESH_SECONDS', '300'))
+DUPLICATE_INDEX_SHARED = os.environ.get(
+    'DUPLICATE_INDEX_SHARED', 'True' if os.environ.get('REDIS_URL') else 'False'
+) == 'True'
+
+# Fair-share allocation of short stock (api/allocation.py)
+# 'max_min' or 'proportional'. Weights set how much more a requester type gets
+# relative to the other when there is not enough for everyone.
+ALLOCATION_MODE = os.environ.get('ALLOCATION_MODE', 'max_min')
+ALLOCATION_WEIGHTS = {
+    'individual': float(os.environ.get('ALLOCATION_INDIVIDUAL_WEIGHT', '2')),
+    'organization': float(os.environ.get('ALLOCATION_ORGANIZATION_WEIGHT', '1')),
+}
+
+# Pickup slots and codes (api/pickups.py)
+# Slots are cut from each center's operating_hours, or PICKUP_DEFAULT_HOURS when
+# those can't be read, and booked no sooner than PICKUP_LEAD_MINUTES ahead.
+PICKUP_SLOT_MINUTES = int(os.environ.get('PICKUP_SLOT_MINUTES', '30'))
+PICKUP_LEAD_MINUTES = int(os.environ.get('PICKUP_LEAD_MINUTES', '60'))
+PICKUP_HORIZON_DAYS = int(os.environ.get('PICKUP_HORIZON_DAYS', '14'))
+PICKUP_CODE_LENGTH = int(os.environ.get('PICKUP_CODE_LENGTH', '6'))
+PICKUP_DEFAULT_HOURS = os.environ.get('PICKUP_DEFAULT_HOURS', 'Mon-Fri 9am-5pm')
+
+# Idempotency-Key support on the create endpoints (api/idempotency.py)
+# Responses are kept in the cache for the TTL; a duplicate sent while the first
+# request is still running waits up to IDEMPOTENCY_LOCK_SECONDS for it.
+# Responses carrying credentials (the sign-up token) are kept only briefly.
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', str(24 * 60 * 60)))
+IDEMPOTENCY_CREDENTIALS_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_CREDENTIALS_TTL_SECONDS', '60'))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '30'))
+
+# Background task queue (api/tasks.py, `manage.py run_workers`)
+# Failed tasks are retried after TASK_RETRY_BACKOFF_SECONDS, doubling up to the
+# max; a task Running for longer than TASK_LOCK_TIMEOUT_SECONDS is assumed to
+# have lost its worker and is queued again.
+TASK_WORKER_PROCESSES = int(os.environ.get('TASK_WORKER_PROCESSES', '1'))
+TASK_WORKER_THREADS = int(os.environ.get('TASK_WORKER_THREADS', '2'))
+TASK_BATCH_SIZE = int(os.environ.get('TASK_BATCH_SIZE', '10'))
+TASK_POLL_SECONDS = float(os.environ.get('TASK_POLL_SECONDS', '5'))
+TASK_MAX_ATTEMPTS = int(os.environ.get('TASK_MAX_ATTEMPTS', '5'))
+TASK_RETRY_BACKOFF_SECONDS = int(os.environ.get('TASK_RETRY_BACKOFF_SECONDS', '30'))
+TASK_RETRY_BACKOFF_MAX_SECONDS = int(os.environ.get('TASK_RETRY_BACKOFF_MAX_SECONDS', str(60 * 60)))
+TASK_LOCK_TIMEOUT_SECONDS = int(os.environ.get('TASK_LOCK_TIMEOUT_SECONDS', str(30 * 60)))
+TASK_KEEP_DAYS = int(os.environ.get('TASK_KEEP_DAYS', '14'))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Throttle counters live here. The default in-process cache is per worker;
+# set REDIS_URL (requires the `redis` package) to share state across workers.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Password hashing (api/hashers.py)
+# PASSWORD_HASHER picks the hasher for new passwords: 'pbkdf2' (Django's
+# default), 'scrypt' or 'argon2' (requires the `argon2-cffi` package). The
+# others stay listed, so existing hashes still verify and are upgraded at the
+# next login. Costs left unset keep Django's defaults; measure candidates with
+# `python manage.py benchmark_hashers` before changing them.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+_PASSWORD_HASHER_CLASSES = {
+    'pbkdf2': 'api.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'api.hashers.TunedScryptPasswordHasher',
+    'argon2': 'api.hashers.TunedArgon2PasswordHasher',
 }
+if PASSWORD_HASHER not in _PASSWORD_HASHER_CLASSES:
+    raise ValueError(f"PASSWORD_HASHER must be one of {sorted(_PASSWORD_HASHER_CLASSES)}, not {PASSWORD_HASHER!r}.")
+PASSWORD_HASHERS = [_PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+
+def _optional_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
 
 
+PASSWORD_PBKDF2_ITERATIONS = _optional_int('PASSWORD_PBKDF2_ITERATIONS')
+PASSWORD_SCRYPT_WORK_FACTOR = _optional_int('PASSWORD_SCRYPT_WORK_FACTOR')  # a power of 2
+PASSWORD_ARGON2_TIME_COST = _optional_int('PASSWORD_ARGON2_TIME_COST')
+PASSWORD_ARGON2_MEMORY_COST = _optional_int('PASSWORD_ARGON2_MEMORY_COST')  # KiB
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -188,8 +409,24 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer', # orjson when installed, stock JSONRenderer otherwise
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # Rates for the sliding-window throttles in api/throttling.py.
+    # Role scopes match USER_ROLE_CHOICES; 'anon' is keyed by client IP.
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '60/min',
+        'individual': '30/min',
+        'organization_admin': '120/min',
+        'donor': '60/min',
+        'center_admin': '240/min',
+        'staff': '600/min',
+        'token': '300/min',
+        'sms_phone': '5/min',
+    },
 }
 
 # --- dj-rest-auth & allauth Settings ---
@@ -0,0 +1,13 @@
+"""
+Settings for the test suite. manage.py uses them for `python manage.py test`
+unless DJANGO_SETTINGS_MODULE says otherwise.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+# The tests race threads against the database (api/tests.py). The default
+# in-memory SQLite test database fails a contended lock at once ("table is
+# locked") instead of waiting, so use a file.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('TEST', {}).setdefault('NAME', str(BASE_DIR / 'test_db.sqlite3'))
@@ -4,7 +4,7 @@ from django.contrib import admin
 from django.urls import path, include
 
 # Import your custom registration view
-from api.views import CustomRegisterView # <-- IMPORT YOUR CUSTOM VIEW
+from api.views import CustomRegisterView, CustomUserDetailsView # <-- IMPORT YOUR CUSTOM VIEW
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -12,6 +12,10 @@ urlpatterns = [
     # Include your app's API urls under the '/api/' prefix
     path('api/', include('api.urls')),
 
+    # Current user details: one query, cached per user. Listed before the
+    # dj-rest-auth include so it takes precedence over its user/ route.
+    path('api/auth/user/', CustomUserDetailsView.as_view(), name='rest_user_details'),
+
     # Include dj-rest-auth URLs for login, logout, password reset, etc.
     # These are fine as they are, they don't call the problematic serializer.save(self.request)
     # like the default registration view does.
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Imported after Django is set up, as it uses models.
+from api.duplicates import start_index_refresh  # noqa: E402
+
+start_index_refresh()
@@ -114,6 +114,38 @@ export const getProductTypes = async () => {
   }
 };
 
+// --- Donations ---
+// pledges: [{ product_type, distribution_center, quantity, note }]
+export const pledgeDonations = async (pledges) => {
+  try {
+    const response = await apiClient.post('/donations/', { pledges });
+    return response.data;
+  } catch (error) {
+    console.error('Pledge donations error:', error);
+    throw error;
+  }
+};
+
+export const getDonations = async () => {
+  try {
+    const response = await apiClient.get('/donations/');
+    return response.data;
+  } catch (error) {
+    console.error('Get donations error:', error);
+    throw error;
+  }
+};
+
+export const getDonationSummary = async () => {
+  try {
+    const response = await apiClient.get('/donations/summary/');
+    return response.data;
+  } catch (error) {
+    console.error('Get donation summary error:', error);
+    throw error;
+  }
+};
+
 // --- Add other API functions as needed ---
 // e.g., getRequests, getInventory, updateInventory, etc.
 
@@ -0,0 +1,65 @@
+import argparse
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Sign-up throughput load test: POSTs --users registrations to
+# /api/auth/registration/ from --concurrency threads and reports sign-ups per
+# second and latency. Point it at a local or staging server, never production:
+# the users it creates (named loadtest-<run>-<n>) are left in place. Remove them with
+#   python manage.py shell -c "from django.contrib.auth.models import User; User.objects.filter(username__startswith='loadtest-').delete()"
+
+
+def sign_up(session, base_url, username):
+    password = f"Lt-{uuid.uuid4().hex}"
+    start_time = time.perf_counter()
+    try:
+        response = session.post(
+            f"{base_url}/api/auth/registration/",
+            json={
+                "username": username,
+                "email": f"{username}@example.com",
+                "password": password,
+                "password2": password,
+            },
+            timeout=60,
+        )
+        status = response.status_code
+    except requests.exceptions.RequestException as e:
+        status = type(e).__name__
+    return status, time.perf_counter() - start_time
+
+
+def run(base_url, users, concurrency):
+    run_id = uuid.uuid4().hex[:8]
+    print(f"Registering {users} users against {base_url} with {concurrency} concurrent clients (run {run_id})...")
+    sessions = [requests.Session() for _ in range(concurrency)]
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(
+            lambda n: sign_up(sessions[n % concurrency], base_url, f"loadtest-{run_id}-{n}"),
+            range(users),
+        ))
+    duration = time.perf_counter() - start_time
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(latency * 1000 for status, latency in results if status == 201)
+    print(f"Statuses: {statuses}")
+    print(f"Time: {duration:.2f} seconds, {statuses.get(201, 0) / duration:.1f} sign-ups/s")
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"Latency: median {statistics.median(latencies):.0f} ms, p95 {p95:.0f} ms, max {latencies[-1]:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sign-up throughput load test.")
+    parser.add_argument("base_url", nargs="?", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    run(args.base_url.rstrip("/"), args.users, args.concurrency)